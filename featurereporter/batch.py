@@ -0,0 +1,124 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Union
+
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+from .plantuml import PlantUmlRenderer
+from .reportgenerator import ExportUtilities
+
+log = logging.getLogger(__name__)
+
+JOB_KEYS = {"repository", "title", "tag", "forewords", "execution", "output", "include_tags",
+            "inline_results", "history", "max_table_rows", "compression", "diagram_timeout",
+            "feature_timeout", "deadline", "force", "calibrate", "traceability", "traceability_csv",
+            "prefetch_depth"}
+
+
+def check_job(job: dict, name: str = "Job") -> dict:
+    """Raise a ValueError if the job is not valid, return it otherwise"""
+    unknown = set(job) - JOB_KEYS
+    if unknown:
+        raise ValueError(f"{name} has unknown keys {sorted(unknown)}")
+    if not job.get("repository"):
+        raise ValueError(f"{name} has no repository")
+    return job
+
+
+def load_batch(config_file: str) -> dict:
+    """
+    Read a batch configuration file.
+
+    The file holds an optional 'workers' count, an optional [defaults] table and
+    a [[job]] table per document. A job accepts the keys repository (mandatory), title, tag,
+    forewords, execution, output (a file or a list of files), include_tags, inline_results,
+    history, max_table_rows, compression, diagram_timeout, feature_timeout, deadline, force,
+    calibrate, traceability, traceability_csv and prefetch_depth.
+    :param config_file: the toml file
+    :return: a dict with the workers count and the jobs list (defaults applied)
+    """
+    if tomllib is None:
+        raise ImportError("Reading the batch file needs Python 3.11 or the 'tomli' package")
+    with open(config_file, "rb") as config_stream:
+        config = tomllib.load(config_stream)
+    defaults = config.get("defaults", {})
+    jobs = []
+    for index, job in enumerate(config.get("job", [])):
+        jobs.append(check_job({**defaults, **job}, f"Job {index}"))
+    return {"workers": config.get("workers"), "jobs": jobs}
+
+
+# Job keys set on the ExportUtilities property when not empty
+_JOB_TEXTS = {"title": "report_title", "tag": "us_tag", "forewords": "forewords_folder",
+              "history": "history", "traceability_csv": "traceability_csv"}
+# Job keys set on the ExportUtilities property of the same name when given
+_JOB_NUMBERS = ("max_table_rows", "compression", "diagram_timeout", "feature_timeout",
+                "deadline", "prefetch_depth")
+_JOB_FLAGS = ("inline_results", "force", "calibrate", "traceability")
+
+
+def create_reporter(job: dict, renderer: PlantUmlRenderer = None) -> ExportUtilities:
+    """Configure an ExportUtilities for the job"""
+    report = ExportUtilities(renderer=renderer)
+    report.feature_repository = job["repository"]
+    for key, attribute in _JOB_TEXTS.items():
+        if job.get(key):
+            setattr(report, attribute, job[key])
+    for key in _JOB_NUMBERS:
+        if job.get(key) is not None:
+            setattr(report, key, job[key])
+    for key in _JOB_FLAGS:
+        setattr(report, key, job.get(key, False))
+    if job.get("include_tags"):
+        include_tags = job["include_tags"]
+        report.include_tags = [include_tags] if isinstance(include_tags, str) else include_tags
+    return report
+
+
+def job_parameters(job: dict) -> dict:
+    """Return the create_application_documentation parameters of the job"""
+    parameters = {}
+    if job.get("execution"):
+        parameters["report_file"] = job["execution"]
+    if job.get("output"):
+        parameters["output_file_name"] = job["output"]
+    return parameters
+
+
+def run_batch(jobs: List[dict],
+              workers: Union[int, None] = None,
+              renderer: PlantUmlRenderer = None) -> List[Tuple[dict, Union[Exception, None]]]:
+    """
+    Generate the documents of the jobs in a thread pool.
+    All the jobs share one diagram renderer, so the JRE is probed once and a diagram
+    referenced by several jobs is rendered once.
+    :param jobs: the jobs as returned by load_batch
+    :param workers: the pool size, Python's default when None
+    :param renderer: the shared renderer, a new one when None
+    :return: each job with the exception which stopped it (or reports its failed features)
+        or None
+    """
+    renderer = renderer or PlantUmlRenderer()
+
+    def run_job(job: dict) -> Union[Exception, None]:
+        try:
+            log.info(f"Start job for {job['repository']}")
+            reporter = create_reporter(job, renderer)
+            reporter.create_application_documentation(**job_parameters(job))
+            if reporter.errors:
+                raise RuntimeError(f"{reporter.errors} features failed, see the document end")
+            return None
+        except Exception as exception:
+            log.error(f"Job for {job['repository']} failed: {exception}")
+            return exception
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(zip(jobs, executor.map(run_job, jobs)))
@@ -12,14 +12,39 @@ from csv import DictWriter
 log = logging.getLogger(__name__)
 
 
+# The formatters run for each step: the conversion table and the patterns are built once
+_STATUS_NAMES = {Status.failed: "failed",
+                 Status.executing: "executing",
+                 Status.passed: "passed",
+                 Status.skipped: "skipped",
+                 Status.undefined: "undefined",
+                 Status.untested: "untested"}
+_UNDEFINED = _STATUS_NAMES[Status.undefined]
+_OUTLINE_NAME = re.compile(r'(?P<name>.*) -- @(?P<order>\d+\.\d+) (?P<subname>.*)')
+
+
 def _status_converter(status: Status) -> str:
-    converter = {f"{Status.failed}": "failed",
-                 f"{Status.executing}": "executing",
-                 f"{Status.passed}": "passed",
-                 f"{Status.skipped}": "skipped",
-                 f"{Status.undefined}": "undefined",
-                 f"{Status.untested}": "untested"}
-    return converter[str(status)]
+    return _STATUS_NAMES.get(status) or status.name
+
+
+def _tag_value(tags, prefix: str):
+    """Return the first tag containing the prefix without the prefix, None otherwise"""
+    for tag in tags:
+        if prefix in tag:
+            return tag.replace(prefix, "")
+    return None
+
+
+def _step_content(step) -> str:
+    """Return the step line followed by its table rows, if any"""
+    content = f"{step.keyword} {step.name}"
+    if step.table is None:
+        return content
+    # One join instead of a copy of the whole content per row
+    return "".join([content,
+                    f" \n |{'|'.join(step.table.headings)}|",
+                    *(f" \n  |{'|'.join(row)} |" for row in step.table.rows)])
+
 
 class EaiCsv(Formatter):
     name = "eaicsv"
@@ -52,45 +77,36 @@ class EaiCsv(Formatter):
 
     def feature(self, feature):
         self.__current_feature = feature.name
-        for tag in feature.tags:
-            self.__current_epic = None
-            if self.__epic in tag:
-                self.__current_epic = tag.replace(self.__epic, "")
-                break
+        self.__current_epic = _tag_value(feature.tags, self.__epic)
 
     def scenario(self, scenario):
         if self.__current_status is not None:
             self.add_result()
-        self.__current_status = _status_converter(Status.undefined)
+        self.__current_status = _UNDEFINED
         if "Outline" not in scenario.keyword:
             self.__current_scenario_name = scenario.name
             self.__outline_order = None
         else:
-            match = re.match(r'(?P<name>.*) -- @(?P<order>\d+\.\d+) (?P<subname>.*)',
-                             scenario.name)
+            match = _OUTLINE_NAME.match(scenario.name)
             self.__current_scenario_name = f'{match["name"]}-{match["subname"]}'
             self.__outline_order = match["order"]
-        for tag in scenario.tags:
-            self.__current_scenario_id = None
-            if self.__scenario_id in tag:
-                self.__current_scenario_id = tag.replace(self.__scenario_id, "")
-                if self.__outline_order is not None:
-                    self.__current_scenario_id = (f"{self.__current_scenario_id}-"
-                                                  f"{self.__outline_order}")
-                break
+        self.__current_scenario_id = _tag_value(scenario.tags, self.__scenario_id)
+        if self.__current_scenario_id is not None and self.__outline_order is not None:
+            self.__current_scenario_id = f"{self.__current_scenario_id}-{self.__outline_order}"
 
     def add_result(self):
-        log.info(f"Add scenario {self.__current_scenario_id} to result")
-        self.__result.append({"epic": self.__current_epic,
-                              "feature_name": self.__current_feature,
-                              "scenario_id": self.__current_scenario_id,
-                              "scenario_name": self.__current_scenario_name,
-                              "status": self.__current_status,
-                              "order": self.__outline_order})
+        log.debug("Add scenario %s to result", self.__current_scenario_id)
+        # Tuples are smaller than dicts, the rows are named on close
+        self.__result.append((self.__current_epic,
+                              self.__current_feature,
+                              self.__current_scenario_id,
+                              self.__current_scenario_name,
+                              self.__current_status,
+                              self.__outline_order))
         self.__current_status = None
 
     def result(self, step):
-        self.__current_status = _status_converter(step.status)
+        self.__current_status = _STATUS_NAMES.get(step.status) or step.status.name
 
     def eof(self):
         self.add_result()
@@ -103,14 +119,13 @@ class EaiCsv(Formatter):
 
     def close(self):
         self.stream.reconfigure(newline="", encoding="utf-8")
-        writer = DictWriter(self.stream, ["epic",
-                                          "feature_name",
-                                          "scenario_id",
-                                          "scenario_name",
-                                          "status",
-                                          "order"],
-                            quoting=csv.QUOTE_ALL)
-        writer.writeheader()
+        writer = csv.writer(self.stream, quoting=csv.QUOTE_ALL)
+        writer.writerow(["epic",
+                         "feature_name",
+                         "scenario_id",
+                         "scenario_name",
+                         "status",
+                         "order"])
         writer.writerows(self.__result)
         self.close_stream()
 
@@ -152,11 +167,7 @@ class EaiCsvFull(Formatter):
 
     def feature(self, feature):
         self.__current_feature = feature.name
-        for tag in feature.tags:
-            self.__current_epic = None
-            if self.__epic in tag:
-                self.__current_epic = tag.replace(self.__epic, "")
-                break
+        self.__current_epic = _tag_value(feature.tags, self.__epic)
         filename = str(Path(feature.filename).resolve().absolute())
         filename = filename.replace(self.__base_dir, "")
         self.__current_feature_model = FeatureModel(feature.name,
@@ -170,20 +181,15 @@ class EaiCsvFull(Formatter):
     def scenario(self, scenario):
         if self.__current_status is not None:
             self.add_result()
-        self.__current_status = _status_converter(Status.undefined)
+        self.__current_status = _UNDEFINED
         if "Outline" not in scenario.keyword:
             self.__current_scenario_name = scenario.name
             self.__outline_order = None
         else:
-            match = re.match(r'(?P<name>.*) -- @(?P<order>\d+\.\d+) (?P<subname>.*)',
-                             scenario.name)
+            match = _OUTLINE_NAME.match(scenario.name)
             self.__current_scenario_name = f'{match["name"]}-{match["subname"]}'
             self.__outline_order = match["order"]
-        for tag in scenario.tags:
-            self.__current_scenario_id = None
-            if self.__scenario_id in tag:
-                self.__current_scenario_id = tag.replace(self.__scenario_id, "")
-                break
+        self.__current_scenario_id = _tag_value(scenario.tags, self.__scenario_id)
         if self.__outline_order:
             self.__current_scenario_model = ScenarioModel(
                 f"{self.__current_scenario_id}-{self.__outline_order}",
@@ -203,22 +209,16 @@ class EaiCsvFull(Formatter):
                 False)
 
     def add_result(self):
-        log.info(f"Add scenario {self.__current_scenario_id} to result")
+        log.debug("Add scenario %s to result", self.__current_scenario_id)
         if self.__current_scenario_model is not None:
             self.__result.append(self.__current_scenario_model.to_dict())
         self.__current_status = None
 
     def step(self, step):
-        content = f"{step.keyword} {step.name}"
-        if step.table is not None:
-            content = f"{content} \n |{'|'.join(step.table.headings)}|"
-            for row in step.table.rows:
-                content = f"{content} \n  |{'|'.join(row)} |"
-            
-        self.__current_scenario_model.steps = content
+        self.__current_scenario_model.steps = _step_content(step)
 
     def result(self, step):
-        self.__current_status = _status_converter(step.status)
+        self.__current_status = _STATUS_NAMES.get(step.status) or step.status.name
 
     def eof(self):
         self.add_result()
@@ -0,0 +1,184 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Iterable, List, Union
+
+from .fileutils import atomic_write_json
+
+log = logging.getLogger(__name__)
+
+IGNORE_FILE = ".featurereporterignore"
+# Hidden entries, as skipped by the former glob discovery (.git, .hg, .svn, .venv...),
+# and virtual environments
+DEFAULT_IGNORES = [".*", "venv/"]
+
+
+class IgnoreRules:
+    """
+    Gitignore-like ignore rules.
+
+    - blank lines and lines starting with '#' are skipped,
+    - a trailing '/' only matches directories,
+    - a pattern containing a '/' matches the path relative to the repository,
+      otherwise it matches the entry name,
+    - a leading '!' re-includes a previously ignored entry, the last matching rule wins.
+    """
+
+    def __init__(self, patterns: Iterable[str] = ()):
+        self.__rules = []
+        self.__patterns = []
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith("#"):
+                continue
+            self.__patterns.append(pattern)
+            negated = pattern.startswith("!")
+            pattern = pattern.lstrip("!")
+            directory_only = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+            anchored = "/" in pattern
+            self.__rules.append((negated, directory_only, anchored, pattern.lstrip("/")))
+
+    @classmethod
+    def from_repository(cls, repository: Union[str, Path]) -> "IgnoreRules":
+        """Default rules followed by the repository ignore file rules"""
+        patterns = list(DEFAULT_IGNORES)
+        ignore_file = Path(repository) / IGNORE_FILE
+        if ignore_file.is_file():
+            with open(ignore_file, encoding="utf-8") as rules:
+                patterns.extend(rules.read().splitlines())
+        return cls(patterns)
+
+    @property
+    def signature(self) -> str:
+        return hashlib.sha1("\n".join(self.__patterns).encode("utf-8")).hexdigest()
+
+    def ignored(self, relative_path: str, is_dir: bool) -> bool:
+        ignored = False
+        name = relative_path.rsplit("/", 1)[-1]
+        for negated, directory_only, anchored, pattern in self.__rules:
+            if directory_only and not is_dir:
+                continue
+            if anchored:
+                # As in git, a '*' does not match a '/': the paths have as many parts
+                matched = (relative_path.count("/") == pattern.count("/")
+                           and fnmatch.fnmatchcase(relative_path, pattern))
+            else:
+                matched = fnmatch.fnmatchcase(name, pattern)
+            if matched:
+                ignored = not negated
+        return ignored
+
+
+class FeatureDiscovery:
+    """
+    Discover the feature files of a repository with os.scandir.
+
+    Ignored directories are pruned before being read and the result is sorted by relative path.
+    Symbolic links to directories are followed, a directory reached twice (link cycle or
+    several links to it) is read once.
+    A manifest of the visited directories and discovered files (size and modification time)
+    confirms an unchanged tree without listing the directories again.
+    """
+
+    def __init__(self, repository: Union[str, Path],
+                 manifest_file: Union[str, Path, None] = None,
+                 extension: str = ".feature"):
+        self.__repository = str(repository)
+        self.__manifest_file = manifest_file
+        self.__extension = extension
+        self.__rules = IgnoreRules.from_repository(repository)
+        self.__manifest = None
+        self.from_manifest = False
+
+    @property
+    def manifest(self) -> Union[dict, None]:
+        """The manifest of the last discovery"""
+        return self.__manifest
+
+    def discover(self) -> List[str]:
+        """Return the feature file paths, prefixed by the repository as given"""
+        manifest = self.__load_manifest()
+        self.from_manifest = manifest is not None and self.__is_unchanged(manifest)
+        if not self.from_manifest:
+            manifest = self.__walk()
+            self.__save_manifest(manifest)
+        self.__manifest = manifest
+        return [f"{self.__repository}/{relative}" for relative, _, _ in manifest["files"]]
+
+    def __walk(self) -> dict:
+        directories = {}
+        files = []
+        visited = set()
+        pending = [""]
+        while pending:
+            relative_dir = pending.pop()
+            absolute_dir = os.path.join(self.__repository, relative_dir)
+            dir_stat = os.stat(absolute_dir)
+            # A directory linked several times, or a link cycle, is read once
+            if (dir_stat.st_dev, dir_stat.st_ino) in visited:
+                log.debug(f"{relative_dir} already discovered through another path")
+                continue
+            visited.add((dir_stat.st_dev, dir_stat.st_ino))
+            directories[relative_dir] = dir_stat.st_mtime_ns
+            # Folders are walked in alphabetical order, so a linked folder is always
+            # discovered under the same path
+            sub_dirs = []
+            with os.scandir(absolute_dir) as entries:
+                for entry in sorted(entries, key=lambda item: item.name):
+                    relative = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+                    if entry.is_dir():
+                        if not self.__rules.ignored(relative, True):
+                            sub_dirs.append(relative)
+                    elif (entry.name.endswith(self.__extension)
+                          and not self.__rules.ignored(relative, False)):
+                        try:
+                            stat = entry.stat()
+                        except FileNotFoundError:
+                            log.warning(f"{relative} is a broken link, it is skipped")
+                            continue
+                        files.append([relative, stat.st_size, stat.st_mtime_ns])
+            pending.extend(reversed(sub_dirs))
+        files.sort(key=lambda item: item[0])
+        log.info(f"Discovered {len(files)} files in {len(directories)} folders")
+        return {"repository": os.path.abspath(self.__repository),
+                "rules": self.__rules.signature,
+                "directories": directories,
+                "files": files}
+
+    def __is_unchanged(self, manifest: dict) -> bool:
+        if (manifest.get("repository") != os.path.abspath(self.__repository)
+                or manifest.get("rules") != self.__rules.signature):
+            return False
+        try:
+            for relative_dir, mtime_ns in manifest["directories"].items():
+                if os.stat(os.path.join(self.__repository, relative_dir)).st_mtime_ns != mtime_ns:
+                    return False
+            for relative, size, mtime_ns in manifest["files"]:
+                stat = os.stat(os.path.join(self.__repository, relative))
+                if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+                    return False
+        except OSError:
+            return False
+        log.info("Feature repository unchanged since the last manifest")
+        return True
+
+    def __load_manifest(self) -> Union[dict, None]:
+        if self.__manifest_file is None or not Path(self.__manifest_file).is_file():
+            return None
+        try:
+            with open(self.__manifest_file, encoding="utf-8") as manifest:
+                return json.load(manifest)
+        except (OSError, ValueError) as exception:
+            log.warning(f"Manifest {self.__manifest_file} is discarded: {exception}")
+            return None
+
+    def __save_manifest(self, manifest: dict):
+        if self.__manifest_file is None:
+            return
+        atomic_write_json(self.__manifest_file, manifest)
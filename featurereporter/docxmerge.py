@@ -0,0 +1,96 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+import logging
+from copy import deepcopy
+from io import BytesIO
+from pathlib import Path
+from typing import List, Union
+
+from docx import Document
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml.ns import qn
+
+from .docxsave import save_document
+
+log = logging.getLogger(__name__)
+
+_RELATIONSHIP_NAMESPACE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+
+def _merge_styles(target, source) -> int:
+    """Copy the source styles missing in the target, return the number of copied styles"""
+    known = {style.get(qn("w:styleId")) for style in target.styles.element.findall(qn("w:style"))}
+    copied = 0
+    for style in source.styles.element.findall(qn("w:style")):
+        if style.get(qn("w:styleId")) not in known:
+            target.styles.element.append(deepcopy(style))
+            copied += 1
+    return copied
+
+
+def _relink(element, source_part, target_part, relationships: dict):
+    """
+    Point the relationship references of a copied element to the target part.
+    Pictures are added through python-docx, which shares identical pictures (same SHA1)
+    between all the merged partials. External links are related again.
+    """
+    for node in element.iter():
+        for attribute, value in node.attrib.items():
+            if not attribute.startswith(f"{{{_RELATIONSHIP_NAMESPACE}}}"):
+                continue
+            if value not in relationships:
+                relationship = source_part.rels.get(value)
+                if relationship is None:
+                    continue
+                if relationship.is_external:
+                    relationships[value] = target_part.relate_to(relationship.target_ref,
+                                                                 relationship.reltype,
+                                                                 is_external=True)
+                elif relationship.reltype == RT.IMAGE:
+                    relationships[value], _ = target_part.get_or_add_image(
+                        BytesIO(relationship.target_part.blob))
+                else:
+                    log.warning(f"Relationship {relationship.reltype} is not merged")
+                    relationships[value] = None
+            if relationships[value] is not None:
+                node.set(attribute, relationships[value])
+
+
+def merge_documents(partials: List[Union[str, Path]], output: Union[str, Path]) -> int:
+    """
+    Concatenate the bodies of partial documents (e.g. the shards of a generation) into one.
+    The first partial provides the page setup, the partials are read one at a time.
+    :param partials: the partial documents, in the document order
+    :param output: the merged document
+    :return: the number of merged partials
+    """
+    if not partials:
+        raise ValueError("No partial document to merge")
+    merged = Document(partials[0])
+    body = merged.element.body
+    # The final section properties stay the last body element
+    section = body.find(qn("w:sectPr"))
+    # Drawing ids must stay unique in the merged document
+    drawing_id = merged.part.next_id
+    for partial in partials[1:]:
+        log.info(f"Merge {partial}")
+        source = Document(partial)
+        copied_styles = _merge_styles(merged, source)
+        relationships = {}
+        for element in source.element.body:
+            if element.tag == qn("w:sectPr"):
+                continue
+            element = deepcopy(element)
+            _relink(element, source.part, merged.part, relationships)
+            for drawing in element.iter(qn("wp:docPr")):
+                drawing.set("id", str(drawing_id))
+                drawing_id += 1
+            if section is not None:
+                section.addprevious(element)
+            else:
+                body.append(element)
+        log.info(f"{partial} merged with {copied_styles} new styles "
+                 f"and {len(relationships)} relationships")
+        del source
+    save_document(merged, output)
+    return len(partials)
@@ -0,0 +1,68 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+import logging
+from pathlib import Path
+from typing import IO, Union
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+
+from docx.opc.pkgwriter import PackageWriter
+
+from .fileutils import atomic_output
+
+log = logging.getLogger(__name__)
+
+# Parts already compressed: deflating them again costs time for (almost) no gain
+STORED_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif")
+
+
+class _PackageZipWriter:
+    """python-docx physical package writer (write and close) with a configurable compression"""
+
+    def __init__(self, stream: IO[bytes], compression: Union[int, None]):
+        self.__compression = compression
+        self.__zip = ZipFile(stream, "w",
+                             compression=ZIP_STORED if compression == 0 else ZIP_DEFLATED,
+                             compresslevel=compression or None)
+
+    def write(self, pack_uri, blob):
+        member = pack_uri.membername
+        stored = self.__compression == 0 or member.lower().endswith(STORED_EXTENSIONS)
+        self.__zip.writestr(member, blob, compress_type=ZIP_STORED if stored else ZIP_DEFLATED)
+
+    def close(self):
+        self.__zip.close()
+
+
+def write_package(document, stream: IO[bytes], compression: Union[int, None] = None):
+    """
+    Write the document package in a binary stream, which may be unseekable (e.g. a pipe).
+    :param document: the python-docx document
+    :param stream: the binary file-like object
+    :param compression: 0 to store every part, 1 (fast) to 9 (small) to deflate them,
+        None for the zlib default level. Pictures are always stored.
+    """
+    package = document.part.package
+    parts = list(package.iter_parts())
+    for part in parts:
+        part.before_marshal()
+    writer = _PackageZipWriter(stream, compression)
+    # Same parts order as python-docx PackageWriter.write. These helpers are internal:
+    # setup.py pins the python-docx versions they are known in.
+    PackageWriter._write_content_types_stream(writer, parts)
+    PackageWriter._write_pkg_rels(writer, package.rels)
+    PackageWriter._write_parts(writer, parts)
+    writer.close()
+
+
+def save_document(document, target: Union[str, Path, IO[bytes]],
+                  compression: Union[int, None] = None):
+    """
+    Save the document in a file or a binary file-like object.
+    A file is replaced atomically: readers never see a half-written document.
+    """
+    if isinstance(target, (str, Path)):
+        with atomic_output(target) as stream:
+            write_package(document, stream, compression)
+    else:
+        write_package(document, target, compression)
+        target.flush()
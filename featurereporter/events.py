@@ -0,0 +1,113 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Optional, TextIO
+
+log = logging.getLogger(__name__)
+
+
+class Event:
+    """
+    A generation event: its name, its creation time, its payload and,
+    for the end of a stage, the stage duration in seconds.
+    """
+    __slots__ = ("name", "timestamp", "data", "duration")
+
+    def __init__(self, name: str, duration: Optional[float] = None, **data):
+        self.name = name
+        self.timestamp = time.time()
+        self.duration = duration
+        self.data = data
+
+    def to_dict(self) -> dict:
+        return {"name": self.name,
+                "timestamp": self.timestamp,
+                "duration": self.duration,
+                **self.data}
+
+    def __repr__(self):
+        return f"Event({self.name!r}, {self.data!r}, duration={self.duration!r})"
+
+
+class EventEmitter:
+    """
+    Dispatch events to the subscribed listeners, in the emitter thread.
+
+    Emitting costs a single test when nobody listens: the payload is passed as-is
+    (no formatting) and stage timing is skipped.
+    Listeners may be subscribed from any thread: the list is replaced, never modified,
+    so emit iterates a consistent snapshot without locking.
+    """
+
+    def __init__(self):
+        self.__listeners: List[Callable[[Event], None]] = []
+        self.__guard = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        """True if at least one listener is subscribed"""
+        return bool(self.__listeners)
+
+    def subscribe(self, listener: Callable[[Event], None]):
+        with self.__guard:
+            self.__listeners = self.__listeners + [listener]
+
+    def unsubscribe(self, listener: Callable[[Event], None]):
+        with self.__guard:
+            listeners = list(self.__listeners)
+            if listener in listeners:
+                listeners.remove(listener)
+            self.__listeners = listeners
+
+    def emit(self, name: str, duration: Optional[float] = None, **data):
+        listeners = self.__listeners
+        if not listeners:
+            return
+        event = Event(name, duration, **data)
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception as exception:
+                # A listener must not break the generation
+                log.error(f"Listener {listener} failed on {event}: {exception}")
+
+    @contextmanager
+    def stage(self, name: str, **data):
+        """
+        Emit '<name>_started' then '<name>_finished' with the stage duration.
+        The yielded dict collects counts added to the finished event payload.
+        """
+        counts = {}
+        if not self.__listeners:
+            yield counts
+            return
+        self.emit(f"{name}_started", **data)
+        start = time.perf_counter()
+        try:
+            yield counts
+        except BaseException as exception:
+            counts["error"] = exception
+            raise
+        finally:
+            self.emit(f"{name}_finished", time.perf_counter() - start, **{**data, **counts})
+
+
+class JsonLinesListener:
+    """
+    Write each event as a json line, e.g. for build telemetry.
+    It may be shared by generations running in several threads: a line is written at once.
+    """
+
+    def __init__(self, stream: TextIO):
+        self.__stream = stream
+        self.__guard = threading.Lock()
+
+    def __call__(self, event: Event):
+        line = f"{json.dumps(event.to_dict(), default=str)}\n"
+        with self.__guard:
+            self.__stream.write(line)
+            self.__stream.flush()
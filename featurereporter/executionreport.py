@@ -0,0 +1,134 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+import bz2
+import gzip
+import logging
+import lzma
+import mmap
+import os
+import re
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+FEATURE = "feature"
+SCENARIO = "scenario"
+PASSED = "passed"
+FAILED = "failed"
+SKIPPED = "skipped"
+OTHER = "other"
+
+_FEATURE_LINE = re.compile("Feature.*")
+_SCENARIO_LINE = re.compile(r"\s*Scenario.*")
+_PASSED_LINE = re.compile(".*passed.*")
+_FAILED_LINE = re.compile(".*failed.*")
+# Compressed reports are decoded as a stream
+_DECOMPRESSORS = {".gz": gzip.open,
+                  ".xz": lzma.open,
+                  ".bz2": bz2.open}
+
+
+class ScenarioResult(NamedTuple):
+    feature: str
+    scenario: Optional[str]
+    status: str
+
+
+def _mapped_lines(report: mmap.mmap) -> Iterator[str]:
+    for line in iter(report.readline, b""):
+        yield line.decode("utf-8", errors="replace")
+
+
+@contextmanager
+def open_report(file_path: str) -> Iterator[Iterator[str]]:
+    """
+    Open a behave plain report and yield an iterator of its lines.
+
+    .gz, .xz and .bz2 reports are decompressed on the fly, other reports are memory-mapped:
+    the memory use doesn't depend on the report size.
+    :param file_path: the report file
+    """
+    decompressor = _DECOMPRESSORS.get(os.path.splitext(file_path)[1].lower())
+    if decompressor is not None:
+        with decompressor(file_path, "rt", encoding="utf-8", errors="replace") as report:
+            yield report
+        return
+    with open(file_path, "rb") as report_file:
+        if os.fstat(report_file.fileno()).st_size == 0:
+            # An empty file can't be mapped
+            yield iter(())
+            return
+        with mmap.mmap(report_file.fileno(), 0, access=mmap.ACCESS_READ) as report:
+            yield _mapped_lines(report)
+
+
+def classify_line(line: str) -> str:
+    """Return the kind of a behave plain report line"""
+    if _FEATURE_LINE.match(line):
+        return FEATURE
+    if _SCENARIO_LINE.match(line):
+        return SCENARIO
+    if _PASSED_LINE.match(line):
+        return PASSED
+    if _FAILED_LINE.match(line):
+        return FAILED
+    return OTHER
+
+
+def element_name(line: str) -> str:
+    """Return the name following the keyword of a feature or scenario line"""
+    return line.split(":", 1)[1].strip()
+
+
+def iter_scenario_results(lines: Iterable[str]) -> Iterator[ScenarioResult]:
+    """
+    Stream the scenario results of a behave plain report.
+
+    The scenario status is the status of its last passed or failed step, "skipped" otherwise.
+    A feature without scenario yields a single result with a None scenario.
+    :param lines: the report lines
+    :return: an iterator of ScenarioResult in the report order
+    """
+    current_feature = None
+    current_scenario = None
+    last_status = SKIPPED
+    for line in lines:
+        kind = classify_line(line)
+        if kind in (FEATURE, SCENARIO):
+            if current_feature is not None and (kind == FEATURE or current_scenario is not None):
+                yield ScenarioResult(current_feature, current_scenario, last_status)
+                last_status = SKIPPED
+            if kind == FEATURE:
+                current_feature = element_name(line)
+                current_scenario = None
+            else:
+                current_scenario = element_name(line)
+        elif kind in (PASSED, FAILED):
+            last_status = kind
+    if current_feature is not None:
+        yield ScenarioResult(current_feature, current_scenario, last_status)
+
+
+def index_results(lines: Iterable[str]) -> Dict[Tuple[str, Optional[str]], str]:
+    """
+    Index the scenario statuses of a behave plain report by (feature name, scenario name)
+    in one streaming pass. A scenario reported twice keeps its last status.
+    Outline rows are indexed by their generated name (e.g. "Adding 1 -- @1.1 Examples").
+    :param lines: the report lines
+    :return: the status by (feature name, scenario name)
+    """
+    return {(result.feature, result.scenario): result.status
+            for result in iter_scenario_results(lines)}
+
+
+def aggregate_status(statuses: Iterable[Optional[str]]) -> Optional[str]:
+    """
+    Return the status of a group of results (e.g. the rows of an outline):
+    failed if one failed, passed if one passed, skipped if one was reported, None otherwise.
+    """
+    statuses = set(statuses)
+    for status in (FAILED, PASSED, SKIPPED):
+        if status in statuses:
+            return status
+    return None
@@ -2,15 +2,18 @@
 # -*- Product under GNU GPL v3 -*-
 # -*- Author: E.Aivayan -*-
 import argparse
+import json
 import logging
 import os
+import queue
 import sys
 import tempfile
+import threading
 
 try:
     import tkinter as tk
     from PIL import ImageTk, Image
-    from tkinter import filedialog, Toplevel, messagebox
+    from tkinter import filedialog, Toplevel, messagebox, ttk
 
     GUI_ENABLED = True
 except ImportError:
@@ -18,7 +21,15 @@ except ImportError:
 
 from logging.handlers import RotatingFileHandler
 
-from .reportgenerator import ExportUtilities
+from .batch import JOB_KEYS, create_reporter, load_batch, run_batch
+from .docxmerge import merge_documents
+from .events import JsonLinesListener
+from .history import HistoryStore
+from .merger import merge_results
+from .planning import format_plan
+from .reportgenerator import ExportUtilities, GenerationCancelled
+from .plantuml import PlantUmlDaemon, PlantUmlDaemonRenderer, PlantUmlRenderer
+from .server import serve
 
 log = logging.getLogger(__name__)
 
@@ -30,12 +41,24 @@ LICENCE = """ ExportUtilities  Copyright (C) 2022  E.Aivayan
     """
 
 
+class _QueueLogHandler(logging.Handler):
+    """Forward the formatted log records to the GUI queue"""
+
+    def __init__(self, messages: queue.Queue):
+        super().__init__(logging.INFO)
+        self.__messages = messages
+        self.setFormatter(logging.Formatter("%(levelname)s -- %(message)s"))
+
+    def emit(self, record):
+        self.__messages.put(("log", self.format(record)))
+
+
 class Application:
 
     def __init__(self):
         self.__assets = os.path.dirname(os.path.realpath(__file__))
         self.__master = tk.Tk()
-        self.__master.geometry("520x250")
+        self.__master.geometry("560x480")
         # Feature repository vars
         self.__repository_label = None
         self.__repository_select_button = None
@@ -66,7 +89,13 @@ class Application:
         self.__quit = None
         self.__readme_button = None
         self.__execute_button = None
+        self.__cancel_button = None
         self.__legal_label = None
+        # Background generation
+        self.__progress_bar = None
+        self.__log_text = None
+        self.__worker = None
+        self.__messages = queue.Queue()
         # Reporter object
         self.__reporter = ExportUtilities()
         # Create
@@ -127,6 +156,12 @@ class Application:
         # Execute
         self.__execute_button = tk.Button(self.__master, text="Create report",
                                           command=self.__create_report)
+        self.__cancel_button = tk.Button(self.__master, text="Cancel", state=tk.DISABLED,
+                                         command=self.__cancel_report)
+        # Progress and logs
+        self.__progress_bar = ttk.Progressbar(self.__master, orient=tk.HORIZONTAL,
+                                              mode="determinate")
+        self.__log_text = tk.Text(self.__master, height=10, width=70, state=tk.DISABLED)
 
         # QUIT
         self.__quit = tk.Button(self.__master, text="QUIT", fg="red",
@@ -153,7 +188,10 @@ class Application:
         self.__execution_result_reset.grid(row=6, column=4)
         self.__readme_button.grid(row=7, column=0)
         self.__execute_button.grid(row=7, column=3)
-        self.__quit.grid(row=8, column=0, columnspan=5, sticky="E,W")
+        self.__cancel_button.grid(row=7, column=4)
+        self.__progress_bar.grid(row=8, column=0, columnspan=5, sticky="E,W")
+        self.__log_text.grid(row=9, column=0, columnspan=5, sticky="E,W")
+        self.__quit.grid(row=10, column=0, columnspan=5, sticky="E,W")
 
     @staticmethod
     def __display_readme():
@@ -167,6 +205,8 @@ class Application:
 
     def __create_report(self):
         log.info("Start reporting")
+        if self.__worker is not None and self.__worker.is_alive():
+            return
         if self.__repository_location is not None and self.__repository_location:
             self.__reporter.feature_repository = self.__repository_location
             if self.__document_name_input.get():
@@ -181,13 +221,79 @@ class Application:
             if self.__execution_location is not None and self.__execution_location:
                 param["report_file"] = self.__execution_location
             log.debug(param)
-            self.__reporter.create_application_documentation(**param)
+            # Tk widgets are only updated from the main loop, the worker posts messages
+            self.__execute_button["state"] = tk.DISABLED
+            self.__cancel_button["state"] = tk.NORMAL
+            self.__progress_bar["value"] = 0
+            self.__worker = threading.Thread(target=self.__generate, args=(param,), daemon=True)
+            self.__worker.start()
+            self.__master.after(100, self.__poll_worker)
         else:
             log.error("Cannot create de report without a feature files repository.")
             messagebox.showerror("Report creation",
                                  "Cannot create de report without a feature files repository.\n "
                                  "Please select one.")
 
+    def __generate(self, param: dict):
+        """Run the generation in the worker thread"""
+        handler = _QueueLogHandler(self.__messages)
+        package_logger = logging.getLogger("featurereporter")
+        previous_level = package_logger.level
+        package_logger.addHandler(handler)
+        package_logger.setLevel(logging.INFO)
+        self.__reporter.events.subscribe(self.__on_event)
+        try:
+            self.__reporter.create_application_documentation(**param)
+            self.__messages.put(("done", "Report created."))
+        except GenerationCancelled as cancelled:
+            self.__messages.put(("done", f"Report cancelled. {cancelled}"))
+        except Exception as exception:
+            log.error(exception)
+            self.__messages.put(("error", f"Report creation failed: {exception}"))
+        finally:
+            self.__reporter.events.unsubscribe(self.__on_event)
+            package_logger.removeHandler(handler)
+            package_logger.setLevel(previous_level)
+
+    def __on_event(self, event):
+        if event.name == "feature_finished":
+            self.__messages.put(("progress", (event.data["index"] + 1, event.data["total"])))
+
+    def __cancel_report(self):
+        self.__reporter.cancel()
+        self.__cancel_button["state"] = tk.DISABLED
+
+    def __append_log(self, text: str):
+        self.__log_text["state"] = tk.NORMAL
+        self.__log_text.insert(tk.END, f"{text}\n")
+        self.__log_text.see(tk.END)
+        self.__log_text["state"] = tk.DISABLED
+
+    def __poll_worker(self):
+        """Consume the worker messages from the main loop"""
+        try:
+            while True:
+                kind, payload = self.__messages.get_nowait()
+                if kind == "log":
+                    self.__append_log(payload)
+                elif kind == "progress":
+                    done, total = payload
+                    self.__progress_bar["maximum"] = total
+                    self.__progress_bar["value"] = done
+                elif kind == "error":
+                    self.__append_log(payload)
+                    messagebox.showerror("Report creation", payload)
+                else:
+                    self.__append_log(payload)
+        except queue.Empty:
+            pass
+        if ((self.__worker is not None and self.__worker.is_alive())
+                or not self.__messages.empty()):
+            self.__master.after(100, self.__poll_worker)
+        else:
+            self.__execute_button["state"] = tk.NORMAL
+            self.__cancel_button["state"] = tk.DISABLED
+
     def __display_legal(self, event):
         log.debug("Display legal")
         f_infos = Toplevel()  # Popup -> Toplevel()
@@ -250,7 +356,110 @@ Icon by Raj Dev (https://freeicons.io/profile/714) on https://freeicons.io""")
         self.__master.mainloop()
 
 
-def main():
+def add_daemon_argument(parser: argparse.ArgumentParser):
+    parser.add_argument("--plantuml-daemon", nargs="?", type=int, const=900, metavar="IDLE",
+                        help="Render diagrams with a PlantUML server kept alive between runs, "
+                             "stopped after IDLE seconds without use (default 900)")
+
+
+def create_renderer(args) -> PlantUmlRenderer:
+    if args.plantuml_daemon is not None:
+        return PlantUmlDaemonRenderer(daemon=PlantUmlDaemon(idle_timeout=args.plantuml_daemon))
+    return PlantUmlRenderer()
+
+
+def merge_command(arguments):
+    parser = argparse.ArgumentParser(prog="featurereporter merge",
+                                     description="Merge EaiCsv files and behave plain reports. "
+                                                 "The last status wins for each scenario.")
+    parser.add_argument("files", nargs="+",
+                        help="Result files by increasing priority (e.g. workers then reruns)")
+    parser.add_argument("--output", required=True,
+                        help="The merged file. A .csv extension produces an EaiCsv file, "
+                             "otherwise a plain report usable with --execution")
+    parser.add_argument("--chunk-size", type=int, default=200000,
+                        help="Maximum number of rows sorted in memory")
+    args = parser.parse_args(arguments)
+    merge_results(args.files, args.output, args.chunk_size)
+
+
+def batch_command(arguments):
+    parser = argparse.ArgumentParser(prog="featurereporter batch",
+                                     description="Generate several documents in one process "
+                                                 "from a toml jobs file.")
+    parser.add_argument("jobs", help="The toml file listing the jobs")
+    parser.add_argument("--workers", type=int,
+                        help="Number of documents generated concurrently "
+                             "(overrides the file 'workers')")
+    add_daemon_argument(parser)
+    args = parser.parse_args(arguments)
+    config = load_batch(args.jobs)
+    results = run_batch(config["jobs"], args.workers or config["workers"], create_renderer(args))
+    failed = [job for job, error in results if error is not None]
+    for job, error in results:
+        print(f"{'FAILED' if error else 'OK':6} {job['repository']} -> "
+              f"{job.get('output', 'demo.docx')}{f' ({error})' if error else ''}")
+    if failed:
+        sys.exit(1)
+
+
+def serve_command(arguments):
+    parser = argparse.ArgumentParser(prog="featurereporter serve",
+                                     description="Generate documents on demand over http. "
+                                                 "POST a json job on /jobs to get the docx.")
+    parser.add_argument("--host", default="127.0.0.1", help="The listening address")
+    parser.add_argument("--port", type=int, default=8765, help="The listening port")
+    parser.add_argument("--workers", type=int, default=2,
+                        help="Number of documents generated concurrently")
+    parser.add_argument("--queue", type=int, default=8,
+                        help="Number of waiting jobs before rejecting new ones")
+    add_daemon_argument(parser)
+    args = parser.parse_args(arguments)
+    serve(args.host, args.port, args.workers, args.queue, create_renderer(args))
+
+
+def merge_docx_command(arguments):
+    parser = argparse.ArgumentParser(prog="featurereporter merge-docx",
+                                     description="Concatenate partial documents, e.g. the "
+                                                 "shards of a generation, into one document.")
+    parser.add_argument("files", nargs="+", help="The partial documents, in the document order")
+    parser.add_argument("--output", required=True, help="The merged document")
+    args = parser.parse_args(arguments)
+    merge_documents(args.files, args.output)
+
+
+def history_command(arguments):
+    parser = argparse.ArgumentParser(prog="featurereporter history",
+                                     description="Append archived behave plain reports to a "
+                                                 "history database.")
+    parser.add_argument("files", nargs="+", help="The plain reports")
+    parser.add_argument("--history", required=True, help="The sqlite history database")
+    args = parser.parse_args(arguments)
+    with HistoryStore(args.history) as store:
+        for report_file in args.files:
+            run_id = store.import_report(report_file)
+            print(f"{'SKIPPED' if run_id is None else 'ADDED':8} {report_file}")
+
+
+def shard_argument(value: str):
+    """Parse a 'index/count' shard, index starting at 1"""
+    try:
+        index, count = (int(item) for item in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not an 'index/count' shard")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"{value} index must be between 1 and {count}")
+    return index, count
+
+
+SUB_COMMANDS = {"merge": merge_command,
+                "merge-docx": merge_docx_command,
+                "history": history_command,
+                "batch": batch_command,
+                "serve": serve_command}
+
+
+def configure_logging():
     logging.basicConfig(level=logging.WARNING)
     formatter = logging.Formatter(
         "%(asctime)s -- %(filename)s.%(funcName)s-- %(levelname)s -- %(message)s")
@@ -265,21 +474,162 @@ def main():
     logger.setLevel(logging.WARNING)
     logger.addHandler(handler)
 
-    parser = argparse.ArgumentParser()
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        epilog="The exit status is 1 when a feature failed on an error, the document being saved "
+               "with a note instead.")
     parser.add_argument("--tag", help="Invariant pointing to a user story")
     parser.add_argument("--title", help="The document's title")
     parser.add_argument("--repository", help="The folder where the feature files are")
     parser.add_argument("--forewords",
                         help=("The folder where forewords markdown files are."
                               " It is not a recursive discovery."))
-    parser.add_argument("--output", help="The filename the docu")
+    parser.add_argument("--output",
+                        action="append",
+                        help="The filename the docu ('-' writes it on the standard output). "
+                             "Repeat to also write the scenarios (.csv) "
+                             "or a summary (.json) from the same parsing")
+    parser.add_argument("--compression",
+                        type=int,
+                        choices=range(10),
+                        metavar="LEVEL",
+                        help="Document compression from 0 (stored, fastest save) to 9 (smallest). "
+                             "Pictures are always stored")
     parser.add_argument("--execution",
                         help="Behave plain test output in order to "
                              "also print the last execution result")
+    parser.add_argument("--inline-results",
+                        action="store_true",
+                        default=None,
+                        help="Print the --execution status under each scenario title")
+    parser.add_argument("--history",
+                        help="Sqlite database the --execution report is appended to. "
+                             "Adds the trend of the last runs and the flaky scenarios")
+    parser.add_argument("--max-table-rows",
+                        type=int,
+                        help="Show only the first rows of larger tables with a summary. "
+                             "The full tables are written as csv in the OUTPUT_tables folder")
+    parser.add_argument("--diagram-timeout",
+                        type=float,
+                        metavar="SECONDS",
+                        help="Kill a diagram rendering after SECONDS, a note replaces the diagram")
+    parser.add_argument("--feature-timeout",
+                        type=float,
+                        metavar="SECONDS",
+                        help="Replace a feature by a note when documenting it takes more than "
+                             "SECONDS")
+    parser.add_argument("--deadline",
+                        type=float,
+                        metavar="SECONDS",
+                        help="Skip the features left after SECONDS. The document ends with the "
+                             "list of the skipped or failed items")
+    parser.add_argument("--traceability",
+                        action="store_true",
+                        default=None,
+                        help="Add the matrix of the features and scenarios covering each user "
+                             "story (--tag) with their last status, not available with --shard")
+    parser.add_argument("--traceability-csv",
+                        help="Write the user story traceability matrix in this csv file, "
+                             "not available with --shard")
+    parser.add_argument("--prefetch-depth",
+                        type=int,
+                        metavar="FILES",
+                        help="Number of feature files read ahead while a feature is documented "
+                             "(default 8), e.g. more on a network share")
+    parser.add_argument("--include-tags",
+                        action="append",
+                        help="Behave-style tag expression selecting the features and scenarios "
+                             "to document (e.g. '@release-1,@release-2'). Repeat for 'and'.")
+    parser.add_argument("--events",
+                        help="Write the generation events (stages, timings and counts) "
+                             "as json lines in this file")
+    parser.add_argument("--shard", type=shard_argument, metavar="INDEX/COUNT",
+                        help="Generate only the INDEX part (from 1) of COUNT contiguous parts of "
+                             "the feature list. Merge the parts with 'merge-docx'.")
+    parser.add_argument("--force",
+                        action="store_true",
+                        default=None,
+                        help="Generate even if the inputs did not change since the last generation "
+                             "of the outputs")
+    parser.add_argument("--plan",
+                        nargs="?",
+                        const="text",
+                        choices=["text", "json"],
+                        help="Print the estimated cost (counts, time and memory per stage) "
+                             "of the generation instead of generating")
+    parser.add_argument("--calibrate",
+                        action="store_true",
+                        default=None,
+                        help="Record the stage timings of this generation in the calibration "
+                             "of the --plan estimations")
+    add_daemon_argument(parser)
     parser.add_argument("--license",
                         help="Display the license.",
                         action="store_true")
+    return parser
+
+
+def launch_gui():
+    if GUI_ENABLED:
+        app = Application()
+        app.run()
+    else:
+        print(f"""{LICENCE}
+    Run with --license option to display the full licence
+    
+    --> tkinter cannot be imported. GUI cannot be launched.
+    Please use the full command line to generate report.""")
 
+
+def create_report(args) -> ExportUtilities:
+    """Configure an ExportUtilities from the command line options, as a batch job"""
+    # The generation options are named as the batch job keys
+    job = {key: getattr(args, key) for key in JOB_KEYS if getattr(args, key) is not None}
+    report = create_reporter(job, create_renderer(args))
+    if args.shard:
+        report.shard = args.shard
+    return report
+
+
+def generate(report: ExportUtilities, args):
+    """Generate the documents, or print the plan, and exit"""
+    parameters = {}
+    if args.execution is not None and args.execution:
+        parameters["report_file"] = args.execution
+    to_stdout = args.output is not None and "-" in args.output
+    if args.output is not None and args.output:
+        outputs = [sys.stdout.buffer if output == "-" else output for output in args.output]
+        parameters["output_file_name"] = outputs[0] if len(outputs) == 1 else outputs
+    if args.plan is not None:
+        plan = report.plan(parameters.get("report_file"))
+        print(json.dumps(plan, indent=2) if args.plan == "json" else format_plan(plan))
+        sys.exit(0)
+    # The standard output may hold the document
+    print(f"""{LICENCE}
+    Run with --license option to display the full licence""",
+          file=sys.stderr if to_stdout else sys.stdout)
+    if args.events is not None and args.events:
+        with open(args.events, "a", encoding="utf-8") as events_file:
+            report.events.subscribe(JsonLinesListener(events_file))
+            report.create_application_documentation(**parameters)
+    else:
+        report.create_application_documentation(**parameters)
+    if report.errors:
+        # The document is saved, with a placeholder for each failed feature
+        log.error(f"{report.errors} features failed, see the document end")
+        sys.exit(1)
+    sys.exit(0)
+
+
+def main():
+    configure_logging()
+
+    if len(sys.argv) > 1 and sys.argv[1] in SUB_COMMANDS:
+        SUB_COMMANDS[sys.argv[1]](sys.argv[2:])
+        sys.exit(0)
+
+    parser = create_parser()
     args = parser.parse_args()
     if (
             all(
@@ -289,18 +639,8 @@ def main():
             )
             and not args.license
     ):
-        if GUI_ENABLED:
-            app = Application()
-            app.run()
-        else:
-            print(f"""{LICENCE}
-    Run with --license option to display the full licence
-    
-    --> tkinter cannot be imported. GUI cannot be launched.
-    Please use the full command line to generate report.""")
-
+        launch_gui()
     else:
-        print(args.license)
         if args.license is not None and args.license:
             with open(os.path.realpath(
                     f"{os.path.dirname(os.path.realpath(__file__))}"
@@ -309,22 +649,9 @@ def main():
                 sys.exit(0)
         if args.repository is None or not args.repository:
             parser.print_help()
-        report = ExportUtilities()
-        report.feature_repository = args.repository
-        if args.title is not None and args.title:
-            report.report_title = args.title
-        if args.tag is not None and args.tag:
-            report.us_tag = args.tag
-        if args.forewords is not None and args.forewords:
-            report.forewords_folder = args.forewords
-        parameters = {}
-        if args.execution is not None and args.execution:
-            parameters["report_file"] = args.execution
-        if args.output is not None and args.output:
-            parameters["output_file_name"] = args.output
-        print(f"""{LICENCE}
-    Run with --license option to display the full licence""")
-        report.create_application_documentation(**parameters)
+        if args.shard and args.shard[1] > 1 and (args.traceability or args.traceability_csv):
+            parser.error("--traceability and --traceability-csv cannot be combined with --shard")
+        generate(create_report(args), args)
     sys.exit(0)
 
 
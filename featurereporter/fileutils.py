@@ -0,0 +1,40 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Union
+
+
+@contextmanager
+def atomic_output(path: Union[str, Path], mode: str = "wb", **kwargs):
+    """
+    Open a temporary file next to the path, which replaces the path when the block succeeds,
+    so that concurrent readers see the previous file or the new one, never a partial file.
+    The temporary file is removed when the block fails.
+    :param path: the destination file, its folder is created if needed
+    :param mode: the open mode ("wb" or "w")
+    :param kwargs: the other open arguments
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(temporary, mode, **kwargs) as stream:
+            yield stream
+        os.replace(temporary, path)
+    finally:
+        if temporary.exists():
+            temporary.unlink()
+
+
+def atomic_write_json(path: Union[str, Path], data) -> None:
+    """
+    Write the data as json atomically (see atomic_output).
+    :param path: the destination file, its folder is created if needed
+    :param data: the json serializable data
+    """
+    with atomic_output(path, "w", encoding="utf-8") as stream:
+        json.dump(data, stream)
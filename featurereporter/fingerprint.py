@@ -0,0 +1,153 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Callable, List, Union
+
+from .fileutils import atomic_write_json
+
+log = logging.getLogger(__name__)
+
+
+class InputFingerprint:
+    """
+    Digest of the inputs of a generation. Files are identified by their path, size and
+    modification time, as in the discovery manifest: they are not read.
+    The files they reference are found with a ReferenceIndex.
+    """
+
+    def __init__(self):
+        self.__digest = hashlib.sha256()
+
+    def add(self, name: str, value):
+        """Add a json serializable value (e.g. an option)"""
+        self.__digest.update(json.dumps([name, value], sort_keys=True, default=str)
+                             .encode("utf-8"))
+
+    def add_file(self, path: Union[str, Path]) -> Union[os.stat_result, None]:
+        """Add a file, a missing file counts as well. Return the file status, None if missing"""
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.add("missing", path)
+            return None
+        self.add("file", [path, stat.st_size, stat.st_mtime_ns])
+        return stat
+
+    def add_tree(self, folder: Union[str, Path]):
+        """Add every file of a folder and its sub folders"""
+        for root, folders, files in os.walk(folder):
+            folders.sort()
+            for name in sorted(files):
+                self.add_file(os.path.join(root, name))
+
+    def hexdigest(self) -> str:
+        return self.__digest.hexdigest()
+
+
+class ReferenceIndex:
+    """
+    Persisted index of the files referenced by input files (e.g. the diagrams of a feature,
+    the includes of a diagram). An entry is refreshed when the file size or modification
+    time changes: an unchanged file is not read again.
+    """
+
+    def __init__(self, index_file: Union[str, Path, None] = None):
+        self.__index_file = index_file
+        self.__entries = {}
+        self.__dirty = False
+        if index_file is not None and Path(index_file).is_file():
+            try:
+                with open(index_file, encoding="utf-8") as index:
+                    self.__entries = json.load(index)
+            except (OSError, ValueError) as exception:
+                log.warning(f"Reference index {index_file} is discarded: {exception}")
+
+    def references(self, file_path: Union[str, Path], stat: os.stat_result,
+                   scanner: Callable[[str], List[str]]) -> List[str]:
+        """
+        Return the indexed references of a file, scan it if needed
+        :param file_path: the referencing file
+        :param stat: the file status
+        :param scanner: return the references of a file, called on a new or changed file
+        """
+        key = os.path.abspath(file_path)
+        entry = self.__entries.get(key)
+        if (entry is None
+                or entry["mtime_ns"] != stat.st_mtime_ns
+                or entry["size"] != stat.st_size):
+            entry = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size,
+                     "references": [str(reference) for reference in scanner(key)]}
+            self.__entries[key] = entry
+            self.__dirty = True
+        return entry["references"]
+
+    def save(self):
+        """Persist the index if it has changed"""
+        if self.__index_file is None or not self.__dirty:
+            return
+        atomic_write_json(self.__index_file, self.__entries)
+        self.__dirty = False
+
+
+class FingerprintStore:
+    """
+    Fingerprint of the inputs of the last generation of a set of outputs.
+    The outputs size and modification time are recorded too: a replaced or removed output
+    is generated again, and its record is dropped.
+    """
+
+    def __init__(self, folder: Union[str, Path]):
+        self.__folder = Path(folder)
+
+    def __file(self, outputs: List[str]) -> Path:
+        key = "\n".join(sorted(os.path.abspath(output) for output in outputs))
+        return self.__folder / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}.json"
+
+    @staticmethod
+    def __outputs_state(outputs: List[str]) -> Union[dict, None]:
+        state = {}
+        for output in outputs:
+            try:
+                stat = os.stat(output)
+            except OSError:
+                return None
+            state[os.path.abspath(output)] = [stat.st_size, stat.st_mtime_ns]
+        return state
+
+    def matches(self, outputs: List[str], fingerprint: str) -> bool:
+        """True if the outputs exist as generated from inputs with the same fingerprint"""
+        record_file = self.__file(outputs)
+        if not record_file.is_file():
+            return False
+        try:
+            with open(record_file, encoding="utf-8") as record_stream:
+                record = json.load(record_stream)
+        except (OSError, ValueError) as exception:
+            log.warning(f"Fingerprint {record_file} is discarded: {exception}")
+            return False
+        return (record.get("fingerprint") == fingerprint
+                and record.get("outputs") == self.__outputs_state(outputs))
+
+    def record(self, outputs: List[str], fingerprint: str):
+        """Record the fingerprint of the inputs the outputs have just been generated from"""
+        self.prune()
+        atomic_write_json(self.__file(outputs), {"fingerprint": fingerprint,
+                                                 "outputs": self.__outputs_state(outputs)})
+
+    def prune(self):
+        """Drop the records of removed outputs (e.g. temporary ones), they cannot match again"""
+        for record_file in self.__folder.glob("*.json"):
+            try:
+                with open(record_file, encoding="utf-8") as record_stream:
+                    outputs = json.load(record_stream).get("outputs") or {}
+                if all(os.path.exists(output) for output in outputs):
+                    continue
+                os.remove(record_file)
+            except (OSError, ValueError, AttributeError):
+                # Being written or removed by another generation
+                continue
@@ -0,0 +1,86 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import List, Union
+
+from .fileutils import atomic_write_json
+
+log = logging.getLogger(__name__)
+
+
+class ForewordRecord:
+    """Files read (dependencies) and pictures produced (images) while processing a foreword"""
+
+    def __init__(self):
+        self.dependencies: List[str] = []
+        self.images: List[str] = []
+        self.inline_count = 0
+        # False when a part (e.g. a timed out diagram) is missing: the foreword is not cached
+        self.complete = True
+
+    def depends_on(self, path: Union[str, Path]):
+        self.dependencies.append(os.path.abspath(path))
+
+
+class ForewordsCache:
+    """
+    Cache of the processed forewords markdown keyed by the content hash.
+
+    An entry is valid while its dependencies keep the same size and modification time
+    (missing dependencies, such as a missing include, stay missing) and its images still exist.
+    """
+
+    def __init__(self, folder: Union[str, Path]):
+        self.__folder = Path(folder)
+
+    @property
+    def folder(self) -> Path:
+        return self.__folder
+
+    @staticmethod
+    def key(content: str, *context) -> str:
+        digest = hashlib.sha256(content.encode("utf-8"))
+        for item in context:
+            digest.update(f"\0{item}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Union[str, None]:
+        """Return the cached markdown or None"""
+        entry_file = self.__folder / f"{key}.json"
+        if not entry_file.is_file():
+            return None
+        try:
+            with open(entry_file, encoding="utf-8") as entry_stream:
+                entry = json.load(entry_stream)
+            for path, signature in entry["dependencies"].items():
+                if signature is None:
+                    if os.path.exists(path):
+                        return None
+                    continue
+                stat = os.stat(path)
+                if [stat.st_size, stat.st_mtime_ns] != signature:
+                    return None
+            if not all(Path(image).is_file() for image in entry["images"]):
+                return None
+        except (OSError, ValueError, KeyError) as exception:
+            log.info(f"Forewords cache entry {key} is discarded: {exception}")
+            return None
+        return entry["markdown"]
+
+    def put(self, key: str, markdown: str, record: ForewordRecord):
+        dependencies = {}
+        for path in record.dependencies:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                dependencies[path] = None
+                continue
+            dependencies[path] = [stat.st_size, stat.st_mtime_ns]
+        atomic_write_json(self.__folder / f"{key}.json",
+                          {"markdown": markdown,
+                           "dependencies": dependencies,
+                           "images": record.images})
@@ -0,0 +1,144 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+import logging
+import os
+import sqlite3
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, List, Tuple, Union
+
+from .executionreport import FAILED, PASSED, ScenarioResult, iter_scenario_results, \
+    open_report
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history_run (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started TEXT NOT NULL,
+    source TEXT UNIQUE,
+    total INTEGER NOT NULL,
+    passed INTEGER NOT NULL,
+    failed INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS history_result (
+    run_id INTEGER NOT NULL REFERENCES history_run (id),
+    feature TEXT NOT NULL,
+    scenario TEXT,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_run_started ON history_run (started);
+CREATE INDEX IF NOT EXISTS history_result_run ON history_result (run_id, feature, scenario, status);
+CREATE INDEX IF NOT EXISTS history_result_scenario ON history_result (feature, scenario);
+"""
+
+
+class HistoryStore:
+    """
+    Execution history in a sqlite database.
+
+    A run is the summary and the scenario statuses of one behave plain report. The trend and
+    the flaky scenarios are computed by aggregate queries on the indexed tables.
+    """
+
+    def __init__(self, database: str, batch_size: int = 1000):
+        self.__database = database
+        self.__batch_size = batch_size
+        self.__connection = sqlite3.connect(database)
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute("PRAGMA synchronous=NORMAL")
+        self.__connection.executescript(SCHEMA)
+
+    @property
+    def database(self) -> str:
+        return self.__database
+
+    def close(self):
+        self.__connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @staticmethod
+    def source_key(report_file: str) -> str:
+        """Identify a report file by its path, size and modification time"""
+        stat = os.stat(report_file)
+        return f"{os.path.abspath(report_file)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def has_source(self, source: str) -> bool:
+        return self.__connection.execute("SELECT 1 FROM history_run WHERE source = ?",
+                                         (source,)).fetchone() is not None
+
+    def revision(self) -> Tuple[int, Union[int, None]]:
+        """Return the number of runs and the last run id: they change when a run is appended"""
+        return self.__connection.execute("SELECT COUNT(*), MAX(id) FROM history_run").fetchone()
+
+    def append_run(self, results: Iterable[ScenarioResult],
+                   started: Union[str, None] = None,
+                   source: Union[str, None] = None) -> Union[int, None]:
+        """
+        Append a run in a single transaction.
+        :param results: the scenario results, features without scenario are ignored
+        :param started: the ISO run date, now by default
+        :param source: an identifier of the run origin, a run is appended once per source
+        :return: the run id or None if the source is already known
+        """
+        if source is not None and self.has_source(source):
+            log.info(f"History already holds {source}")
+            return None
+        results = (result for result in results if result.scenario is not None)
+        with self.__connection:
+            run_id = self.__connection.execute(
+                "INSERT INTO history_run (started, source, total, passed, failed) "
+                "VALUES (?, ?, 0, 0, 0)",
+                (started or datetime.now().isoformat(timespec="seconds"), source)).lastrowid
+            while True:
+                rows = [(run_id, result.feature, result.scenario, result.status)
+                        for result in islice(results, self.__batch_size)]
+                if not rows:
+                    break
+                self.__connection.executemany("INSERT INTO history_result "
+                                              "(run_id, feature, scenario, status) "
+                                              "VALUES (?, ?, ?, ?)", rows)
+            self.__connection.execute(
+                "UPDATE history_run SET (total, passed, failed) = "
+                "(SELECT COUNT(*), COALESCE(SUM(status = ?), 0), COALESCE(SUM(status = ?), 0) "
+                "FROM history_result WHERE run_id = ?) WHERE id = ?",
+                (PASSED, FAILED, run_id, run_id))
+        return run_id
+
+    def import_report(self, report_file: str, started: Union[str, None] = None) -> Union[int, None]:
+        """
+        Append the run of a behave plain report, dated by the report modification time.
+        A report already imported (same path, size and modification time) is skipped.
+        """
+        if started is None:
+            started = datetime.fromtimestamp(os.path.getmtime(report_file)).isoformat(
+                timespec="seconds")
+        with open_report(report_file) as report_lines:
+            return self.append_run(iter_scenario_results(report_lines), started,
+                                   self.source_key(report_file))
+
+    def trend(self, runs: int = 20) -> List[Tuple[str, int, int, int]]:
+        """Return the (date, total, passed, failed) of the last runs, oldest first"""
+        rows = self.__connection.execute("SELECT started, total, passed, failed FROM history_run "
+                                         "ORDER BY started DESC, id DESC LIMIT ?",
+                                         (runs,)).fetchall()
+        return rows[::-1]
+
+    def flaky(self, runs: int = 20, limit: int = 20) -> List[Tuple[str, str, int, int]]:
+        """
+        Return the scenarios which both passed and failed during the last runs
+        as (feature, scenario, executions, failures), the most failing first.
+        """
+        return self.__connection.execute(
+            "SELECT feature, scenario, COUNT(*), SUM(status = ?) AS failures "
+            "FROM history_result "
+            "WHERE run_id IN (SELECT id FROM history_run ORDER BY started DESC, id DESC LIMIT ?) "
+            "GROUP BY feature, scenario "
+            "HAVING failures > 0 AND SUM(status = ?) > 0 "
+            "ORDER BY failures DESC, feature, scenario LIMIT ?",
+            (FAILED, runs, PASSED, limit)).fetchall()
@@ -0,0 +1,96 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+import logging
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Callable, Tuple, Union
+
+import docx
+from htmldocx import HtmlToDocx
+from htmldocx.h2d import get_filename_from_url, is_url
+
+log = logging.getLogger(__name__)
+
+# Default memory bound of the cached pictures
+MAX_BYTES = 64 * 1024 * 1024
+
+
+class ImageCache:
+    """
+    Size-bounded LRU cache of ready-to-embed pictures, keyed by absolute path, size and
+    modification time: a picture referenced several times is read (and processed) once.
+    It may be shared between threads.
+    """
+
+    def __init__(self, max_bytes: int = MAX_BYTES):
+        self.__max_bytes = max_bytes
+        self.__entries: "OrderedDict[Tuple[str, int, int], bytes]" = OrderedDict()
+        self.__size = 0
+        self.__guard = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def size(self) -> int:
+        """The bytes currently cached"""
+        return self.__size
+
+    def get(self, path: Union[str, os.PathLike],
+            loader: Callable[[str], bytes] = None) -> bytes:
+        """
+        Return the picture bytes, loaded on a miss.
+        :param path: the picture file
+        :param loader: return the bytes to embed for the path (e.g. resized), the file content
+            by default
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        with self.__guard:
+            content = self.__entries.get(key)
+            if content is not None:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+                return content
+            self.misses += 1
+        if loader is None:
+            with open(path, "rb") as picture:
+                content = picture.read()
+        else:
+            content = loader(path)
+        with self.__guard:
+            # Pictures larger than the whole cache are not kept
+            if key not in self.__entries and len(content) <= self.__max_bytes:
+                self.__entries[key] = content
+                self.__size += len(content)
+                while self.__size > self.__max_bytes:
+                    _, evicted = self.__entries.popitem(last=False)
+                    self.__size -= len(evicted)
+        return content
+
+
+class CachedHtmlToDocx(HtmlToDocx):
+    """HtmlToDocx reading the local pictures through an ImageCache"""
+
+    def __init__(self, image_cache: ImageCache = None):
+        super().__init__()
+        self.image_cache = image_cache
+
+    def handle_img(self, current_attrs):
+        src = current_attrs.get('src', '')
+        if not self.include_images or self.image_cache is None or is_url(src):
+            super().handle_img(current_attrs)
+            return
+        try:
+            image = BytesIO(self.image_cache.get(src))
+        except OSError:
+            # avoid exposing filepaths in document
+            self.doc.add_paragraph("<image: %s>" % get_filename_from_url(src))
+            return
+        # python-docx stores identical pictures (same SHA1) in a single image part
+        if isinstance(self.doc, docx.document.Document):
+            self.doc.add_picture(image)
+        else:
+            self.add_image_to_cell(self.doc, image)
@@ -0,0 +1,44 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+import re
+from functools import lru_cache
+from typing import Optional, Pattern
+
+from behave.i18n import languages
+
+DEFAULT_LANGUAGE = "en"
+
+_LANGUAGE_LINE = re.compile(r"\s*#\s*language\s*:\s*([\w-]+)\s*$")
+_NEVER = re.compile(r"(?!)")
+
+
+def declared_language(line: str) -> Optional[str]:
+    """Return the language of a '# language: xx' line, None for any other line"""
+    match = _LANGUAGE_LINE.match(line)
+    return None if match is None else match.group(1)
+
+
+def is_known(language: str) -> bool:
+    """Return True if behave knows the keywords of the language"""
+    return language in languages
+
+
+@lru_cache(maxsize=None)
+def keyword_line(language: str, *kinds: str) -> Pattern:
+    """
+    Return the regex matching a line starting with a keyword followed by ':', for the given
+    keyword kinds of the behave i18n tables (e.g. "scenario", "scenario_outline").
+    A kind missing from the language falls back to the english keywords.
+    :param language: a language known by behave
+    :param kinds: the keyword kinds
+    """
+    words = set()
+    for kind in kinds:
+        words.update(word.strip() for word in languages[language].get(kind)
+                     or languages[DEFAULT_LANGUAGE].get(kind, ()))
+    words.discard("*")
+    if not words:
+        return _NEVER
+    # The longest keyword first: "Scenario Outline" before "Scenario"
+    alternatives = "|".join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+    return re.compile(rf"\s*({alternatives})\s*:")
@@ -0,0 +1,190 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+import csv
+import heapq
+import logging
+import tempfile
+from itertools import groupby
+from pathlib import Path
+from typing import Iterable, Iterator, List, TextIO
+
+from .csvformatter import _OUTLINE_NAME
+from .executionreport import iter_scenario_results, open_report
+from .fileutils import atomic_output
+
+log = logging.getLogger(__name__)
+
+CSV_FIELDS = ["epic", "feature_name", "scenario_id", "scenario_name", "status", "order"]
+# Sorted run layout: sequence number, the EaiCsv fields then the plain report scenario name
+_RUN_FIELDS = ["sequence", *CSV_FIELDS, "plain_name"]
+
+
+def _read_csv(file_path: str) -> Iterator[dict]:
+    """Read an EaiCsv (or EaiCsvFull) file row by row"""
+    # EaiCsvFull scenario rows only hold the feature filename, its feature row the name
+    feature_names = {}
+    with open(file_path, newline="", encoding="utf-8") as csv_file:
+        for row in csv.DictReader(csv_file):
+            if not any(row.get(field) for field in ("scenario_id", "scenario_name", "status")):
+                # EaiCsvFull epic and feature rows
+                if row.get("feature_filename") and row.get("feature_name"):
+                    feature_names[row["feature_filename"]] = row["feature_name"]
+                continue
+            feature = row.get("feature_name") or feature_names.get(row.get("feature_filename")) \
+                or row.get("feature_filename") or ""
+            yield {"epic": row.get("epic") or "",
+                   "feature_name": feature,
+                   "scenario_id": row.get("scenario_id") or "",
+                   "scenario_name": row.get("scenario_name") or "",
+                   "status": row.get("status") or "",
+                   "order": row.get("order") or "",
+                   "plain_name": ""}
+
+
+def _read_plain(file_path: str) -> Iterator[dict]:
+    """Read a behave plain report scenario by scenario"""
+    with open_report(file_path) as report_lines:
+        for result in iter_scenario_results(report_lines):
+            if result.scenario is None:
+                # Feature without scenario, nothing to merge
+                continue
+            # Outline rows are named as in the EaiCsv files: "name-subname" and order
+            match = _OUTLINE_NAME.match(result.scenario)
+            yield {"epic": "",
+                   "feature_name": result.feature,
+                   "scenario_id": "",
+                   "scenario_name": result.scenario if match is None
+                   else f"{match['name']}-{match['subname']}",
+                   "status": result.status,
+                   "order": "" if match is None else match["order"],
+                   "plain_name": result.scenario}
+
+
+def check_results(file_path: str):
+    """Raise an OSError or a ValueError if the file cannot be merged"""
+    if not Path(file_path).is_file():
+        raise FileNotFoundError(f"{file_path} is not an existing file")
+    if Path(file_path).suffix.lower() != ".csv":
+        return
+    with open(file_path, newline="", encoding="utf-8") as csv_file:
+        header = next(csv.reader(csv_file), [])
+    if "scenario_name" not in header:
+        raise ValueError(f"{file_path} is not an EaiCsv file, it has no scenario_name column")
+
+
+def read_results(file_path: str) -> Iterator[dict]:
+    """Read a result file, EaiCsv when its extension is .csv, behave plain report otherwise"""
+    if Path(file_path).suffix.lower() == ".csv":
+        return _read_csv(file_path)
+    return _read_plain(file_path)
+
+
+def _sort_key(row: dict):
+    return row["feature_name"], row["scenario_name"], row["order"], int(row["sequence"])
+
+
+def _merge_key(row: dict):
+    return row["feature_name"], row["scenario_name"], row["order"]
+
+
+def _plain_name(row: dict) -> str:
+    """Return the scenario name of a merged row as behave writes it in a plain report"""
+    if row["plain_name"] or not row["order"]:
+        return row["plain_name"] or row["scenario_name"]
+    # The EaiCsv files only hold "name-subname", the examples name is assumed without "-"
+    name, _, subname = row["scenario_name"].rpartition("-")
+    return f"{name} -- @{row['order']} {subname}"
+
+
+def _write_run(rows: List[dict], folder: str, index: int) -> str:
+    rows.sort(key=_sort_key)
+    run_path = f"{folder}/run_{index}.csv"
+    with open(run_path, "w", newline="", encoding="utf-8") as run_file:
+        writer = csv.DictWriter(run_file, _RUN_FIELDS)
+        writer.writerows(rows)
+    log.info(f"Sorted run {run_path} written with {len(rows)} rows")
+    return run_path
+
+
+def _read_run(run_path: str) -> Iterator[dict]:
+    with open(run_path, newline="", encoding="utf-8") as run_file:
+        yield from csv.DictReader(run_file, _RUN_FIELDS)
+
+
+def merge_rows(files: Iterable[str], chunk_size: int = 200000) -> Iterator[dict]:
+    """
+    Merge result files with a last-status-wins policy.
+
+    Rows are keyed by (feature name, scenario name, outline order) whatever the file format,
+    the outline rows of a plain report being named as in the EaiCsv files ("name-subname").
+    The later a row appears in the files, the higher its priority.
+    Rows are sorted by chunks into temporary runs which are merged back as a stream so that
+    the memory stays bounded by the chunk size.
+    :param files: result files (EaiCsv or behave plain report) by increasing priority
+    :param chunk_size: the maximum number of rows held in memory
+    :return: an iterator of EaiCsv rows sorted by merge key, with their plain report name
+    """
+    with tempfile.TemporaryDirectory(prefix="featurereporter_merge_") as folder:
+        runs = []
+        chunk = []
+        sequence = 0
+        for file_path in files:
+            log.info(f"Read results from {file_path}")
+            for row in read_results(file_path):
+                row["sequence"] = sequence
+                sequence += 1
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    runs.append(_write_run(chunk, folder, len(runs)))
+                    chunk = []
+        if chunk:
+            runs.append(_write_run(chunk, folder, len(runs)))
+        merged = heapq.merge(*[_read_run(run) for run in runs], key=_sort_key)
+        for _, group in groupby(merged, key=_merge_key):
+            group = list(group)
+            merged_row = {field: group[-1][field] for field in CSV_FIELDS}
+            # A csv row keeps the exact outline name reported by a plain report
+            merged_row["plain_name"] = _plain_name(
+                next((row for row in reversed(group) if row["plain_name"]), group[-1]))
+            yield merged_row
+
+
+def write_csv(rows: Iterable[dict], stream: TextIO):
+    """Write the merged rows in the EaiCsv format"""
+    writer = csv.DictWriter(stream, CSV_FIELDS, quoting=csv.QUOTE_ALL, extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def write_plain(rows: Iterable[dict], stream: TextIO):
+    """Write the merged rows as a behave plain report usable as execution report"""
+    for feature_name, scenarios in groupby(rows, key=lambda row: row["feature_name"]):
+        stream.write(f"Feature: {feature_name}\n")
+        for row in scenarios:
+            stream.write(f"\n  Scenario: {row['plain_name']}\n")
+            stream.write(f"    Status ... {row['status']}\n")
+        stream.write("\n")
+
+
+def merge_results(files: Iterable[str], output_file_name: str, chunk_size: int = 200000):
+    """
+    Merge result files into output_file_name.
+    The output is an EaiCsv file if its extension is .csv otherwise a behave plain report.
+    Every input is checked first and the output is replaced once complete: a failed merge
+    leaves the previous output untouched.
+    :param files: result files by increasing priority
+    :param output_file_name: the merged file
+    :param chunk_size: the maximum number of rows held in memory
+    :return: None
+    """
+    files = list(files)
+    for file_path in files:
+        check_results(file_path)
+    rows = merge_rows(files, chunk_size)
+    if Path(output_file_name).suffix.lower() == ".csv":
+        with atomic_output(output_file_name, "w", newline="", encoding="utf-8") as output:
+            write_csv(rows, output)
+    else:
+        with atomic_output(output_file_name, "w", encoding="utf-8") as output:
+            write_plain(rows, output)
+    log.info(f"Merged results written in {output_file_name}")
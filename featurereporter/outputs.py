@@ -0,0 +1,147 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+import csv
+import json
+import logging
+import os
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import List
+
+from .csvformatter import _OUTLINE_NAME, FeatureModel, ScenarioModel, _step_content, _tag_value
+
+log = logging.getLogger(__name__)
+
+CSV_COLUMNS = ["epic",
+               "feature_filename",
+               "feature_name",
+               "feature_tags",
+               "feature_description",
+               "scenario_id",
+               "scenario_name",
+               "scenario_tags",
+               "scenario_description",
+               "scenario_is_outline",
+               "scenario_steps"]
+
+
+class OutputWriter:
+    """
+    Output fed with each parsed feature during the generation.
+
+    The output is written in a temporary file which replaces the target file on close,
+    or is removed on discard, so that a failed generation leaves no partial output.
+    """
+    newline = None
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self.stream = None
+
+    def open(self, reporter):
+        """Start the output of the reporter (an ExportUtilities) generation"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.stream = open(self.__temporary, "w", newline=self.newline, encoding="utf-8")
+
+    def feature(self, path: str, feature, scenarios: List):
+        """Add a parsed feature and its selected scenarios"""
+        raise NotImplementedError
+
+    def close(self, statistics: dict):
+        """Complete the output with the generation statistics"""
+        self.stream.close()
+        os.replace(self.__temporary, self.path)
+        log.info(f"{self.path} written")
+
+    def discard(self):
+        if self.stream is not None and not self.stream.closed:
+            self.stream.close()
+        if os.path.exists(self.__temporary):
+            os.remove(self.__temporary)
+
+
+class ScenarioCsvWriter(OutputWriter):
+    """
+    Flat csv of the documented epics, features and scenarios with the EaiCsvFull columns.
+    Outline rows are expanded as on a behave dry-run with the eaicsv formatter.
+    """
+    newline = ""
+
+    def __init__(self, path: str, epic_tag: str = "epic=", scenario_tag: str = "id="):
+        super().__init__(path)
+        self.__epic_tag = epic_tag
+        self.__scenario_tag = scenario_tag
+        self.__repository = None
+        self.__writer = None
+        self.__epics = set()
+
+    def open(self, reporter):
+        super().open(reporter)
+        self.__repository = os.path.abspath(reporter.feature_repository)
+        self.__writer = csv.DictWriter(self.stream, CSV_COLUMNS, quoting=csv.QUOTE_ALL)
+        self.__writer.writeheader()
+
+    def feature(self, path: str, feature, scenarios: List):
+        epic = _tag_value(feature.tags, self.__epic_tag)
+        if epic not in self.__epics:
+            self.__epics.add(epic)
+            self.__writer.writerow({"epic": epic})
+        filename = os.path.relpath(os.path.abspath(path), self.__repository).replace(os.sep, "/")
+        feature_model = FeatureModel(feature.name, filename, epic, feature.tags,
+                                     feature.description)
+        self.__writer.writerow(feature_model.to_dict())
+        for scenario in scenarios:
+            scenario_id = _tag_value(scenario.tags, self.__scenario_tag)
+            if scenario.type == 'scenario_outline':
+                for row in scenario.scenarios:
+                    match = _OUTLINE_NAME.match(row.name)
+                    self.__add_scenario(row, f"{scenario_id}-{match['order']}",
+                                        f"{match['name']}-{match['subname']}", filename, True)
+            else:
+                self.__add_scenario(scenario, scenario_id, scenario.name, filename, False)
+
+    def __add_scenario(self, scenario, scenario_id, name, filename, is_outline):
+        scenario_model = ScenarioModel(scenario_id, name, filename, scenario.tags,
+                                       scenario.description, is_outline)
+        for step in scenario.steps:
+            scenario_model.steps = _step_content(step)
+        self.__writer.writerow(scenario_model.to_dict())
+
+
+class SummaryJsonWriter(OutputWriter):
+    """Json summary of the generation: counts by feature and tag, execution totals"""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.__summary = None
+        self.__tags = Counter()
+
+    def open(self, reporter):
+        super().open(reporter)
+        self.__summary = {"title": reporter.report_title,
+                          "repository": reporter.feature_repository,
+                          "generated": datetime.now().isoformat(timespec="seconds"),
+                          "features": []}
+
+    def feature(self, path: str, feature, scenarios: List):
+        self.__tags.update(feature.tags)
+        for scenario in scenarios:
+            self.__tags.update(scenario.tags)
+        self.__summary["features"].append(
+            {"name": feature.name,
+             "path": path,
+             "scenarios": len(scenarios),
+             "outlines": sum(scenario.type == 'scenario_outline' for scenario in scenarios)})
+
+    def close(self, statistics: dict):
+        json.dump({**self.__summary,
+                   "statistics": statistics,
+                   "tags": dict(self.__tags.most_common())},
+                  self.stream, indent=2)
+        super().close(statistics)
+
+
+OUTPUT_WRITERS = {".csv": ScenarioCsvWriter,
+                  ".json": SummaryJsonWriter}
@@ -0,0 +1,245 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+import json
+import logging
+import os
+import re
+import sys
+import threading
+from pathlib import Path
+from typing import Union
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows: the memory is not calibrated
+    resource = None
+
+from .events import Event
+from .fileutils import atomic_write_json
+from .keywords import DEFAULT_LANGUAGE, declared_language, is_known, keyword_line
+
+log = logging.getLogger(__name__)
+
+CALIBRATION_FILE = "timings.json"
+# Unit costs used until previous runs have been recorded
+DEFAULT_COSTS = {"discovery_per_file": 0.0005,
+                 "forewords_per_file": 0.05,
+                 "feature_per_scenario": 0.02,
+                 "diagram_rendered": 2.0,
+                 "diagram_cached": 0.005,
+                 "report_per_kb": 0.002,
+                 "save_per_scenario": 0.002,
+                 "memory_base": 80 * 1024 * 1024,
+                 "memory_per_scenario": 50 * 1024}
+# Weight of the last run in the calibrated costs
+SMOOTHING = 0.3
+
+# The process peak memory only measures a generation when it is the first and only one
+_GENERATIONS_GUARD = threading.Lock()
+_generations_started = 0
+# Generations of the process load, update and save the calibration one at a time
+_CALIBRATION_GUARD = threading.Lock()
+
+_WORKFLOW = re.compile(r'!!Workflow:\s*([\.\d\w\-\_\\\/]*)\s*')
+
+
+def count_generation():
+    """Count a generation started by the process, calibrated or not"""
+    global _generations_started
+    with _GENERATIONS_GUARD:
+        _generations_started += 1
+
+
+def _keyword_lines(language: str) -> tuple:
+    """Return the scenario outline, scenario and examples keyword line regexes of a language"""
+    return (keyword_line(language, "scenario_outline"),
+            keyword_line(language, "scenario"),
+            keyword_line(language, "examples"))
+
+
+def scan_feature(file_path: Union[str, Path]) -> dict:
+    """
+    Count the scenarios, outlines, examples rows and workflow references of a feature file
+    with a line scan (no gherkin parsing), in the behave keywords of its '# language:'.
+    A language unknown to behave is scanned with the english keywords.
+    """
+    counts = {"scenarios": 0, "outlines": 0, "example_rows": 0, "workflows": []}
+    in_examples = False
+    header_seen = False
+    outline_line, scenario_line, examples_line = _keyword_lines(DEFAULT_LANGUAGE)
+    with open(file_path, encoding="utf-8") as feature:
+        for line in feature:
+            stripped = line.strip()
+            if in_examples and stripped.startswith("|"):
+                # The first row of an examples table is its header
+                if header_seen:
+                    counts["example_rows"] += 1
+                header_seen = True
+                continue
+            in_examples = False
+            if outline_line.match(line):
+                counts["outlines"] += 1
+                counts["scenarios"] += 1
+            elif scenario_line.match(line):
+                counts["scenarios"] += 1
+            elif examples_line.match(line):
+                in_examples = True
+                header_seen = False
+            elif declared_language(line) and is_known(declared_language(line)):
+                outline_line, scenario_line, examples_line = _keyword_lines(declared_language(line))
+            else:
+                counts["workflows"].extend(_WORKFLOW.findall(line))
+    return counts
+
+
+class Calibration:
+    """Unit costs of the generation stages, averaged over the recorded runs"""
+
+    def __init__(self, calibration_file: Union[str, Path]):
+        self.__file = calibration_file
+        self.costs = dict(DEFAULT_COSTS)
+        self.runs = 0
+        if Path(calibration_file).is_file():
+            try:
+                with open(calibration_file, encoding="utf-8") as calibration:
+                    content = json.load(calibration)
+                self.costs.update(content["costs"])
+                self.runs = content["runs"]
+            except (OSError, ValueError, KeyError) as exception:
+                log.warning(f"Calibration {calibration_file} is discarded: {exception}")
+
+    def update(self, measures: dict):
+        """Blend the unit costs measured during a run"""
+        for name, value in measures.items():
+            if self.runs == 0 or name not in self.costs:
+                self.costs[name] = value
+            else:
+                self.costs[name] = (1 - SMOOTHING) * self.costs[name] + SMOOTHING * value
+        self.runs += 1
+
+    def save(self):
+        atomic_write_json(self.__file, {"runs": self.runs, "costs": self.costs})
+
+    def estimate(self, counts: dict) -> dict:
+        """
+        Return the estimated seconds per stage, the total and the memory budget
+        of a generation described by the plan counts.
+        """
+        costs = self.costs
+        diagrams = counts["diagrams"]
+        stages = {
+            "discovery": counts["files"] * costs["discovery_per_file"],
+            "forewords": (counts["forewords"]["files"] - counts["forewords"]["cached"])
+            * costs["forewords_per_file"],
+            "features": max(counts["scenarios"], counts["files"]) * costs["feature_per_scenario"],
+            "diagrams": (diagrams["to_render"] * costs["diagram_rendered"]
+                         + diagrams["cached"] * costs["diagram_cached"]),
+            "report": counts["report_bytes"] / 1024 * costs["report_per_kb"],
+            "save": counts["scenarios"] * costs["save_per_scenario"]}
+        return {"calibration_runs": self.runs,
+                "stages": {name: round(seconds, 3) for name, seconds in stages.items()},
+                "seconds": round(sum(stages.values()), 3),
+                "memory_bytes": int(costs["memory_base"]
+                                    + counts["scenarios"] * costs["memory_per_scenario"]
+                                    + counts["picture_bytes"])}
+
+
+class TimingsRecorder:
+    """
+    Listener measuring the unit costs of a generation from its events.
+    The calibration is updated when the generation finishes.
+    Diagram rendering time is excluded from the stage which triggered it.
+    The memory is not calibrated when the process runs several generations (batch, server),
+    see count_generation: its peak is not the one of a generation.
+    """
+
+    def __init__(self, calibration_file: Union[str, Path]):
+        self.__calibration_file = calibration_file
+        self.__guard = threading.Lock()
+        self.__totals = {}
+        self.__diagram_seconds = 0.0
+
+    def __add(self, name: str, seconds: float, units: float):
+        total = self.__totals.setdefault(name, [0.0, 0])
+        total[0] += seconds
+        total[1] += units
+
+    def __call__(self, event: Event):
+        if event.name.endswith("_started"):
+            if event.name in ("forewords_started", "feature_started"):
+                with self.__guard:
+                    self.__diagram_seconds = 0.0
+            return
+        if event.duration is None and event.name != "generation_finished":
+            return
+        with self.__guard:
+            self.__record(event)
+
+    def __record(self, event: Event):
+        data = event.data
+        if "error" in data:
+            return
+        if event.name == "diagram_finished":
+            self.__diagram_seconds += event.duration
+            self.__add("diagram_cached" if data.get("cached") else "diagram_rendered",
+                       event.duration, 1)
+        elif event.name == "discovery_finished":
+            self.__add("discovery_per_file", event.duration, data.get("files", 0))
+        elif event.name == "forewords_finished":
+            self.__add("forewords_per_file", max(event.duration - self.__diagram_seconds, 0),
+                       data.get("files", 0) - data.get("cached", 0))
+        elif event.name == "feature_finished":
+            # A feature costs at least one unit, even without scenario
+            self.__add("feature_per_scenario", max(event.duration - self.__diagram_seconds, 0),
+                       max(data.get("scenarios", 0), 1))
+        elif event.name == "report_finished" and data.get("path"):
+            self.__add("report_per_kb", event.duration,
+                       os.path.getsize(data["path"]) / 1024)
+        elif event.name == "save_finished":
+            self.__add("save", event.duration, 0)
+        elif event.name == "generation_finished":
+            self.__finish(data.get("scenarios", 0))
+
+    def __finish(self, scenarios: int):
+        measures = {name: seconds / units
+                    for name, (seconds, units) in self.__totals.items() if units > 0}
+        if "save" in self.__totals and scenarios:
+            measures["save_per_scenario"] = self.__totals["save"][0] / scenarios
+        with _GENERATIONS_GUARD:
+            alone = _generations_started == 1
+        if resource is not None and scenarios and alone:
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # Kilobytes on Linux, bytes on macOS
+            peak = peak if sys.platform == "darwin" else peak * 1024
+            measures["memory_per_scenario"] = max(peak - DEFAULT_COSTS["memory_base"], 0) \
+                / scenarios
+        self.__totals.clear()
+        if not measures:
+            return
+        with _CALIBRATION_GUARD:
+            calibration = Calibration(self.__calibration_file)
+            calibration.update(measures)
+            calibration.save()
+        log.info(f"Calibration updated with {sorted(measures)}")
+
+
+def format_plan(plan: dict) -> str:
+    """Return the plan as a human readable text"""
+    counts = plan["counts"]
+    estimate = plan["estimate"]
+    lines = [f"Features      {counts['files']} ({counts['scenarios']} scenarios, "
+             f"{counts['outlines']} outlines, {counts['example_rows']} examples rows)",
+             f"Forewords     {counts['forewords']['files']} "
+             f"({counts['forewords']['cached']} cached)",
+             f"Diagrams      {counts['diagrams']['to_render']} to render, "
+             f"{counts['diagrams']['cached']} cached, {counts['diagrams']['missing']} missing",
+             f"Pictures      {counts['picture_bytes'] / 1024:.0f} KB",
+             f"Report        {counts['report_bytes'] / 1024:.0f} KB",
+             "",
+             f"Estimation calibrated on {estimate['calibration_runs']} runs"]
+    for name, seconds in estimate["stages"].items():
+        lines.append(f"  {name:12} {seconds:10.1f} s")
+    lines.append(f"  {'total':12} {estimate['seconds']:10.1f} s")
+    lines.append(f"  {'memory':12} {estimate['memory_bytes'] / 1024 / 1024:10.0f} MB")
+    return "\n".join(lines)
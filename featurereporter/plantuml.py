@@ -0,0 +1,566 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+import argparse
+import hashlib
+import http.client
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Callable, List, Tuple, Union
+
+log = logging.getLogger(__name__)
+
+JAR_PATH = f"{os.path.dirname(os.path.realpath(__file__))}/assets/plantuml.jar"
+
+# Pictures not used for this long are evicted from the diagram cache
+MAX_AGE = 30 * 24 * 3600
+# The diagram cache is scanned for evictions at most once per interval
+PRUNE_INTERVAL = 3600
+
+# Local includes (the standard library <...> and the urls are not files)
+_INCLUDE = re.compile(rb"^\s*!include(?:_many|_once|sub)?\s+([^\s<][^\r\n]*?)\s*$",
+                      re.MULTILINE)
+
+
+def include_targets(source: Union[str, Path], content: Union[bytes, None] = None) -> List[Path]:
+    """
+    Return the files directly included by a puml file, relative paths being resolved from
+    the including file folder.
+    :param source: the puml file
+    :param content: the file content when already read, it is not read again
+    """
+    source = Path(source)
+    if content is None:
+        with open(source, "rb") as puml:
+            content = puml.read()
+    targets = []
+    for match in _INCLUDE.finditer(content):
+        target = match.group(1).decode("utf-8", errors="replace")
+        if "://" in target:
+            continue
+        # !includesub file!SUBPART
+        target = target.split("!", 1)[0]
+        targets.append((source.parent / target).resolve())
+    return targets
+
+
+def include_closure(source: Union[str, Path],
+                    content: Union[bytes, None] = None) -> List[Tuple[Path, Union[bytes, None]]]:
+    """
+    Return every file included by a puml file, directly or not, with its content
+    (None if the file is missing).
+    :param source: the puml file
+    :param content: the file content when already read, it is not read again
+    """
+    closure = []
+    visited = {Path(source).resolve()}
+    pending = include_targets(source, content)
+    while pending:
+        included = pending.pop(0)
+        if included in visited:
+            continue
+        visited.add(included)
+        try:
+            with open(included, "rb") as puml:
+                included_content = puml.read()
+        except OSError:
+            closure.append((included, None))
+            continue
+        closure.append((included, included_content))
+        pending.extend(include_targets(included, included_content))
+    return closure
+
+
+class PlantUmlRenderer:
+    """
+    Render PlantUML diagrams into png pictures.
+
+    The JRE is probed once. Pictures are cached by the hash of the diagram and of its
+    includes so a diagram is rendered once whatever the number of references or of documents
+    sharing the renderer. Pictures unused for max_age seconds are evicted.
+    The renderer is thread safe.
+    """
+
+    def __init__(self, jar_path: str = JAR_PATH, cache_folder: Union[str, Path, None] = None,
+                 max_age: float = MAX_AGE):
+        self.__jar_path = jar_path
+        self.__cache_folder = Path(cache_folder or
+                                   f"{tempfile.gettempdir()}/featurereporter/diagrams")
+        self.__max_age = max_age
+        self.__pruned = 0.0
+        self.__available = None
+        self.__guard = threading.Lock()
+        self.__locks = {}
+
+    @property
+    def jar_path(self) -> str:
+        return self.__jar_path
+
+    @property
+    def cache_folder(self) -> Path:
+        return self.__cache_folder
+
+    @property
+    def available(self) -> bool:
+        """True if a JRE is installed"""
+        with self.__guard:
+            if self.__available is None:
+                try:
+                    version = subprocess.check_output(['java', '-version'],
+                                                      stderr=subprocess.STDOUT)
+                except Exception as exception:
+                    log.warning(f"Check java version error\n JRE might not be installed."
+                                f"\n Subprocess spawn {exception.args}")
+                    version = ""
+                self.__available = bool(version)
+        return self.__available
+
+    def __lock(self, key: str) -> threading.Lock:
+        with self.__guard:
+            return self.__locks.setdefault(key, threading.Lock())
+
+    def render_file(self, source: Union[str, Path],
+                    postprocess: Callable[[Path], None] = None,
+                    timeout: Union[float, None] = None,
+                    content: Union[bytes, None] = None) -> Tuple[Path, bool]:
+        """
+        Render a puml file. The file is rendered in place so that relative includes work.
+        :param source: the puml file
+        :param postprocess: called once on a freshly rendered picture (e.g. resize)
+        :param timeout: seconds before the rendering is killed and a TimeoutError raised
+        :param content: the file content when already read, it is not read again
+        :return: the picture path and True if it has been rendered, False if cached
+        """
+        source = Path(source).resolve()
+        return self.__render(self.__file_digest(source, content), source, None, postprocess,
+                             timeout)
+
+    def render_text(self, text: str,
+                    postprocess: Callable[[Path], None] = None,
+                    timeout: Union[float, None] = None) -> Tuple[Path, bool]:
+        """
+        Render an inline diagram.
+        :param text: the diagram source
+        :param postprocess: called once on a freshly rendered picture (e.g. resize)
+        :param timeout: seconds before the rendering is killed and a TimeoutError raised
+        :return: the picture path and True if it has been rendered, False if cached
+        """
+        return self.__render(self.__text_digest(text), None, text, postprocess, timeout)
+
+    @staticmethod
+    def __file_digest(source: Path, content: Union[bytes, None] = None) -> str:
+        if content is None:
+            with open(source, "rb") as puml:
+                content = puml.read()
+        digest = hashlib.sha256(content)
+        digest.update(str(source).encode("utf-8"))
+        # A changed include changes the picture
+        for included, included_content in include_closure(source, content):
+            digest.update(b"\0" + str(included).encode("utf-8") + b"\0")
+            digest.update(b"missing" if included_content is None else
+                          hashlib.sha256(included_content).digest())
+        return digest.hexdigest()
+
+    @staticmethod
+    def __text_digest(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def __picture(self, digest: str) -> Path:
+        return self.__cache_folder / f"{digest[:32]}.png"
+
+    def cached_file(self, source: Union[str, Path]) -> Union[Path, None]:
+        """Return the cached picture of a puml file, None if it must be rendered"""
+        picture = self.__picture(self.__file_digest(Path(source).resolve()))
+        return picture if picture.is_file() else None
+
+    def cached_text(self, text: str) -> Union[Path, None]:
+        """Return the cached picture of an inline diagram, None if it must be rendered"""
+        picture = self.__picture(self.__text_digest(text))
+        return picture if picture.is_file() else None
+
+    def prune(self):
+        """Evict the pictures, and the leftovers of killed renderings, unused for max_age"""
+        limit = time.time() - self.__max_age
+        try:
+            entries = list(os.scandir(self.__cache_folder))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            try:
+                if entry.stat().st_mtime >= limit:
+                    continue
+                if entry.is_dir():
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                elif entry.name.endswith(".png"):
+                    os.remove(entry.path)
+            except OSError:
+                # Used or evicted by another process meanwhile
+                pass
+
+    def __prune_periodically(self):
+        with self.__guard:
+            now = time.time()
+            if now - self.__pruned < PRUNE_INTERVAL:
+                return
+            self.__pruned = now
+        self.prune()
+
+    def __render(self, digest: str, source: Union[Path, None], text: Union[str, None],
+                 postprocess: Callable[[Path], None],
+                 timeout: Union[float, None]) -> Tuple[Path, bool]:
+        self.__prune_periodically()
+        picture = self.__picture(digest)
+        with self.__lock(digest):
+            if picture.is_file():
+                try:
+                    # The modification time tracks the last use for the eviction
+                    os.utime(picture)
+                    return picture, False
+                except FileNotFoundError:
+                    pass
+            self.__cache_folder.mkdir(parents=True, exist_ok=True)
+            work_folder = Path(tempfile.mkdtemp(prefix="render_", dir=self.__cache_folder))
+            try:
+                if source is None:
+                    source = work_folder / "inline.puml"
+                    with open(source, "w", encoding="utf-8") as puml:
+                        puml.write(text)
+                self._run(source, work_folder, timeout)
+                generated = sorted(work_folder.glob("*.png"))
+                if not generated:
+                    raise FileNotFoundError(f"PlantUML produced no picture for {source}")
+                if postprocess is not None:
+                    postprocess(generated[0])
+                os.replace(generated[0], picture)
+            finally:
+                shutil.rmtree(work_folder, ignore_errors=True)
+            return picture, True
+
+    def _run(self, source: Path, output_folder: Path, timeout: Union[float, None] = None):
+        """
+        Run PlantUML on the source, the picture is written in the output folder.
+        The JVM is killed after timeout seconds.
+        """
+        try:
+            subprocess.run(
+                ["java", "-Djava.awt.headless=true",
+                 "-jar", Path(self.__jar_path).absolute(),
+                 source,
+                 "-o", output_folder.absolute()],
+                timeout=timeout)
+        except subprocess.TimeoutExpired as expired:
+            raise TimeoutError(f"PlantUML did not render {source} within {timeout:.1f} s") \
+                from expired
+
+
+_PLANTUML_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz-_"
+
+
+def encode_diagram(text: str) -> str:
+    """Encode a diagram source for the PlantUML urls (raw deflate and PlantUML base64)"""
+    data = zlib.compress(text.encode("utf-8"), 9)[2:-4]
+    encoded = []
+    for index in range(0, len(data), 3):
+        chunk = data[index:index + 3].ljust(3, b"\0")
+        value = (chunk[0] << 16) | (chunk[1] << 8) | chunk[2]
+        encoded.extend(_PLANTUML_ALPHABET[(value >> shift) & 0x3F] for shift in (18, 12, 6, 0))
+    return "".join(encoded)
+
+
+class PlantUmlDaemon:
+    """
+    A long-lived PlantUML '-picoweb' server shared by the runs of a machine.
+
+    The server is started by a detached supervisor process (see main) which stops it once it
+    has not been used for idle_timeout seconds. Its port is published in a state file of the
+    state folder, the next runs reuse it. Requests go through a small connection pool.
+    """
+
+    def __init__(self, jar_path: str = JAR_PATH,
+                 state_folder: Union[str, Path, None] = None,
+                 idle_timeout: int = 900,
+                 pool_size: int = 4,
+                 start_timeout: int = 60):
+        self.__jar_path = jar_path
+        self.__state_folder = Path(state_folder or f"{tempfile.gettempdir()}/featurereporter")
+        self.__idle_timeout = idle_timeout
+        self.__start_timeout = start_timeout
+        self.__pool = queue.LifoQueue(pool_size)
+        self.__port = None
+        self.__guard = threading.Lock()
+
+    @property
+    def state_file(self) -> Path:
+        return self.__state_folder / "plantuml_daemon.json"
+
+    @property
+    def last_use_file(self) -> Path:
+        return self.__state_folder / "plantuml_daemon.last_use"
+
+    def __read_port(self) -> Union[int, None]:
+        try:
+            with open(self.state_file, encoding="utf-8") as state:
+                return int(json.load(state)["port"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    @staticmethod
+    def __alive(port: int) -> bool:
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+        try:
+            connection.request("GET", "/")
+            connection.getresponse().read()
+            return True
+        except (OSError, http.client.HTTPException):
+            return False
+        finally:
+            connection.close()
+
+    def __touch(self):
+        self.last_use_file.touch()
+
+    def ensure_running(self) -> int:
+        """Return the port of a running server, start one if needed"""
+        with self.__guard:
+            if self.__port is not None:
+                return self.__port
+            self.__state_folder.mkdir(parents=True, exist_ok=True)
+            port = self.__read_port()
+            if port is None or not self.__alive(port):
+                port = self.__start()
+            self.__port = port
+            self.__touch()
+            return port
+
+    def __start(self) -> int:
+        lock_file = self.__state_folder / "plantuml_daemon.lock"
+        deadline = time.monotonic() + self.__start_timeout
+        port = self.__lock_start(lock_file, deadline)
+        if port is not None:
+            return port
+        try:
+            port = self.__free_port()
+            log.info(f"Start the PlantUML daemon on port {port}")
+            self.__touch()
+            self.__spawn_supervisor(port)
+            while time.monotonic() < deadline:
+                if self.__alive(port):
+                    return port
+                time.sleep(0.2)
+            raise TimeoutError(f"PlantUML daemon did not answer on port {port}")
+        finally:
+            # A run finding the lock stale may have removed it meanwhile
+            try:
+                lock_file.unlink()
+            except FileNotFoundError:
+                pass
+
+    def __lock_start(self, lock_file: Path, deadline: float) -> Union[int, None]:
+        """
+        Take the start lock, None once taken. Return the port of the server started by another
+        run meanwhile.
+        """
+        while True:
+            try:
+                os.close(os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return None
+            except FileExistsError:
+                pass
+            # Another run is starting the server, unless its lock is stale
+            try:
+                if time.time() - lock_file.stat().st_mtime > self.__start_timeout:
+                    lock_file.unlink()
+            except OSError:
+                pass
+            time.sleep(0.2)
+            port = self.__read_port()
+            if port is not None and self.__alive(port):
+                return port
+            if time.monotonic() > deadline:
+                raise TimeoutError("PlantUML daemon start is locked by another run")
+
+    @staticmethod
+    def __free_port() -> int:
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            return probe.getsockname()[1]
+
+    def __spawn_supervisor(self, port: int):
+        """Start the detached supervisor process, which starts the server"""
+        options = {"start_new_session": True}
+        if os.name == "nt":
+            options = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP
+                       | subprocess.DETACHED_PROCESS}
+        subprocess.Popen([sys.executable, "-m", "featurereporter.plantuml",
+                          "--jar", str(self.__jar_path),
+                          "--port", str(port),
+                          "--state-folder", str(self.__state_folder),
+                          "--idle-timeout", str(self.__idle_timeout)],
+                         stdin=subprocess.DEVNULL,
+                         stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL,
+                         **options)
+
+    def render(self, text: str, timeout: Union[float, None] = None) -> bytes:
+        """
+        Return the png picture of the diagram.
+        A TimeoutError is raised when the server does not answer within timeout seconds (60 by
+        default) or cannot be started.
+        """
+        path = f"/plantuml/png/{encode_diagram(text)}"
+        timeout = 60 if timeout is None else timeout
+        for attempt in range(2):
+            try:
+                port = self.ensure_running()
+            except TimeoutError as expired:
+                if not attempt:
+                    raise
+                # Only a request timeout is reported as a TimeoutError
+                raise ConnectionError("PlantUML daemon could not be restarted") from expired
+            connection = self.__connection(port, timeout)
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                body = response.read()
+            except socket.timeout as expired:
+                # The server is busy with this diagram: retrying would wait as long
+                connection.close()
+                raise TimeoutError(f"PlantUML daemon did not answer within {timeout:.1f} s") \
+                    from expired
+            except (OSError, http.client.HTTPException):
+                # Stale connection or stopped server: check the server again then retry once
+                connection.close()
+                self.__forget()
+                if attempt:
+                    raise
+                continue
+            self.__release(connection)
+            self.__touch()
+            if response.status != 200 or not body.startswith(b"\x89PNG"):
+                raise RuntimeError(f"PlantUML daemon answered {response.status}")
+            return body
+
+    def __connection(self, port: int, timeout: float) -> http.client.HTTPConnection:
+        """Return a pooled or new connection with the timeout"""
+        try:
+            connection = self.__pool.get_nowait()
+        except queue.Empty:
+            connection = http.client.HTTPConnection("127.0.0.1", port)
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        return connection
+
+    def __release(self, connection: http.client.HTTPConnection):
+        """Return a connection to the pool, close it if the pool is full"""
+        try:
+            self.__pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def __forget(self):
+        with self.__guard:
+            self.__port = None
+        self.close()
+
+    def close(self):
+        """Close the pooled connections, the server keeps running for the next runs"""
+        while True:
+            try:
+                self.__pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class PlantUmlDaemonRenderer(PlantUmlRenderer):
+    """
+    Renderer using a PlantUmlDaemon instead of a JVM per diagram.
+    Diagrams with includes, which the server cannot resolve, and daemon failures fall back
+    to the command line.
+    """
+
+    def __init__(self, jar_path: str = JAR_PATH, cache_folder: Union[str, Path, None] = None,
+                 daemon: PlantUmlDaemon = None, max_age: float = MAX_AGE):
+        super().__init__(jar_path, cache_folder, max_age)
+        self.__daemon = daemon or PlantUmlDaemon(jar_path)
+
+    @property
+    def daemon(self) -> PlantUmlDaemon:
+        return self.__daemon
+
+    def _run(self, source: Path, output_folder: Path, timeout: Union[float, None] = None):
+        with open(source, encoding="utf-8") as puml:
+            text = puml.read()
+        if "!include" not in text:
+            try:
+                self.__daemon.ensure_running()
+            except (OSError, TimeoutError) as exception:
+                log.warning(f"PlantUML daemon not started, use the command line: {exception}")
+            else:
+                try:
+                    picture = self.__daemon.render(text, timeout)
+                    with open(output_folder / f"{source.stem}.png", "wb") as png:
+                        png.write(picture)
+                    return
+                except TimeoutError as expired:
+                    # The command line would not be faster
+                    raise TimeoutError(f"PlantUML daemon timed out on {source}") from expired
+                except (OSError, RuntimeError, http.client.HTTPException) as exception:
+                    log.warning(f"PlantUML daemon failed on {source}, use the command line: "
+                                f"{exception}")
+        super()._run(source, output_folder, timeout)
+
+
+def main():
+    """Supervise a PlantUML picoweb server and stop it once idle"""
+    parser = argparse.ArgumentParser(description="PlantUML daemon supervisor")
+    parser.add_argument("--jar", default=JAR_PATH)
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--state-folder", required=True)
+    parser.add_argument("--idle-timeout", type=int, default=900)
+    args = parser.parse_args()
+    daemon = PlantUmlDaemon(args.jar, args.state_folder)
+    server = subprocess.Popen(["java", "-Djava.awt.headless=true",
+                               "-jar", args.jar,
+                               f"-picoweb:{args.port}:127.0.0.1"],
+                              stdin=subprocess.DEVNULL,
+                              stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    with open(daemon.state_file, "w", encoding="utf-8") as state:
+        json.dump({"port": args.port, "pid": server.pid, "supervisor": os.getpid()}, state)
+    try:
+        while server.poll() is None:
+            time.sleep(min(5, args.idle_timeout))
+            try:
+                idle = time.time() - daemon.last_use_file.stat().st_mtime
+            except OSError:
+                idle = args.idle_timeout
+            if idle >= args.idle_timeout:
+                break
+    finally:
+        server.terminate()
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        try:
+            with open(daemon.state_file, encoding="utf-8") as state:
+                if json.load(state).get("supervisor") == os.getpid():
+                    daemon.state_file.unlink()
+        except (OSError, ValueError):
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+import logging
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Iterable, Iterator, Tuple, Union
+
+log = logging.getLogger(__name__)
+
+# Items read ahead by default
+DEFAULT_DEPTH = 8
+
+
+class Prefetcher:
+    """
+    Load items (e.g. read files) in a thread pool ahead of their consumer, which gets them
+    in order. At most depth items, the one being consumed included, are loaded or loading at a
+    time so the memory stays bounded.
+
+    Use it as a context manager: leaving the block cancels the loads not started.
+
+    >>> with Prefetcher(files, read_file, depth=8) as prefetched:
+    ...     for file, content in prefetched:
+    ...         content.result()
+    """
+
+    def __init__(self, items: Iterable, load: Callable, depth: int = DEFAULT_DEPTH,
+                 workers: Union[int, None] = None):
+        self.__items = iter(items)
+        self.__load = load
+        self.__depth = max(depth, 1)
+        self.__workers = workers or min(self.__depth, 8)
+        self.__pending: Deque[Tuple[object, Future]] = deque()
+        self.__executor = None
+
+    def __enter__(self):
+        self.__executor = ThreadPoolExecutor(max_workers=self.__workers,
+                                             thread_name_prefix="prefetch")
+        for _ in range(self.__depth):
+            if not self.__submit():
+                break
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for _, future in self.__pending:
+            future.cancel()
+        self.__pending.clear()
+        self.__executor.shutdown(wait=True)
+
+    def __submit(self) -> bool:
+        try:
+            item = next(self.__items)
+        except StopIteration:
+            return False
+        self.__pending.append((item, self.__executor.submit(self.__load, item)))
+        return True
+
+    def __iter__(self) -> Iterator[Tuple[object, Future]]:
+        """
+        Yield each item with the future of its load, in the items order.
+        The future result raises the load exception, if any.
+        """
+        while self.__pending:
+            item, future = self.__pending.popleft()
+            yield item, future
+            # The consumer is done with this item: load the next one in its place
+            self.__submit()
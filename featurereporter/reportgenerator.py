@@ -1,48 +1,139 @@
 # -*- Product under GNU GPL v3 -*-
 # -*- Author: E.Aivayan -*-
+import csv
 import glob
+import hashlib
 import logging
 import os
 import platform
 import re
-import subprocess
+import shutil
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
 from pathlib import Path
-from shutil import copyfile
-from typing import Tuple, Union
+from typing import IO, List, Tuple, Union
 
-from behave.parser import parse_file
+from behave.parser import parse_feature
 from docx import Document
-from htmldocx import HtmlToDocx
 from markdown_it import MarkdownIt
-from matplotlib import pyplot as plt
+from matplotlib.figure import Figure
 from PIL import Image
 
+from .discovery import FeatureDiscovery
+from .docxsave import save_document
+from .events import EventEmitter
+from .executionreport import FAILED, FEATURE, PASSED, SCENARIO, SKIPPED, aggregate_status, \
+    classify_line, element_name, index_results, iter_scenario_results, open_report
+from .fingerprint import FingerprintStore, InputFingerprint, ReferenceIndex
+from .forewordscache import ForewordRecord, ForewordsCache
+from .history import HistoryStore
+from .imagecache import CachedHtmlToDocx, ImageCache
+from .outputs import OUTPUT_WRITERS, OutputWriter
+from .planning import (_WORKFLOW, CALIBRATION_FILE, Calibration, TimingsRecorder,
+                       count_generation, scan_feature)
+from .plantuml import PlantUmlRenderer, include_closure, include_targets
+from .prefetch import DEFAULT_DEPTH, Prefetcher
+from .tagindex import TagExpression, TagIndex, matching_scenarios
+from .traceability import TraceabilityMatrix
+from .version import __version__
+
 log = logging.getLogger(__name__)
 
 
+class GenerationCancelled(Exception):
+    """Raised when a generation is cancelled, the document is not saved"""
+
+
+class GenerationTimeout(TimeoutError):
+    """Raised when a feature or the whole generation exceeds its time budget"""
+
+
+def _workflows(file_path: str) -> List[str]:
+    """Return the diagrams referenced by a feature file or a foreword section"""
+    with open(file_path, encoding="utf-8") as text_file:
+        return _WORKFLOW.findall(text_file.read())
+
+
+def _parser_filename(file: str) -> str:
+    """
+    Return the file name given to the behave parser. On Windows, behave 1.2.6 fails
+    (os.path.relpath) on a file of another drive than the current folder: the parser gets the
+    name of a file of the current folder instead, like the copy formerly parsed.
+    """
+    if platform.system() == "Windows":
+        current = os.path.abspath(os.getcwd())
+        if os.path.splitdrive(current)[0].lower() != \
+                os.path.splitdrive(os.path.abspath(file))[0].lower():
+            return os.path.join(current, os.path.basename(file))
+    return file
+
+
+def _timeout_cause(exception: BaseException) -> Union[GenerationTimeout, None]:
+    """Return the GenerationTimeout behind an exception (the methods re-raise with a cause)"""
+    while exception is not None:
+        if isinstance(exception, GenerationTimeout):
+            return exception
+        exception = exception.__cause__
+    return None
+
+
 class ExportUtilities:
 
     def __init__(self, feature_repository: str = None,
                  user_story_tag_prefix: str = None,
-                 report_title: str = None):
+                 report_title: str = None,
+                 renderer: PlantUmlRenderer = None):
         self.__feature_repository = feature_repository
         self.__user_story_tag_prefix = user_story_tag_prefix
         self.__report_title = report_title
         self.__document = None
-        try:
-            version = subprocess.check_output(['java', '-version'], stderr=subprocess.STDOUT)
-        except Exception as exception:
-            log.warning(f"Check java version error\n JRE might not be installed."
-                        f"\n Subprocess spawn {exception.args}")
-            version = ""
-
-        self.__jre_present = bool(version)
-        self.__jar_path = f"{os.path.dirname(os.path.realpath(__file__))}/assets/plantuml.jar"
+        # A renderer may be shared between instances so that the JRE is probed once
+        # and the rendered diagrams are reused
+        self.__renderer = renderer or PlantUmlRenderer()
         self.__current_feature_tags = None
         self.__include_result = False
         self.__forewords_folder = None
-        self.__inline_counter = 0
+        self.__tag_expression = TagExpression()
+        self.__cache_folder = f"{tempfile.gettempdir()}/featurereporter"
+        self.__events = EventEmitter()
+        self.__workspace = None
+        self.__shard = (1, 1)
+        self.__inline_results = False
+        self.__history = None
+        self.__max_table_rows = None
+        self.__compression = None
+        self.__diagram_timeout = None
+        self.__feature_timeout = None
+        self.__deadline = None
+        self.__deadline_at = None
+        self.__feature_deadline = None
+        self.__failures = []
+        self.__errors = 0
+        self.__timed_out_diagrams = set()
+        self.__force = False
+        self.__calibrate = False
+        self.__traceability = False
+        self.__traceability_csv = None
+        self.__matrix = None
+        self.__up_to_date = False
+        self.__prefetch_depth = DEFAULT_DEPTH
+        self.__feature_diagrams = {}
+        self.__overflow_folder = None
+        self.__overflow_count = 0
+        self.__execution = None
+        self.__images = None
+        self.__results = None
+        self.__report_section = None
+        self.__workers = None
+        self.__locks_guard = threading.Lock()
+        self.__diagram_locks = {}
+        self.__diagram_count = 0
+        self.__scenario_count = 0
+        self.__cancel_requested = threading.Event()
 
     @property
     def feature_repository(self):
@@ -90,10 +181,235 @@ class ExportUtilities:
         else:
             raise FileExistsError(f"{folder} is not a existing folder")
 
+    @property
+    def include_tags(self) -> TagExpression:
+        return self.__tag_expression
+
+    @include_tags.setter
+    def include_tags(self, expressions: Union[List[str], None]):
+        try:
+            self.__tag_expression = TagExpression(expressions)
+        except ValueError as exception:
+            raise AttributeError(str(exception)) from exception
+
+    @property
+    def cache_folder(self) -> str:
+        return self.__cache_folder
+
+    @cache_folder.setter
+    def cache_folder(self, folder: str):
+        if isinstance(folder, str) and folder:
+            self.__cache_folder = folder
+        else:
+            raise AttributeError(f"{folder} must be a non empty string")
+
+    @property
+    def shard(self) -> Tuple[int, int]:
+        """The (index, count) part of the document generated, index starting at 1"""
+        return self.__shard
+
+    @shard.setter
+    def shard(self, shard: Tuple[int, int]):
+        index, count = shard
+        if isinstance(index, int) and isinstance(count, int) and 1 <= index <= count:
+            self.__shard = (index, count)
+        else:
+            raise AttributeError(f"{index}/{count} must be a shard index between 1 and the count")
+
+    @property
+    def inline_results(self) -> bool:
+        """Stamp the last execution status under each scenario title"""
+        return self.__inline_results
+
+    @inline_results.setter
+    def inline_results(self, inline: bool):
+        self.__inline_results = bool(inline)
+
+    @property
+    def history(self) -> Union[str, None]:
+        """The sqlite history database the execution reports are appended to"""
+        return self.__history
+
+    @history.setter
+    def history(self, database: Union[str, None]):
+        if database is None or (isinstance(database, str) and database):
+            self.__history = database
+        else:
+            raise AttributeError(f"{database} must be a non empty string")
+
+    @property
+    def max_table_rows(self) -> Union[int, None]:
+        """Tables with more rows only show the first ones, the full table is written as csv"""
+        return self.__max_table_rows
+
+    @max_table_rows.setter
+    def max_table_rows(self, rows: Union[int, None]):
+        if rows is None or (isinstance(rows, int) and rows > 0):
+            self.__max_table_rows = rows
+        else:
+            raise AttributeError(f"{rows} must be a positive integer")
+
+    @property
+    def compression(self) -> Union[int, None]:
+        """
+        The document compression level: 0 stores the parts, 1 (fast) to 9 (small) deflates them,
+        None uses the zlib default. Pictures are stored whatever the level.
+        """
+        return self.__compression
+
+    @compression.setter
+    def compression(self, level: Union[int, None]):
+        if level is None or (isinstance(level, int) and 0 <= level <= 9):
+            self.__compression = level
+        else:
+            raise AttributeError(f"{level} must be an integer from 0 to 9")
+
+    @staticmethod
+    def __check_seconds(seconds: Union[float, None]) -> Union[float, None]:
+        if seconds is None or (isinstance(seconds, (int, float)) and seconds > 0):
+            return seconds
+        raise AttributeError(f"{seconds} must be a positive number of seconds")
+
+    @property
+    def diagram_timeout(self) -> Union[float, None]:
+        """Seconds before a diagram rendering is killed, the diagram is replaced by a note"""
+        return self.__diagram_timeout
+
+    @diagram_timeout.setter
+    def diagram_timeout(self, seconds: Union[float, None]):
+        self.__diagram_timeout = self.__check_seconds(seconds)
+
+    @property
+    def feature_timeout(self) -> Union[float, None]:
+        """Seconds allowed to document a feature, a late feature is replaced by a note"""
+        return self.__feature_timeout
+
+    @feature_timeout.setter
+    def feature_timeout(self, seconds: Union[float, None]):
+        self.__feature_timeout = self.__check_seconds(seconds)
+
+    @property
+    def deadline(self) -> Union[float, None]:
+        """Seconds allowed to the generation, the features left are skipped and listed"""
+        return self.__deadline
+
+    @deadline.setter
+    def deadline(self, seconds: Union[float, None]):
+        self.__deadline = self.__check_seconds(seconds)
+
+    @property
+    def traceability(self) -> bool:
+        """Add the user story traceability matrix (us_tag needed) to the document"""
+        return self.__traceability
+
+    @traceability.setter
+    def traceability(self, traceability: bool):
+        self.__traceability = bool(traceability)
+
+    @property
+    def traceability_csv(self) -> Union[str, None]:
+        """Csv file the user story traceability matrix (us_tag needed) is written to"""
+        return self.__traceability_csv
+
+    @traceability_csv.setter
+    def traceability_csv(self, csv_file: Union[str, None]):
+        if csv_file is None or (isinstance(csv_file, str) and csv_file):
+            self.__traceability_csv = csv_file
+        else:
+            raise AttributeError(f"{csv_file} must be a non empty string")
+
+    @property
+    def prefetch_depth(self) -> int:
+        """Number of feature files read ahead (with their diagrams) while a feature is processed"""
+        return self.__prefetch_depth
+
+    @prefetch_depth.setter
+    def prefetch_depth(self, depth: int):
+        if isinstance(depth, int) and depth > 0:
+            self.__prefetch_depth = depth
+        else:
+            raise AttributeError(f"{depth} must be a positive integer")
+
+    @property
+    def force(self) -> bool:
+        """Generate even if the inputs did not change since the outputs were generated"""
+        return self.__force
+
+    @force.setter
+    def force(self, force: bool):
+        self.__force = bool(force)
+
+    @property
+    def calibrate(self) -> bool:
+        """Record the stage timings of the generations in the calibration of the plans"""
+        return self.__calibrate
+
+    @calibrate.setter
+    def calibrate(self, calibrate: bool):
+        self.__calibrate = bool(calibrate)
+
+    @property
+    def up_to_date(self) -> bool:
+        """True when the last generation found its outputs up to date and generated nothing"""
+        return self.__up_to_date
+
+    @property
+    def failures(self) -> List[Tuple[str, str, str]]:
+        """The (kind, item, reason) of the items missing from the last generation"""
+        return list(self.__failures)
+
+    @property
+    def errors(self) -> int:
+        """The number of features of the last generation which failed on an error"""
+        return self.__errors
+
+    @property
+    def workspace(self) -> Union[str, None]:
+        """The private temporary folder of the running generation"""
+        return self.__workspace
+
+    @property
+    def renderer(self) -> PlantUmlRenderer:
+        return self.__renderer
+
+    @property
+    def workers(self) -> Union[int, None]:
+        return self.__workers
+
+    @workers.setter
+    def workers(self, workers: Union[int, None]):
+        if workers is None or (isinstance(workers, int) and workers > 0):
+            self.__workers = workers
+        else:
+            raise AttributeError(f"{workers} must be a positive integer or None")
+
     @property
     def document(self):
         return self.__document
 
+    @property
+    def events(self) -> EventEmitter:
+        return self.__events
+
+    def cancel(self):
+        """Request the running generation to stop before the next feature"""
+        self.__cancel_requested.set()
+
+    def __diagram_lock(self, key: str) -> threading.Lock:
+        """Return the lock serializing the generation of a given picture"""
+        with self.__locks_guard:
+            return self.__diagram_locks.setdefault(key, threading.Lock())
+
+    def __count_diagram(self):
+        with self.__locks_guard:
+            self.__diagram_count += 1
+
+    def _cache_file(self, name: str) -> str:
+        """Return the path of a json cache file dedicated to the feature repository"""
+        repository_key = hashlib.sha1(
+            os.path.abspath(self.__feature_repository).encode("utf-8")).hexdigest()
+        return f"{self.cache_folder}/{name}_{repository_key[:12]}.json"
+
     def _get_level(self, level_name: str) -> int:
         """Return the effective level depending on the inclusion (asis or +1)"""
         level = {"h1": 1,
@@ -103,44 +419,113 @@ class ExportUtilities:
                  "h5": 5}
         return level[level_name] + 1 if self.__include_result else level[level_name]
 
-    def __forewords_schema_replacement(self, match_obj):
+    def __forewords_schema_replacement(self, record: ForewordRecord, match_obj):
         """Replace schema tags with the generated schema picture"""
-        generated_path = self.__generate_diagrams(match_obj.group(1), False)
+        record.depends_on(f"{self.forewords_folder}/{match_obj.group(1)}")
+        try:
+            generated_path = self.__generate_diagrams(match_obj.group(1), False)
+        except Exception as exception:
+            # Past the generation deadline, the forewords diagrams are not rendered
+            timeout = _timeout_cause(exception)
+            if timeout is None:
+                raise
+            self.__record_failure("diagram", match_obj.group(1), str(timeout))
+            generated_path = None
+        if generated_path is None:
+            # Rendered again by the next run
+            record.complete = False
+            return self.__diagram_placeholder(match_obj.group(1))
+        # A changed include changes the picture
+        for included, _ in include_closure(f"{self.forewords_folder}/{match_obj.group(1)}"):
+            record.depends_on(included)
         generated_path = re.sub(r'\\', '/', generated_path)
+        record.images.append(generated_path)
         return f"\n![Schema]({generated_path})\n"
 
-    def __forewords_inline_puml(self, match_obj):
+    def __forewords_inline_puml(self, record: ForewordRecord, match_obj):
         """Generate inline puml and insert"""
-        if self.__jre_present:
-            current = self.__inline_counter
-            temp_puml = Path(f"{tempfile.gettempdir()}/inline_p_{current}.puml")
-            temp_puml = temp_puml.resolve()
-            with open(temp_puml, "w") as file:
-                file.write(match_obj.group(1))
-            subprocess.run(
-                ["java", "-Djava.awt.headless=true",
-                 "-jar", Path(self.__jar_path).absolute(),
-                 temp_puml,
-                 "-o", Path(f"{tempfile.gettempdir()}")])
-            gen_pic_path = Path(f'{tempfile.gettempdir()}/{temp_puml.name.split(".")[0]}.png')
-            self.__resize_schema(gen_pic_path)
+        if self.__renderer.available:
+            record.inline_count += 1
+            try:
+                budget, _ = self.__diagram_budget()
+                with self.events.stage("diagram", source="inline") as diagram_stage:
+                    gen_pic_path, rendered = self.__renderer.render_text(match_obj.group(1),
+                                                                         self.__resize_schema,
+                                                                         budget)
+                    diagram_stage["cached"] = not rendered
+            except TimeoutError as timeout:
+                # Rendered again by the next run
+                record.complete = False
+                self.__record_failure("diagram", f"inline {record.inline_count} of "
+                                                 f"{os.path.basename(record.dependencies[0])}",
+                                      str(timeout))
+                return self.__diagram_placeholder(f"Diag {record.inline_count}")
+            if rendered:
+                self.__count_diagram()
             generated_path = re.sub(r'\\',
                                     '/',
                                     str(gen_pic_path.absolute()))
-            self.__inline_counter += 1
-            return f"\n![Diag {current}]({generated_path})\n"
+            record.images.append(generated_path)
+            return f"\n![Diag {record.inline_count}]({generated_path})\n"
         else:
             return ""
 
-    def __forewords_picture(self, match_obj):
-        generated_path = re.sub(
-            r'\\',
-            '/',
-            str(Path(f"{self.forewords_folder}/{match_obj.group(2)}").absolute()))
-        self.__resize_schema(Path(generated_path))
+    def __forewords_picture(self, record: ForewordRecord, match_obj):
+        source = Path(f"{self.forewords_folder}/{match_obj.group(2)}").absolute()
+        record.depends_on(source)
+        # Resize a copy, the forewords folder is left untouched
+        stat = source.stat()
+        digest = hashlib.sha1(f"{source}|{stat.st_size}|{stat.st_mtime_ns}".encode("utf-8"))
+        resized = Path(f"{self.cache_folder}/forewords/picture_{digest.hexdigest()[:16]}.png")
+        with self.__diagram_lock(str(resized)):
+            if not resized.is_file():
+                resized.parent.mkdir(parents=True, exist_ok=True)
+                # Other runs may read the cache: publish the complete picture only
+                temporary = Path(self.__workspace, resized.name)
+                self.__resize_schema(source, temporary)
+                os.replace(temporary, resized)
+        generated_path = re.sub(r'\\', '/', str(resized.absolute()))
+        record.images.append(generated_path)
         return f"\n![{match_obj.group(1)}]({generated_path})\n"
 
-    def create_application_documentation(self, report_file=None, output_file_name="demo.docx"):
+    def __preprocess_foreword(self, file: str) -> Tuple[str, bool]:
+        """
+        Return the foreword markdown ready to insert and whether it comes from the cache.
+        It may run concurrently for several files.
+        """
+        with open(file) as foreword_section:
+            content = foreword_section.read()
+        cache = ForewordsCache(f"{self.cache_folder}/forewords")
+        key = cache.key(content, os.path.abspath(self.forewords_folder), self.__renderer.available)
+        cached = cache.get(key)
+        if cached is not None:
+            log.info(f"Foreword {file} taken from the cache")
+            return cached, True
+        record = ForewordRecord()
+        record.depends_on(file)
+        # Shift title level +1
+        content = re.sub(r'^(#*)', r'#\1', content)
+        # Process included picture with relative path
+        content = re.sub(r'!\[([^\[\]]+)\]\(([^\s]+)\)',
+                         partial(self.__forewords_picture, record),
+                         content)
+        if self.__renderer.available:
+            # Process inline puml diagrams
+            content = re.sub(r'```puml[\r|\n]{1,2}([^`]*)```',
+                             partial(self.__forewords_inline_puml, record),
+                             content,
+                             flags=re.MULTILINE)
+            # Process diagrams
+            content = re.sub(r'!!Workflow:\s*([\.\d\w\-\_\\\/]*)\s*',
+                             partial(self.__forewords_schema_replacement, record),
+                             content)
+        if record.complete:
+            cache.put(key, content, record)
+        return content, False
+
+    def create_application_documentation(
+            self, report_file=None,
+            output_file_name: Union[str, IO[bytes], List[str]] = "demo.docx"):
         """
         Create a document (docx) object and read first all ".feature" files and
         add their contents into the document.
@@ -150,92 +535,543 @@ class ExportUtilities:
 
         The report file must be the "plain" report output file generated from behave.
 
+        Several outputs can be requested at once: the features are discovered and parsed once and
+        fed to each output. A ".csv" output gets the documented scenarios (EaiCsvFull columns),
+        a ".json" output a summary, any other one is the document (at most one).
+
+        The document may also be written in a binary file-like object (e.g. sys.stdout.buffer).
+        A document file is replaced atomically once complete.
+
         :param report_file: The report file path (absolute or relative)
-        :param output_file_name : The exported file name by default "demo.docx"
+        :param output_file_name : The exported file name by default "demo.docx", a binary
+            file-like object or a list of outputs
         :return: None
         """
-        log.info("Start application documentation")
+        # Temporary files of the run live in a private workspace removed at the end
+        self.__workspace = tempfile.mkdtemp(prefix="featurereporter_run_")
+        count_generation()
+        # The stage timings calibrate the --plan estimations when asked for
+        recorder = TimingsRecorder(f"{self.cache_folder}/{CALIBRATION_FILE}") \
+            if self.calibrate else None
+        if recorder is not None:
+            self.events.subscribe(recorder)
+        try:
+            self.__create_documentation(report_file, output_file_name)
+        finally:
+            if recorder is not None:
+                self.events.unsubscribe(recorder)
+            shutil.rmtree(self.__workspace, ignore_errors=True)
+            self.__workspace = None
 
-        # Check which drive is it if window
-        self.__document = Document()
-        self.document.add_heading(f"{self.__report_title}", 0)  # Document title
-        self.document.add_page_break()
-        # Is copying file needed
-        if platform.system() == "Windows":
-            current_execution = os.path.abspath(os.getcwd())
-            repository = os.path.abspath(self.__feature_repository)
-            if current_execution.split(os.path.sep)[0] == repository.split(os.path.sep)[0]:
-                please_copy = False
+    @staticmethod
+    def __split_outputs(
+            output_file_name) -> Tuple[Union[str, IO[bytes], None], List[OutputWriter]]:
+        """
+        Return the document file name or stream (None if not requested)
+        and the other outputs writers
+        """
+        outputs = [output_file_name] if isinstance(output_file_name, (str, Path)) \
+            or hasattr(output_file_name, "write") else list(output_file_name)
+        document_file = None
+        writers = []
+        for output in outputs:
+            if hasattr(output, "write"):
+                if document_file is not None:
+                    raise ValueError("Only one document can be generated, a stream is a second one")
+                document_file = output
+                continue
+            output = str(output)
+            extension = os.path.splitext(output)[1].lower()
+            if extension in OUTPUT_WRITERS:
+                writers.append(OUTPUT_WRITERS[extension](output))
+            elif document_file is None:
+                document_file = output if output.endswith(".docx") else f"{output}.docx"
             else:
-                please_copy = True
-                temp_file = os.path.abspath(f"{current_execution}/temp.feature")
-        else:
-            please_copy = False
+                raise ValueError(f"Only one document can be generated, {output} is a second one")
+        return document_file, writers
 
-        log.info(f"We are on {platform.system()} and we need to copy is set to {please_copy}")
+    def __create_documentation(self, report_file, output_file_name):
+        # A shard only sees its own features, its matrix would be partial
+        if self.shard[1] > 1 and (self.traceability or self.traceability_csv is not None):
+            raise ValueError("The traceability matrix cannot be generated by a shard, "
+                             "generate it without shard")
+        output_file_name, writers = self.__split_outputs(output_file_name)
+        self.__up_to_date = False
+        outputs = [writer.path for writer in writers]
+        inputs = None
+        # A document written in a stream is always generated
+        if not self.force and not hasattr(output_file_name, "write"):
+            if output_file_name is not None:
+                outputs.append(output_file_name)
+            if self.traceability_csv is not None and self.us_tag is not None:
+                outputs.append(self.traceability_csv)
+            store = FingerprintStore(f"{self.cache_folder}/fingerprints")
+            with self.events.stage("fingerprint", outputs=outputs) as fingerprint_stage:
+                inputs = self.__input_fingerprint(report_file, outputs)
+                self.__up_to_date = store.matches(outputs, self.__with_history(inputs))
+                fingerprint_stage["up_to_date"] = self.__up_to_date
+            if self.__up_to_date:
+                log.warning(f"{', '.join(outputs)} up to date: the inputs did not change, "
+                            f"nothing generated")
+                return
+        try:
+            for writer in writers:
+                writer.open(self)
+            self.__generate(report_file, output_file_name, writers)
+        finally:
+            # Closed writers have nothing left to discard
+            for writer in writers:
+                writer.discard()
+        # Generated again next time when an item is missing
+        if inputs is not None and not self.__failures:
+            store.record(outputs, self.__with_history(inputs))
 
-        # Insert forewords sections
+    def __input_fingerprint(self, report_file, outputs: List[str]) -> str:
+        """
+        Return the fingerprint of the generation inputs: the options, the tool version and
+        the files (features, forewords, diagrams with their includes and execution report)
+        size and modification time. Only the files changed since the last fingerprint are read,
+        for their references.
+        """
+        fingerprint = InputFingerprint()
+        fingerprint.add("version", __version__)
+        fingerprint.add("options", {
+            "repository": os.path.abspath(self.feature_repository),
+            "forewords": None if self.forewords_folder is None
+            else os.path.abspath(self.forewords_folder),
+            "title": self.report_title,
+            "tag": self.us_tag,
+            "include_tags": str(self.include_tags),
+            "shard": self.shard,
+            "inline_results": self.inline_results,
+            "traceability": self.traceability,
+            "history": self.history,
+            "max_table_rows": self.max_table_rows,
+            "compression": self.compression,
+            "timeouts": [self.diagram_timeout, self.feature_timeout, self.deadline],
+            "outputs": sorted(os.path.abspath(output) for output in outputs),
+            "renderer": self.__renderer.available})
+        fingerprint.add_file(self.__renderer.jar_path)
+        references = ReferenceIndex(self._cache_file("references"))
+        feature_files, _ = self.__discover_features()
+        for file in feature_files:
+            stat = fingerprint.add_file(file)
+            if stat is not None:
+                for workflow in references.references(file, stat, _workflows):
+                    self.__add_diagram_input(fingerprint, references,
+                                             f"{self.feature_repository}/{workflow}")
         if self.forewords_folder is not None:
-            self.document.add_heading("Forewords", 1)
-            list_of_files = sorted(filter(os.path.isfile,
-                                          glob.glob(f"{self.forewords_folder}/*.md")))
-            for file in list_of_files:
-                with open(file) as foreword_section:
-                    content = foreword_section.read()
-                    # Shift title level +1
-                    content = re.sub(r'^(#*)', r'#\1', content)
-                    # Process included picture with relative path
-                    content = re.sub(r'!\[([^\[\]]+)\]\(([^\s]+)\)',
-                                     self.__forewords_picture,
-                                     content)
-                    if self.__jre_present:
-                        # Process inline puml diagrams
-                        content = re.sub(r'```puml[\r|\n]{1,2}([^`]*)```',
-                                         self.__forewords_inline_puml,
-                                         content,
-                                         flags=re.MULTILINE)
-                        # Process diagrams
-                        content = re.sub(r'!!Workflow:\s*([\.\d\w\-\_\\\/]*)\s*',
-                                         self.__forewords_schema_replacement,
-                                         content)
-                    insert_text(self.document, content)
+            fingerprint.add_tree(self.forewords_folder)
+            for file in sorted(glob.glob(f"{self.forewords_folder}/*.md")):
+                for workflow in references.references(file, os.stat(file), _workflows):
+                    self.__add_diagram_input(fingerprint, references,
+                                             f"{self.forewords_folder}/{workflow}")
+        references.save()
+        if report_file is not None:
+            fingerprint.add_file(report_file)
+        return fingerprint.hexdigest()
+
+    @staticmethod
+    def __add_diagram_input(fingerprint: InputFingerprint, references: ReferenceIndex,
+                            diagram_path: str):
+        resolved = Path(diagram_path).resolve()
+        # An existing picture in the current folder replaces the diagram
+        fingerprint.add_file(f"{resolved.name.split('.')[0]}.png")
+        # The diagram and the files it includes, directly or not
+        pending = [resolved]
+        visited = set()
+        while pending:
+            source = pending.pop(0)
+            if source in visited:
+                continue
+            visited.add(source)
+            stat = fingerprint.add_file(source)
+            if stat is not None:
+                pending.extend(Path(included)
+                               for included in references.references(source, stat,
+                                                                     include_targets))
+
+    def __with_history(self, inputs: str) -> str:
+        """Complete the inputs fingerprint with the history database revision"""
+        if self.history is None or not os.path.isfile(self.history):
+            return inputs
+        with HistoryStore(self.history) as history:
+            revision = history.revision()
+        return hashlib.sha256(f"{inputs}|{revision}".encode("utf-8")).hexdigest()
+
+    def __generate(self, report_file, output_file_name, writers):
+        log.info("Start application documentation")
+        self.__reset_run()
+        # A document stream is known by its name in the events (e.g. "<stdout>")
+        to_file = output_file_name is None or isinstance(output_file_name, str)
+        document_name = output_file_name if to_file \
+            else str(getattr(output_file_name, "name", "stream"))
+        self.__overflow_folder = self.__clear_overflow_folder(output_file_name)
+        generation_start = time.perf_counter()
+        self.events.emit("generation_started", repository=self.__feature_repository,
+                         output=document_name)
+        # Without document output, the features are only parsed for the other outputs
+        with_document = output_file_name is not None
+
+        # The first shard holds the title and forewords, the last one the execution report
+        shard_index, shard_count = self.__shard
+        last_shard = shard_index == shard_count
+        self.__document = Document()
+        self.__add_front_matter(report_file, shard_index == 1, with_document)
+        self.__prepare_indexes(report_file, with_document and last_shard)
+
+        with self.events.stage("discovery",
+                               repository=self.__feature_repository) as discovery_stage:
+            feature_files, from_manifest = self.__discover_features()
+            discovery_stage.update(files=len(feature_files), from_manifest=from_manifest)
+        self.__document_features(feature_files, writers, with_document)
+
+        self.__add_closing_sections(report_file if last_shard else None, writers, with_document)
+        if with_document:
+            with self.events.stage("save", path=document_name,
+                                   compression=self.compression) as save_stage:
+                save_document(self.document, output_file_name, self.compression)
+                if self.events.active and to_file:
+                    save_stage["bytes"] = os.path.getsize(output_file_name)
+        self.__close_writers(writers, len(feature_files))
+        self.events.emit("generation_finished",
+                         time.perf_counter() - generation_start,
+                         repository=self.__feature_repository,
+                         output=document_name,
+                         features=len(feature_files),
+                         scenarios=self.__scenario_count,
+                         diagrams=self.__diagram_count,
+                         pictures_read=self.__images.misses,
+                         pictures_reused=self.__images.hits,
+                         failures=len(self.__failures))
+        log.info("Processing done.")
+
+    def __reset_run(self):
+        """Reset the state of the previous generation"""
+        self.__cancel_requested.clear()
+        self.__diagram_count = 0
+        self.__scenario_count = 0
+        self.__execution = None
+        # Pictures are read once per run, whatever the number of references
+        self.__images = ImageCache()
+        self.__failures = []
+        self.__errors = 0
+        self.__timed_out_diagrams = set()
+        self.__feature_deadline = None
+        self.__deadline_at = None if self.deadline is None else time.monotonic() + self.deadline
+        self.__overflow_count = 0
+
+    def __add_front_matter(self, report_file, first_shard: bool, with_document: bool):
+        """Add the title, the forewords and the living documentation heading"""
+        if first_shard:
+            self.document.add_heading(f"{self.__report_title}", 0)  # Document title
             self.document.add_page_break()
 
+        if self.forewords_folder is not None and first_shard and with_document:
+            self.__add_forewords()
+
         if report_file is not None or self.__include_result:
+            # Every shard shifts its levels under the heading held by the first one
             self.__include_result = True
-            self.document.add_heading("Living documentation", 1)
-
-        for file in glob.iglob(f"{self.__feature_repository}/**/*.feature",
-                               recursive=True):  # Use the iterator as it's cleaner
-            # log.debug()
-            log.info(f"Computing {os.path.abspath(file)}")
-            if please_copy:
-                copyfile(os.path.abspath(file), temp_file)
+            if first_shard:
+                self.document.add_heading("Living documentation", 1)
+
+    def __add_forewords(self):
+        """Insert the forewords sections"""
+        self.document.add_heading("Forewords", 1)
+        list_of_files = sorted(filter(os.path.isfile,
+                                      glob.glob(f"{self.forewords_folder}/*.md")))
+        with self.events.stage("forewords", files=len(list_of_files)) as forewords_stage:
+            # Preprocess concurrently (regex, pictures, diagrams), insert in order
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                sections = list(executor.map(self.__preprocess_foreword, list_of_files))
+            for content, _ in sections:
+                insert_text(self.document, content, self.__images)
+            forewords_stage["cached"] = sum(cached for _, cached in sections)
+        self.document.add_page_break()
+
+    def __prepare_indexes(self, report_file, with_report_section: bool):
+        """
+        Create the traceability matrix and index the execution report statuses when needed
+        :param with_report_section: the document ends with the execution report section
+        """
+        # The user story -> features and scenarios index is filled with the parsed features
+        self.__matrix = None
+        if self.traceability or self.traceability_csv is not None:
+            if self.us_tag is None:
+                log.warning("The traceability matrix needs the user story tag, it is skipped")
             else:
-                temp_file = os.path.abspath(file)
-            try:
-                # if file drive is not current cp file and use that copy
-                # Use the Behave parser in order to read the feature file
-                test = parse_file(temp_file)
+                self.__matrix = TraceabilityMatrix(self.us_tag)
+
+        self.__results = None
+        self.__report_section = None
+        if report_file is not None and (self.inline_results or self.__matrix is not None):
+            with self.events.stage("results", path=report_file) as results_stage:
+                if with_report_section:
+                    # The report is read once: its section is written in the same pass
+                    self.__prepare_report(report_file)
+                else:
+                    with open_report(report_file) as report_lines:
+                        self.__results = index_results(report_lines)
+                results_stage["scenarios"] = len(self.__results)
 
+    def __document_features(self, feature_files: List[str], writers: List[OutputWriter],
+                            with_document: bool):
+        """Document the features in order until the deadline, feed the outputs"""
+        # The next feature files (and their diagrams) are read while the current one is processed
+        with Prefetcher(feature_files, self.__load_feature, self.prefetch_depth) as prefetched:
+            for index, (file, loaded) in enumerate(prefetched):
+                if self.__cancel_requested.is_set():
+                    log.warning(f"Generation cancelled before {os.path.abspath(file)}")
+                    raise GenerationCancelled(f"Cancelled after {index} of {len(feature_files)} "
+                                              f"features")
+                if self.__deadline_passed():
+                    for skipped in feature_files[index:]:
+                        self.__record_failure("feature", skipped,
+                                              "skipped, the deadline is reached")
+                    break
+                with self.events.stage("feature", index=index, total=len(feature_files),
+                                       path=file) as feature_stage:
+                    self.__document_feature(file, loaded, writers, with_document, feature_stage)
+
+    def __document_feature(self, file: str, loaded, writers: List[OutputWriter],
+                           with_document: bool, feature_stage: dict):
+        """Document a feature, replaced by a note if it fails or is late"""
+        log.info(f"Computing {os.path.abspath(file)}")
+        # A failed or late feature is removed from the document
+        body_mark = self.__body_mark() if with_document else None
+        scenario_count = self.__scenario_count
+        if self.feature_timeout is not None:
+            self.__feature_deadline = time.monotonic() + self.feature_timeout
+        try:
+            # Use the Behave parser on the prefetched feature file
+            text, self.__feature_diagrams = loaded.result()
+            test = parse_feature(text, filename=_parser_filename(file))
+            self.__check_deadline()
+            if with_document:
                 self.add_heading(feature=test)
                 self.add_description(feature=test)
                 self.add_background(feature=test)
-                self.add_scenario(feature=test)
+                feature_stage["scenarios"] = self.add_scenario(feature=test)
                 self.document.add_page_break()
-                # rm the file copy
-                if please_copy:
-                    os.remove(temp_file)
-            except Exception as exception:
+            if writers or self.__matrix is not None:
+                self.__feed_outputs(file, test, writers, with_document, feature_stage)
+        except Exception as exception:
+            timeout = _timeout_cause(exception)
+            if timeout is None:
                 log.error(exception)
+                self.__errors += 1
+                reason = f"error: {exception}"
+            else:
+                feature_stage["timeout"] = True
+                reason = str(timeout)
+            self.__scenario_count = scenario_count
+            self.__record_failure("feature", file, reason)
+            if with_document:
+                self.__replace_feature(body_mark, f"{os.path.basename(file)} is not documented: "
+                                                  f"{reason}")
+        finally:
+            self.__feature_deadline = None
+            self.__feature_diagrams = {}
+
+    def __feed_outputs(self, file: str, feature, writers: List[OutputWriter],
+                       with_document: bool, feature_stage: dict):
+        """Add the selected scenarios of a parsed feature to the matrix and the writers"""
+        scenarios = self._selected_scenarios(feature)
+        if self.__matrix is not None:
+            self.__matrix.add_feature(
+                file, feature, scenarios,
+                None if self.__results is None else partial(self.__scenario_status, feature))
+        if writers and not with_document:
+            self.__scenario_count += len(scenarios)
+            feature_stage["scenarios"] = len(scenarios)
+        for writer in writers:
+            writer.feature(file, feature, scenarios)
+
+    def __replace_feature(self, body_mark: int, note: str):
+        """Replace the part of a feature already documented by a note"""
+        # No half documented feature
+        self.__rollback_body(body_mark)
+        placeholder = self.document.add_paragraph().add_run(note)
+        placeholder.italic = True
+        self.document.add_page_break()
+
+    def __add_closing_sections(self, report_file, writers: List[OutputWriter],
+                               with_document: bool):
+        """
+        Add the traceability matrix, the execution report and the failures
+        :param report_file: the execution report, None when not held by this shard
+        """
+        if self.__matrix is not None:
+            if with_document and self.traceability:
+                self.add_traceability()
+            if self.traceability_csv is not None:
+                self.__matrix.write_csv(self.traceability_csv)
 
         if report_file is not None:
-            self.add_report(file=report_file)
-        if not output_file_name.endswith(".docx"):
-            self.document.save(f"{output_file_name}.docx")
-        else:
-            self.document.save(output_file_name)
-        log.info("Processing done.")
+            if self.__deadline_passed():
+                self.__record_failure("report", report_file, "skipped, the deadline is reached")
+            elif with_document:
+                self.add_report(file=report_file)
+            elif writers:
+                self.__execution = self.__count_results(report_file) if self.__results is None \
+                    else self.__indexed_execution()
+        if with_document and self.__failures:
+            self.add_failures()
+
+    def __close_writers(self, writers: List[OutputWriter], feature_count: int):
+        """Complete the outputs with the generation statistics"""
+        statistics = {"features": feature_count,
+                      "scenarios": self.__scenario_count,
+                      "diagrams": self.__diagram_count,
+                      "failures": len(self.__failures)}
+        if self.__execution is not None:
+            statistics["execution"] = self.__execution
+        if self.__matrix is not None:
+            statistics["user_stories"] = len(self.__matrix)
+        for writer in writers:
+            writer.close(statistics)
+
+    def __load_feature(self, file: str) -> Tuple[str, dict]:
+        """
+        Read a feature file and its diagram sources (resolved path -> content).
+        It runs in the prefetch threads.
+        """
+        with open(file, "rb") as feature_file:
+            # behave assumes utf-8 feature files
+            text = feature_file.read().decode("utf8")
+        diagrams = {}
+        if self.__renderer.available:
+            for workflow in _WORKFLOW.findall(text):
+                resolved = Path(f"{self.feature_repository}/{workflow}").resolve()
+                try:
+                    with open(resolved, "rb") as puml:
+                        diagrams[resolved] = puml.read()
+                except OSError:
+                    # Reported when the diagram is generated
+                    continue
+        return text, diagrams
+
+    def __discover_features(self) -> Tuple[List[str], bool]:
+        """
+        Return the feature files to document (tag expression and shard applied)
+        and whether the repository manifest was reused.
+        """
+        tag_index = None
+        if self.include_tags:
+            tag_index = TagIndex(self._cache_file("tagindex"))
+        discovery = FeatureDiscovery(self.__feature_repository, self._cache_file("manifest"))
+        feature_files = []
+        for file in discovery.discover():
+            if tag_index is not None and not tag_index.may_match(file, self.include_tags):
+                log.info(f"Skip {os.path.abspath(file)} not matching the tag expression")
+                continue
+            feature_files.append(file)
+        if tag_index is not None:
+            tag_index.save()
+        shard_index, shard_count = self.__shard
+        if shard_count > 1:
+            # Contiguous slices of the sorted list: the merged shards keep the order
+            total = len(feature_files)
+            feature_files = feature_files[total * (shard_index - 1) // shard_count:
+                                          total * shard_index // shard_count]
+            log.info(f"Shard {shard_index}/{shard_count} holds {len(feature_files)} "
+                     f"of {total} features")
+        return feature_files, discovery.from_manifest
+
+    def plan(self, report_file=None) -> dict:
+        """
+        Estimate the cost of a generation without generating: the repository and the forewords
+        are scanned (no parsing, no rendering) and the counts are priced with the unit costs
+        calibrated on the previous generations.
+        :param report_file: the execution report the generation would include
+        :return: the counts and the estimation per stage
+        """
+        shard_index, shard_count = self.__shard
+        feature_files, _ = self.__discover_features()
+        counts = {"files": len(feature_files), "scenarios": 0, "outlines": 0, "example_rows": 0,
+                  "forewords": {"files": 0, "cached": 0},
+                  "diagrams": {"to_render": 0, "cached": 0, "missing": 0},
+                  "picture_bytes": 0, "report_bytes": 0}
+        diagrams = self.__plan_features(feature_files, counts)
+        inline_diagrams = set()
+        if self.forewords_folder is not None and shard_index == 1:
+            self.__plan_forewords(counts, diagrams, inline_diagrams)
+        if self.__renderer.available:
+            self.__plan_diagrams(counts, diagrams, inline_diagrams)
+        if report_file is not None and shard_index == shard_count:
+            counts["report_bytes"] = os.path.getsize(report_file)
+        calibration = Calibration(f"{self.cache_folder}/{CALIBRATION_FILE}")
+        return {"counts": counts, "estimate": calibration.estimate(counts)}
+
+    def __plan_features(self, feature_files: List[str], counts: dict) -> set:
+        """Count the scenarios of the feature files, return the diagrams they reference"""
+        diagrams = set()
+        with Prefetcher(feature_files, scan_feature, self.prefetch_depth) as prefetched:
+            for _, scanned in prefetched:
+                feature_counts = scanned.result()
+                for name in ("scenarios", "outlines", "example_rows"):
+                    counts[name] += feature_counts[name]
+                diagrams.update(Path(f"{self.feature_repository}/{workflow}").resolve()
+                                for workflow in feature_counts["workflows"])
+        return diagrams
+
+    def __plan_forewords(self, counts: dict, diagrams: set, inline_diagrams: set):
+        """Count the forewords sections and pictures not cached, collect their diagrams"""
+        cache = ForewordsCache(f"{self.cache_folder}/forewords")
+        for file in sorted(filter(os.path.isfile,
+                                  glob.glob(f"{self.forewords_folder}/*.md"))):
+            counts["forewords"]["files"] += 1
+            with open(file) as foreword_section:
+                content = foreword_section.read()
+            key = cache.key(content, os.path.abspath(self.forewords_folder),
+                            self.__renderer.available)
+            if cache.get(key) is not None:
+                # Its pictures and diagrams are reused as well
+                counts["forewords"]["cached"] += 1
+                continue
+            for _, picture in re.findall(r'!\[([^\[\]]+)\]\(([^\s]+)\)', content):
+                picture = Path(f"{self.forewords_folder}/{picture}")
+                if picture.is_file():
+                    counts["picture_bytes"] += picture.stat().st_size
+            if self.__renderer.available:
+                inline_diagrams.update(re.findall(r'```puml[\r|\n]{1,2}([^`]*)```', content,
+                                                  flags=re.MULTILINE))
+                diagrams.update(Path(f"{self.forewords_folder}/{workflow}").resolve()
+                                for workflow in _WORKFLOW.findall(content))
+
+    def __plan_diagrams(self, counts: dict, diagrams: set, inline_diagrams: set):
+        """Count the diagrams to render, cached or missing"""
+        pictures = [self.__renderer.cached_text(text) for text in inline_diagrams]
+        for diagram in diagrams:
+            if not diagram.is_file():
+                counts["diagrams"]["missing"] += 1
+                continue
+            pictures.append(self.__renderer.cached_file(diagram))
+        for picture in pictures:
+            if picture is None:
+                counts["diagrams"]["to_render"] += 1
+            else:
+                counts["diagrams"]["cached"] += 1
+                counts["picture_bytes"] += picture.stat().st_size
+
+    def __indexed_execution(self) -> dict:
+        """Count the scenario statuses of the indexed execution report"""
+        statuses = list(self.__results.values())
+        return {"total": len(statuses),
+                "passed": statuses.count(PASSED),
+                "failed": statuses.count(FAILED)}
+
+    @staticmethod
+    def __count_results(report_file: str) -> dict:
+        """Count the scenario statuses of a behave plain report"""
+        execution = {"total": 0, "passed": 0, "failed": 0}
+        with open_report(report_file) as report_lines:
+            for result in iter_scenario_results(report_lines):
+                execution["total"] += 1
+                if result.status in (PASSED, FAILED):
+                    execution[result.status] += 1
+        return execution
 
     def add_heading(self, feature=None):
         """
@@ -273,34 +1109,107 @@ class ExportUtilities:
             # Assuming that the diagram path is relative to feature folder repository
             path = Path(f"{base_path}/{diagram_path}")
             resolved = path.resolve()
-            # Check if existing png files exists
-            if (Path(f"{resolved.name.split('.')[0]}.png").exists()
-                    and Path(f"{resolved.name.split('.')[0]}.png").is_file()):
-                gen_pic_path = Path(f"{resolved.name.split('.')[0]}.png")
-            else:
-                # Generate the temporary picture
-                try:
-                    tmp_pic_folder = Path(f"{tempfile.gettempdir()}")
-                    subprocess.run(
-                        ["java", "-Djava.awt.headless=true",
-                         "-jar", Path(self.__jar_path).absolute(),
-                         resolved,
-                         "-o", tmp_pic_folder])
-                    gen_pic_path = Path(f'{tmp_pic_folder}/{resolved.name.split(".")[0]}.png')
-                except FileNotFoundError as file_not_found:
-                    # Don't break the flow
-                    log.warning(file_not_found.args[0])
-                    return
-
-            self.__resize_schema(gen_pic_path)
-            return str(gen_pic_path.absolute())
+            with self.__diagram_lock(str(resolved)):
+                return self.__generate_diagram(resolved)
         except Exception as exception:
             log.error(exception)
             raise Exception(exception) from exception
 
+    def __deadline_passed(self) -> bool:
+        return self.__deadline_at is not None and time.monotonic() >= self.__deadline_at
+
+    def __body_mark(self) -> int:
+        """Return the position of the next body element (before the section properties)"""
+        body = self.document.element.body
+        return len(body) - (body.sectPr is not None)
+
+    def __rollback_body(self, mark: int):
+        """Remove the body elements added since the mark"""
+        body = self.document.element.body
+        for element in list(body)[mark:len(body) - (body.sectPr is not None)]:
+            body.remove(element)
+
+    def __record_failure(self, kind: str, item, reason: str):
+        log.warning(f"{kind} {item}: {reason}")
+        self.__failures.append((kind, str(item), reason))
+
+    def __check_deadline(self):
+        """Raise a GenerationTimeout once the feature or the generation deadline is passed"""
+        now = time.monotonic()
+        if self.__deadline_at is not None and now >= self.__deadline_at:
+            raise GenerationTimeout(f"the generation deadline ({self.deadline} s) is reached")
+        if self.__feature_deadline is not None and now >= self.__feature_deadline:
+            raise GenerationTimeout(f"the feature timeout ({self.feature_timeout} s) is reached")
+
+    def __diagram_budget(self) -> Tuple[Union[float, None], bool]:
+        """
+        Return the seconds left to render a diagram (None when unbounded) and True if the
+        diagram timeout, not the time left to the feature or the generation, is the limit
+        """
+        self.__check_deadline()
+        now = time.monotonic()
+        budgets = [deadline - now for deadline in (self.__deadline_at, self.__feature_deadline)
+                   if deadline is not None]
+        if self.diagram_timeout is None:
+            return (min(budgets) if budgets else None), False
+        if budgets and min(budgets) < self.diagram_timeout:
+            return min(budgets), False
+        return self.diagram_timeout, True
+
+    @staticmethod
+    def __diagram_placeholder(name) -> str:
+        return f"\n*Diagram {name} is not available*\n\n"
+
+    def __generate_diagram(self, resolved: Path) -> Union[str, None]:
+        # Check if existing png files exists
+        existing = Path(f"{resolved.name.split('.')[0]}.png").absolute()
+        if existing.is_file():
+            # Resize a private copy, the existing picture may be shared with other runs.
+            # The copy is made once per run and picture version.
+            stat = existing.stat()
+            digest = hashlib.sha1(f"{existing}|{stat.st_size}|{stat.st_mtime_ns}".encode("utf-8"))
+            gen_pic_path = Path(self.__workspace, f"existing_{digest.hexdigest()[:16]}.png")
+            if not gen_pic_path.is_file():
+                # Several diagram sources may share the existing picture name
+                temporary = Path(tempfile.mkdtemp(dir=self.__workspace), gen_pic_path.name)
+                self.__resize_schema(existing, temporary)
+                os.replace(temporary, gen_pic_path)
+            return str(gen_pic_path)
+        else:
+            # Generate the picture, resized once when rendered
+            if resolved in self.__timed_out_diagrams:
+                # Do not wait for it again
+                return
+            try:
+                budget, diagram_bound = self.__diagram_budget()
+                with self.events.stage("diagram", source=resolved) as diagram_stage:
+                    gen_pic_path, rendered = self.__renderer.render_file(
+                        resolved, self.__resize_schema, budget,
+                        self.__feature_diagrams.get(resolved))
+                    diagram_stage["cached"] = not rendered
+                if rendered:
+                    self.__count_diagram()
+                return str(gen_pic_path.absolute())
+            except FileNotFoundError as file_not_found:
+                # Don't break the flow
+                log.warning(file_not_found.args[0])
+                return
+            except GenerationTimeout:
+                raise
+            except TimeoutError as timeout:
+                if not diagram_bound:
+                    # Cut short by the feature or the generation deadline
+                    self.__check_deadline()
+                else:
+                    # Too slow in itself, do not wait for it again in this run
+                    self.__timed_out_diagrams.add(resolved)
+                # The diagram is replaced by a note, the generation goes on
+                self.__record_failure("diagram", resolved, str(timeout))
+                return
+
     @staticmethod
-    def __resize_schema(schema_picture_path: Path):
-        # Resize the picture if too big
+    def __resize_schema(schema_picture_path: Path, target_path: Path = None):
+        # Resize the picture if too big, in place unless a target is given
         image: Image = Image.open(schema_picture_path)
         width, height = image.size
         # Preserve image ratio
@@ -323,12 +1232,14 @@ class ExportUtilities:
             new_height = height
         # TODO return path so that it can be included in generator
         new_image = image.resize((new_width, new_height))
-        new_image.save(str(schema_picture_path.absolute()), format="png")
+        new_image.save(str((target_path or schema_picture_path).absolute()), format="png")
 
     def __schema_replacement(self, match_obj):
         result = f"!!Workflow: {match_obj.group(1)}\n"
-        if self.__jre_present:
+        if self.__renderer.available:
             generated_path = self.__generate_diagrams(match_obj.group(1))
+            if generated_path is None:
+                return f"{self.__diagram_placeholder(match_obj.group(1))}{result}"
             generated_path = re.sub(r'\\', '/', generated_path)
             result = (f"\n![Schema]({generated_path})\n"
                 f"!!Workflow: {match_obj.group(1)}\n")
@@ -391,7 +1302,7 @@ class ExportUtilities:
                                  description,
                                  flags=re.MULTILINE)
             # include md description in the document
-            insert_text(self.document, description)
+            insert_text(self.document, description, self.__images)
         except Exception as exception:
             log.error(exception)
             raise Exception(exception) from exception
@@ -416,11 +1327,13 @@ class ExportUtilities:
         """
         Add in the document all the scenarios attached to a feature.
         :param feature: the feature object
-        :return: None
+        :return: the number of scenarios added
         """
         try:
-            if feature.scenarios is not None:
-                for scenario in feature.scenarios:
+            scenarios = self._selected_scenarios(feature)
+            if scenarios:
+                for scenario in scenarios:
+                    self.__check_deadline()
                     log.info(f"Processing scenario {scenario.name}")
                     self.print_scenario_title(scenario_keyword=scenario.keyword,
                                               scenario_name=scenario.name,
@@ -432,13 +1345,41 @@ class ExportUtilities:
                     if scenario.tags:
                         paragraph.add_run(", ")
                         paragraph.add_run(", ".join({f"'{tag}'" for tag in scenario.tags}))
+                    if self.inline_results and self.__results is not None:
+                        self.print_status(self.__scenario_status(feature, scenario))
                     self.print_steps(steps=scenario.steps)
                     if scenario.type == 'scenario_outline':
                         self.print_examples(examples=scenario.examples)
+            self.__scenario_count += len(scenarios)
+            return len(scenarios)
         except Exception as exception:
             log.error(exception)
             raise Exception(exception) from exception
 
+    def _selected_scenarios(self, feature) -> List:
+        """Return the scenarios of the feature matching the tag expression"""
+        if feature.scenarios is None:
+            return []
+        if self.include_tags:
+            return matching_scenarios(feature, self.include_tags)
+        return feature.scenarios
+
+    def __scenario_status(self, feature, scenario) -> Union[str, None]:
+        if scenario.type == 'scenario_outline':
+            # An outline is reported row by row
+            return aggregate_status(self.__results.get((feature.name, row.name))
+                                    for row in scenario.scenarios)
+        return self.__results.get((feature.name, scenario.name))
+
+    def print_status(self, status: Union[str, None]):
+        """
+        Add the last execution status of a scenario
+        :param status: passed, failed, skipped or None if the scenario was not executed
+        :return: None
+        """
+        paragraph = self.document.add_paragraph("Last execution status is ", style='No Spacing')
+        paragraph.add_run(status or "not executed").bold = True
+
     def print_examples(self, examples=None):
         """
         Add an example section for each example attached to a scenario outline
@@ -497,6 +1438,10 @@ class ExportUtilities:
         :return: None
         """
         number_of_column = len(table.headings)
+        rows = table.rows
+        capped = self.max_table_rows is not None and len(rows) > self.max_table_rows
+        if capped:
+            rows = rows[:self.max_table_rows]
 
         table_instance = self.document.add_table(rows=1,
                                                  cols=number_of_column,
@@ -505,11 +1450,105 @@ class ExportUtilities:
         for count, text in enumerate(table.headings):
             header_cells[count].text = str(text)
 
-        for row in table.rows:
+        for row in rows:
             row_cells = table_instance.add_row().cells
             for count, cell in enumerate(row.cells):
                 row_cells[count].text = str(cell)
 
+        if capped:
+            self.__print_table_overflow(table)
+
+    def __clear_overflow_folder(self, output_file_name) -> Union[str, None]:
+        """
+        Return the folder of the capped tables, emptied of the tables of a previous run,
+        None without document. It is next to the output file, in the current folder and named
+        after the repository for a stream without file name (e.g. the standard output).
+        """
+        if output_file_name is None:
+            return None
+        if isinstance(output_file_name, str):
+            name = output_file_name
+        else:
+            name = getattr(output_file_name, "name", None)
+            if not isinstance(name, str) or name.startswith("<"):
+                name = os.path.basename(os.path.abspath(self.__feature_repository))
+        folder = f"{re.sub(r'[.]docx$', '', name)}_tables"
+        for previous in glob.glob(os.path.join(glob.escape(folder), "table_*.csv")):
+            os.remove(previous)
+        return folder
+
+    def __print_table_overflow(self, table):
+        """Write the full table as csv and add its summary: row count and distinct values"""
+        self.__overflow_count += 1
+        os.makedirs(self.__overflow_folder, exist_ok=True)
+        csv_file = os.path.join(self.__overflow_folder, f"table_{self.__overflow_count:04d}.csv")
+        distinct_values = [set() for _ in table.headings]
+        with open(csv_file, "w", newline="", encoding="utf-8") as csv_stream:
+            writer = csv.writer(csv_stream)
+            writer.writerow(table.headings)
+            for row in table.rows:
+                writer.writerow(row.cells)
+                for values, cell in zip(distinct_values, row.cells):
+                    values.add(cell)
+        log.info(f"Table of {len(table.rows)} rows written in {csv_file}")
+
+        paragraph = self.document.add_paragraph(f"First {self.max_table_rows} of "
+                                                f"{len(table.rows)} rows. Full table in ",
+                                                style='No Spacing')
+        paragraph.add_run(os.path.relpath(csv_file, os.path.dirname(self.__overflow_folder)
+                                          or os.curdir)).italic = True
+        summary = self.document.add_table(rows=1, cols=2, style='Light List Accent 3')
+        summary.rows[0].cells[0].text = "Column"
+        summary.rows[0].cells[1].text = "Distinct values"
+        for heading, values in zip(table.headings, distinct_values):
+            row_cells = summary.add_row().cells
+            row_cells[0].text = str(heading)
+            row_cells[1].text = str(len(values))
+
+    def add_traceability(self):
+        """
+        Add the traceability matrix section: for each user story, the features and scenarios
+        covering it and their last execution status.
+        :return: None
+        """
+        self.document.add_heading("Traceability matrix", 1)
+        table_instance = self.document.add_table(rows=1, cols=4, style='Light List Accent 3')
+        header_cells = table_instance.rows[0].cells
+        header_cells[0].text = "User story"
+        header_cells[1].text = "Feature"
+        header_cells[2].text = "Scenario"
+        header_cells[3].text = "Last status"
+        previous_story = None
+        for story, feature, _, scenario, status in self.__matrix.rows():
+            row_cells = table_instance.add_row().cells
+            # The story is written on the first row of its group
+            if story != previous_story:
+                row_cells[0].text = story
+                previous_story = story
+            row_cells[1].text = feature
+            row_cells[2].text = scenario or ""
+            if self.__results is not None:
+                row_cells[3].text = status or "not executed"
+        self.document.add_page_break()
+
+    def add_failures(self):
+        """
+        Add a section listing the items missing from the document: timed out diagrams and
+        features, features in error and what the deadline skipped.
+        :return: None
+        """
+        self.document.add_heading("Generation failures", 1)
+        table_instance = self.document.add_table(rows=1, cols=3, style='Light List Accent 3')
+        header_cells = table_instance.rows[0].cells
+        header_cells[0].text = "Kind"
+        header_cells[1].text = "Item"
+        header_cells[2].text = "Reason"
+        for kind, item, reason in self.__failures:
+            row_cells = table_instance.add_row().cells
+            row_cells[0].text = kind
+            row_cells[1].text = item
+            row_cells[2].text = reason
+
     def add_report(self, file=None):
         """
         Add a last execution section to a document. It reads an execution plain file report
@@ -518,7 +1557,19 @@ class ExportUtilities:
         """
         self.document.add_heading("Last Execution report", 1)
         reporter = {}
-        total, succeed, failed = self.__parse_report(file, reporter)
+        with self.events.stage("report", path=file) as report_stage:
+            prepared, self.__report_section = self.__report_section, None
+            if prepared is not None and prepared[0] == file:
+                # Written while the statuses were indexed
+                _, fragment, reporter, (total, succeed, failed) = prepared
+                body = self.document.element.body
+                for element in list(fragment.element.body):
+                    if element is not fragment.element.body.sectPr:
+                        body.insert(self.__body_mark(), element)
+            else:
+                total, succeed, failed = self.__parse_report(file, reporter)
+            self.__execution = {"total": total, "passed": succeed, "failed": failed}
+            report_stage.update(scenarios=total, passed=succeed, failed=failed)
 
         self.document.add_page_break()
         self.document.add_heading("Last Execution summary", 1)
@@ -527,7 +1578,9 @@ class ExportUtilities:
         part_succeed = int(100 * succeed / total)
         part_failed = int(100 * failed / total)
         sizes = [part_succeed, part_failed, 100 - part_succeed - part_failed]
-        fig1, ax1 = plt.subplots()
+        # Use the Figure API so that no GUI backend is involved (generation may run in a thread)
+        fig1 = Figure()
+        ax1 = fig1.subplots()
         ax1.pie(sizes,
                 labels=labels,
                 colors=['tab:green', 'tab:red', 'tab:gray'],
@@ -535,11 +1588,12 @@ class ExportUtilities:
                 shadow=True)
         ax1.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
 
-        tmp_pic_folder = Path(f"{tempfile.gettempdir()}/result.png")
-        plt.savefig(str(tmp_pic_folder.absolute()))
-        plt.close(fig1)
+        # Keep the chart in memory: no shared file between concurrent generations
+        chart = BytesIO()
+        fig1.savefig(chart, format="png")
+        chart.seek(0)
 
-        self.document.add_picture(str(tmp_pic_folder.absolute()))
+        self.document.add_picture(chart)
 
         table_instance = self.document.add_table(rows=1, cols=3, style='Light List Accent 3')
         header_cells = table_instance.rows[0].cells
@@ -560,54 +1614,125 @@ class ExportUtilities:
                 row_cells[1].text = scenario_key
                 row_cells[2].text = reporter[feature_key][scenario_key]
 
-    def __parse_report(self, file: str = None, reporter: dict = None) -> Tuple[int, int, int]:
+        if self.history is not None:
+            self.add_history(file)
+
+    def add_history(self, file=None, runs: int = 20):
+        """
+        Append the execution report to the history database then add the trend of the last runs
+        and the flaky scenarios (passed and failed during these runs).
+        :param file: the execution report, already imported reports are not appended again
+        :param runs: the number of runs displayed
+        :return: None
+        """
+        with self.events.stage("history", path=self.history) as history_stage:
+            with HistoryStore(self.history) as store:
+                if file is not None:
+                    history_stage["appended"] = store.import_report(file) is not None
+                trend = store.trend(runs)
+                flaky = store.flaky(runs)
+            history_stage.update(runs=len(trend), flaky=len(flaky))
+
+        self.document.add_page_break()
+        self.document.add_heading("Execution history", 1)
+        fig1 = Figure(figsize=(8, 4))
+        ax1 = fig1.subplots()
+        positions = range(len(trend))
+        passed = [run[2] for run in trend]
+        failed = [run[3] for run in trend]
+        skipped = [run[1] - run[2] - run[3] for run in trend]
+        ax1.bar(positions, passed, color='tab:green', label="succeed")
+        ax1.bar(positions, failed, bottom=passed, color='tab:red', label="failed")
+        ax1.bar(positions, skipped, bottom=[p + f for p, f in zip(passed, failed)],
+                color='tab:gray', label="skipped")
+        ax1.set_xticks(list(positions))
+        ax1.set_xticklabels([run[0][:10] for run in trend], rotation=45, ha="right")
+        ax1.legend()
+        fig1.tight_layout()
+        chart = BytesIO()
+        fig1.savefig(chart, format="png")
+        chart.seek(0)
+        self.document.add_picture(chart)
+
+        self.document.add_heading("Flaky scenarios", 2)
+        if not flaky:
+            self.document.add_paragraph(f"No flaky scenario in the last {len(trend)} runs",
+                                        style='No Spacing')
+            return
+        table_instance = self.document.add_table(rows=1, cols=4, style='Light List Accent 3')
+        header_cells = table_instance.rows[0].cells
+        for count, text in enumerate(("Feature", "Scenario", "Executions", "Failures")):
+            header_cells[count].text = text
+        for feature_name, scenario_name, executions, failures in flaky:
+            row_cells = table_instance.add_row().cells
+            row_cells[0].text = feature_name
+            row_cells[1].text = scenario_name
+            row_cells[2].text = str(executions)
+            row_cells[3].text = str(failures)
+
+    def __prepare_report(self, file: str):
+        """
+        Write the execution report section in a separate document and index the scenario
+        statuses in the same pass. add_report moves the section to the document end.
+        """
+        fragment = Document()
+        reporter = {}
+        counts = self.__parse_report(file, reporter, fragment)
+        self.__report_section = (file, fragment, reporter, counts)
+        self.__results = {(feature, scenario): status
+                          for feature, scenarios in reporter.items()
+                          for scenario, status in scenarios.items()}
+
+    def __parse_report(self, file: str = None, reporter: dict = None,
+                       document=None) -> Tuple[int, int, int]:
+        document = self.document if document is None else document
         current_feature = None
         current_scenario = None
-        last_status = "skipped"
-        with open(file) as report_file:
-            failed_count = 0
-            succeed_count = 0
-            test_count = 0
-            for line in report_file.readlines():
-                if re.match("Feature.*", line):
+        last_status = SKIPPED
+        counts = {PASSED: 0, FAILED: 0, SKIPPED: 0}
+
+        def close_scenario():
+            reporter[current_feature].update({current_scenario: last_status})
+            counts[last_status] += 1
+
+        # The report is streamed (decompressed or memory-mapped), never loaded at once
+        with open_report(file) as report_lines:
+            for line in report_lines:
+                kind = classify_line(line)
+                if kind == FEATURE:
                     if current_feature is not None:
-                        reporter[current_feature].update({current_scenario: last_status})
-                        if last_status == "failed":
-                            failed_count += 1
-                        elif last_status == "passed":
-                            succeed_count += 1
-                        test_count += 1
-                        last_status = "skipped"
-                        self.document.add_page_break()
-                    current_feature = line.split(":")[1].lstrip(' ').rstrip()
-                    reporter[current_feature] = {}
+                        close_scenario()
+                        last_status = SKIPPED
+                        document.add_page_break()
+                    current_feature = element_name(line)
+                    reporter.setdefault(current_feature, {})
                     current_scenario = None  # No scenario for the current feature
-                    self.document.add_heading(line.rstrip(), 2)
-                elif re.match(r"\s*Scenario.*", line):
+                    document.add_heading(line.rstrip(), 2)
+                elif kind == SCENARIO:
                     if current_scenario is not None:
-                        reporter[current_feature].update({current_scenario: last_status})
-                        if last_status == "failed":
-                            failed_count += 1
-                        elif last_status == "passed":
-                            succeed_count += 1
-                        test_count += 1
-                        last_status = "skipped"
-                    current_scenario = line.split(":")[1].lstrip(' ').rstrip()
+                        close_scenario()
+                        last_status = SKIPPED
+                    current_scenario = element_name(line)
                     log.debug(current_scenario)
-                    self.document.add_heading(line.rstrip(), 3)
-                elif re.match(".*passed.*", line):
-                    last_status = "passed"
-                    self.document.add_paragraph(line.rstrip(), style='No Spacing')
-                elif re.match(".*failed.*", line):
-                    last_status = "failed"
-                    self.document.add_paragraph(line.rstrip(), style='No Spacing')
+                    document.add_heading(line.rstrip(), 3)
                 else:
-                    self.document.add_paragraph(line.rstrip(), style='No Spacing')
-        return test_count, succeed_count, failed_count
+                    if kind in (PASSED, FAILED):
+                        last_status = kind
+                    document.add_paragraph(line.rstrip(), style='No Spacing')
+        if current_feature is not None:
+            # The last scenario of the report
+            close_scenario()
+        return sum(counts.values()), counts[PASSED], counts[FAILED]
+
+
+_MARKDOWN = MarkdownIt().enable('table')
+# HtmlToDocx keeps its parsing state on the instance: one instance per thread
+_CONVERTERS = threading.local()
 
 
-def insert_text(document, text):
-    my_parser = HtmlToDocx()
-    md = MarkdownIt()
-    md.enable('table')
-    my_parser.add_html_to_document(md.render(text), document)
\ No newline at end of file
+def insert_text(document, text, image_cache: ImageCache = None):
+    my_parser = getattr(_CONVERTERS, "html_to_docx", None)
+    if my_parser is None:
+        my_parser = _CONVERTERS.html_to_docx = CachedHtmlToDocx()
+    my_parser.image_cache = image_cache
+    my_parser.add_html_to_document(_MARKDOWN.render(text), document)
\ No newline at end of file
@@ -0,0 +1,169 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+import json
+import logging
+import shutil
+import tempfile
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from .batch import check_job, create_reporter, job_parameters
+from .plantuml import PlantUmlRenderer
+
+log = logging.getLogger(__name__)
+
+DOCX_MIME_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+CHUNK_SIZE = 64 * 1024
+# Job keys refused by the server, a client must not read or write the server's files through them
+REJECTED_KEYS = {
+    "max_table_rows": "the server only returns the document, not the csv of the capped tables",
+    "traceability_csv": "the server only returns the document, not the traceability csv file",
+    "history": "the server does not record the execution history",
+    "force": "the server always generates the document",
+    "forewords": "the server does not read forewords folders",
+    "execution": "the server does not read execution reports",
+}
+
+
+class GenerationServer(ThreadingHTTPServer):
+    """
+    Local http server generating documents on demand.
+
+    The PlantUML renderer and the imported dependencies stay warm between jobs.
+    At most 'workers' jobs run concurrently and at most 'queue_size' jobs wait,
+    further jobs are rejected with 503.
+    """
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 8765), workers: int = 2, queue_size: int = 8,
+                 renderer: PlantUmlRenderer = None):
+        super().__init__(address, GenerationRequestHandler)
+        self.renderer = renderer or PlantUmlRenderer()
+        self.__capacity = workers + queue_size
+        self.__running = threading.BoundedSemaphore(workers)
+        self.__guard = threading.Lock()
+        self.__admitted = 0
+        self.__active = 0
+
+    @property
+    def status(self) -> dict:
+        with self.__guard:
+            return {"running": self.__active, "pending": self.__admitted - self.__active}
+
+    def admit(self) -> bool:
+        """Reserve a place in the queue, False if it is full"""
+        with self.__guard:
+            if self.__admitted >= self.__capacity:
+                return False
+            self.__admitted += 1
+            return True
+
+    def generate(self, job: dict, output_folder: Path) -> Path:
+        """Wait for a worker slot then generate the job document in the output folder"""
+        try:
+            with self.__running:
+                with self.__guard:
+                    self.__active += 1
+                try:
+                    output = output_folder / "document.docx"
+                    reporter = create_reporter(job, self.renderer)
+                    # A temporary output is always generated, no fingerprint is recorded
+                    reporter.force = True
+                    reporter.create_application_documentation(
+                        **{**job_parameters(job), "output_file_name": str(output)})
+                    return output
+                finally:
+                    with self.__guard:
+                        self.__active -= 1
+        finally:
+            with self.__guard:
+                self.__admitted -= 1
+
+
+class GenerationRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /health returns the server status.
+    POST /jobs with a json job (see featurereporter.batch) returns the generated docx.
+    """
+    server: GenerationServer
+
+    def log_message(self, format, *args):
+        log.info(f"{self.address_string()} {format % args}")
+
+    def __send_json(self, status: HTTPStatus, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.__send_json(HTTPStatus.OK, self.server.status)
+        else:
+            self.__send_json(HTTPStatus.NOT_FOUND, {"error": f"Unknown path {self.path}"})
+
+    def __read_job(self) -> dict:
+        """Return the posted job, raise a ValueError if it is not valid"""
+        length = int(self.headers.get("Content-Length", 0))
+        job = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(job, dict):
+            raise ValueError("The job must be a json object")
+        # The server chooses where the document is written
+        job.pop("output", None)
+        check_job(job)
+        for key in REJECTED_KEYS:
+            if key in job:
+                raise ValueError(f"{key} is not available: {REJECTED_KEYS[key]}")
+        return job
+
+    def do_POST(self):
+        if self.path != "/jobs":
+            self.__send_json(HTTPStatus.NOT_FOUND, {"error": f"Unknown path {self.path}"})
+            return
+        if self.headers.get_content_type() != "application/json":
+            self.__send_json(HTTPStatus.UNSUPPORTED_MEDIA_TYPE,
+                             {"error": "The job must be posted as application/json"})
+            return
+        try:
+            job = self.__read_job()
+        except ValueError as exception:
+            self.__send_json(HTTPStatus.BAD_REQUEST, {"error": str(exception)})
+            return
+        if not self.server.admit():
+            self.__send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": "The job queue is full"})
+            return
+        output_folder = Path(tempfile.mkdtemp(prefix="featurereporter_serve_"))
+        try:
+            try:
+                output = self.server.generate(job, output_folder)
+            except (FileExistsError, AttributeError, ValueError) as exception:
+                self.__send_json(HTTPStatus.BAD_REQUEST, {"error": str(exception)})
+                return
+            except Exception as exception:
+                log.error(f"Job {job} failed: {exception}")
+                self.__send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(exception)})
+                return
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", DOCX_MIME_TYPE)
+            self.send_header("Content-Length", str(output.stat().st_size))
+            self.send_header("Content-Disposition", 'attachment; filename="document.docx"')
+            self.end_headers()
+            with open(output, "rb") as document:
+                shutil.copyfileobj(document, self.wfile, CHUNK_SIZE)
+        finally:
+            shutil.rmtree(output_folder, ignore_errors=True)
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, workers: int = 2, queue_size: int = 8,
+          renderer: PlantUmlRenderer = None):
+    """Run the generation server until interrupted"""
+    with GenerationServer((host, port), workers, queue_size, renderer) as server:
+        log.warning(f"Serving on http://{host}:{server.server_address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            log.warning("Server stopped")
@@ -0,0 +1,170 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+import logging
+import re
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+from behave.formatter.base import Formatter
+
+from .csvformatter import _OUTLINE_NAME, _STATUS_NAMES, _UNDEFINED
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS run (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS epic (
+    name TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS feature (
+    filename TEXT PRIMARY KEY,
+    name TEXT,
+    epic TEXT,
+    tags TEXT,
+    description TEXT
+);
+CREATE TABLE IF NOT EXISTS scenario (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER NOT NULL REFERENCES run (id),
+    feature_filename TEXT,
+    scenario_id TEXT,
+    scenario_name TEXT,
+    scenario_tags TEXT,
+    scenario_is_outline INTEGER,
+    "order" TEXT,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS scenario_scenario_id ON scenario (scenario_id);
+CREATE INDEX IF NOT EXISTS scenario_feature_filename ON scenario (feature_filename);
+CREATE INDEX IF NOT EXISTS scenario_run_id ON scenario (run_id);
+CREATE INDEX IF NOT EXISTS feature_epic ON feature (epic);
+"""
+
+
+class EaiSqlite(Formatter):
+    name = "eaisqlite"
+    description = """Sqlite formatter writing epics, features, scenarios and statuses in a database.
+    The database is the output file (-o), or userdata EaiSqlite.database (default 'eai_results.db')
+    Rows are inserted by batch of userdata EaiSqlite.batch_size (default 1000)
+    Epic tag discrimination is controlled by userdata EaiCsv.epic (default 'epic=')
+    Scenario id tag discrimination is controlled by userdata EaiCsv.scenario (default 'id=')
+    """
+
+    def __init__(self, stream_opener, config, **kwargs):
+        super(EaiSqlite, self).__init__(stream_opener, config)
+        self.__scenarios = []
+        self.__features = []
+        self.__epics = set()
+        self.__current_feature_filename = None
+        self.__current_epic = None
+        self.__current_scenario = None
+        self.__current_status = None
+        self.__base_dir = str(Path(config.base_dir).resolve().absolute())
+        # UserData
+        userdata = config.defaults.get("userdata", {})
+        self.__epic = userdata.get("EaiCsv.epic", "epic=")
+        self.__scenario_id = userdata.get("EaiCsv.scenario", "id=")
+        self.__batch_size = int(userdata.get("EaiSqlite.batch_size", 1000))
+        if "EaiSqlite.database" in userdata:
+            database = userdata["EaiSqlite.database"]
+        elif stream_opener.name:
+            database = stream_opener.name
+        else:
+            database = "eai_results.db"
+        # The database replaces the output stream which is never opened.
+        log.info(f"Store results in {database}")
+        self.__connection = sqlite3.connect(database)
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute("PRAGMA synchronous=NORMAL")
+        self.__connection.executescript(SCHEMA)
+        with self.__connection:
+            cursor = self.__connection.execute("INSERT INTO run (started) VALUES (?)",
+                                               (datetime.now().isoformat(),))
+        self.__run_id = cursor.lastrowid
+
+    def feature(self, feature):
+        self.__current_epic = None
+        for tag in feature.tags:
+            if self.__epic in tag:
+                self.__current_epic = tag.replace(self.__epic, "")
+                break
+        filename = str(Path(feature.filename).resolve().absolute())
+        filename = re.sub(r'^(\.\./)*', '', filename.replace(self.__base_dir, ""))
+        self.__current_feature_filename = filename
+        if self.__current_epic is not None:
+            self.__epics.add(self.__current_epic)
+        self.__features.append((filename,
+                                feature.name,
+                                self.__current_epic,
+                                ", ".join(feature.tags),
+                                "\n".join(feature.description)))
+
+    def scenario(self, scenario):
+        if self.__current_status is not None:
+            self.add_result()
+        self.__current_status = _UNDEFINED
+        outline_order = None
+        scenario_name = scenario.name
+        if "Outline" in scenario.keyword:
+            match = _OUTLINE_NAME.match(scenario.name)
+            scenario_name = f'{match["name"]}-{match["subname"]}'
+            outline_order = match["order"]
+        scenario_id = None
+        for tag in scenario.tags:
+            if self.__scenario_id in tag:
+                scenario_id = tag.replace(self.__scenario_id, "")
+                if outline_order is not None:
+                    scenario_id = f"{scenario_id}-{outline_order}"
+                break
+        self.__current_scenario = [self.__run_id,
+                                   self.__current_feature_filename,
+                                   scenario_id,
+                                   scenario_name,
+                                   ", ".join(scenario.tags),
+                                   outline_order is not None,
+                                   outline_order]
+
+    def add_result(self):
+        if self.__current_scenario is not None:
+            self.__scenarios.append((*self.__current_scenario, self.__current_status))
+            if len(self.__scenarios) >= self.__batch_size:
+                self.flush()
+        self.__current_scenario = None
+        self.__current_status = None
+
+    def result(self, step):
+        self.__current_status = _STATUS_NAMES.get(step.status) or step.status.name
+
+    def eof(self):
+        self.add_result()
+        self.__current_feature_filename = None
+        self.__current_epic = None
+
+    def flush(self):
+        """Insert the pending rows in a single transaction"""
+        log.info(f"Insert {len(self.__scenarios)} scenarios and {len(self.__features)} features")
+        with self.__connection:
+            self.__connection.executemany("INSERT OR IGNORE INTO epic (name) VALUES (?)",
+                                          [(epic,) for epic in self.__epics])
+            self.__connection.executemany("INSERT OR REPLACE INTO feature "
+                                          "(filename, name, epic, tags, description) "
+                                          "VALUES (?, ?, ?, ?, ?)",
+                                          self.__features)
+            self.__connection.executemany('INSERT INTO scenario (run_id, feature_filename, '
+                                          'scenario_id, scenario_name, scenario_tags, '
+                                          'scenario_is_outline, "order", status) '
+                                          'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                          self.__scenarios)
+        self.__epics.clear()
+        self.__features.clear()
+        self.__scenarios.clear()
+
+    def close(self):
+        self.add_result()
+        self.flush()
+        self.__connection.close()
+        self.close_stream()
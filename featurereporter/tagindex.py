@@ -0,0 +1,162 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Iterable, List, Union
+
+from .fileutils import atomic_write_json
+from .keywords import DEFAULT_LANGUAGE, declared_language, is_known, keyword_line
+
+log = logging.getLogger(__name__)
+
+# Tag expression v2 operators and grouping, tags themselves have no space
+_V2_TERM = re.compile(r"[\s()]")
+
+
+class TagExpression:
+    """
+    Behave-style (v1) tag expression.
+
+    Each expression is a comma separated list of tags, one of them must match (or).
+    All expressions must match (and). A tag prefixed by '~' or '-' must not match (not).
+    Tags are given with or without the '@' prefix.
+    For example ["@release-1,@release-2", "~@wip"].
+    A v2 expression (e.g. "@a and not @b") raises a ValueError.
+    """
+
+    def __init__(self, expressions: Iterable[str] = None):
+        self.__ors = []
+        for expression in expressions or []:
+            terms = []
+            for tag in expression.split(","):
+                tag = tag.strip()
+                if not tag:
+                    continue
+                if _V2_TERM.search(tag):
+                    raise ValueError(f"'{expression}' is not a v1 tag expression: use ',' for or, "
+                                     f"one expression per and, '~' for not (e.g. '@a' and '~@b')")
+                negated = tag[0] in "~-"
+                terms.append((negated, tag.lstrip("~-").lstrip("@")))
+            if terms:
+                self.__ors.append(terms)
+
+    def __bool__(self):
+        return bool(self.__ors)
+
+    def __str__(self):
+        return " and ".join(",".join(f"{'~' if negated else ''}@{tag}" for negated, tag in terms)
+                            for terms in self.__ors)
+
+    def check(self, tags: Iterable[str]) -> bool:
+        """Return True if the tags satisfy the expression"""
+        tags = {str(tag).lstrip("@") for tag in tags}
+        return all(any((tag in tags) != negated for negated, tag in terms)
+                   for terms in self.__ors)
+
+
+def _keyword_lines(language: str) -> tuple:
+    """Return the feature, rule and scenario keyword line regexes of a language"""
+    return (keyword_line(language, "feature"),
+            keyword_line(language, "rule"),
+            keyword_line(language, "scenario", "scenario_outline"))
+
+
+def scan_tags(file_path: Union[str, Path]) -> dict:
+    """
+    Read the tags of a feature file without parsing it.
+    Only the '@' lines, the '# language:' line and the feature, rule and scenario keyword lines
+    (in the behave keywords of the file language) are considered.
+    :param file_path: the feature file
+    :return: a dict with the file language, the feature tags and the list of scenario tags,
+    None when the language is unknown to behave
+    """
+    pending = []
+    feature_tags = []
+    rule_tags = []
+    scenarios = []
+    language = DEFAULT_LANGUAGE
+    feature_line, rule_line, scenario_line = _keyword_lines(language)
+    with open(file_path, encoding="utf-8") as feature_file:
+        for line in feature_file:
+            stripped = line.strip()
+            if stripped.startswith("@"):
+                pending.extend(tag.lstrip("@") for tag in stripped.split("#")[0].split())
+            elif declared_language(line):
+                language = declared_language(line)
+                if not is_known(language):
+                    log.warning(f"Unknown language {language}, {file_path} tags are not read")
+                    return {"language": language, "feature": [], "scenarios": None}
+                feature_line, rule_line, scenario_line = _keyword_lines(language)
+            elif feature_line.match(line):
+                feature_tags, pending = pending, []
+            elif rule_line.match(line):
+                rule_tags, pending = pending, []
+            elif scenario_line.match(line):
+                scenarios.append(rule_tags + pending)
+                pending = []
+            elif stripped and not stripped.startswith("#"):
+                # Examples tags or misplaced tags
+                pending = []
+    return {"language": language, "feature": feature_tags, "scenarios": scenarios}
+
+
+class TagIndex:
+    """
+    Persisted index of the tags of feature files.
+    An entry is refreshed when the file size or modification time changes.
+    """
+
+    def __init__(self, index_file: Union[str, Path, None] = None):
+        self.__index_file = index_file
+        self.__entries = {}
+        self.__dirty = False
+        if index_file is not None and Path(index_file).is_file():
+            try:
+                with open(index_file, encoding="utf-8") as index:
+                    self.__entries = json.load(index)
+            except (OSError, ValueError) as exception:
+                log.warning(f"Tag index {index_file} is discarded: {exception}")
+
+    def tags(self, file_path: Union[str, Path]) -> dict:
+        """Return the indexed tags of a feature file, scan it if needed"""
+        key = os.path.abspath(file_path)
+        stat = os.stat(key)
+        entry = self.__entries.get(key)
+        # Entries without language were scanned with the english keywords only
+        if (entry is None
+                or "language" not in entry
+                or entry["mtime_ns"] != stat.st_mtime_ns
+                or entry["size"] != stat.st_size):
+            entry = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, **scan_tags(key)}
+            self.__entries[key] = entry
+            self.__dirty = True
+        return entry
+
+    def may_match(self, file_path: Union[str, Path], expression: TagExpression) -> bool:
+        """
+        Return True if the feature or at least one of its scenarios matches the expression,
+        or if the tags of the feature could not be read.
+        """
+        entry = self.tags(file_path)
+        if entry["scenarios"] is None:
+            return True
+        if not entry["scenarios"]:
+            return expression.check(entry["feature"])
+        return any(expression.check(entry["feature"] + scenario_tags)
+                   for scenario_tags in entry["scenarios"])
+
+    def save(self):
+        """Persist the index if it has changed"""
+        if self.__index_file is None or not self.__dirty:
+            return
+        atomic_write_json(self.__index_file, self.__entries)
+        self.__dirty = False
+
+
+def matching_scenarios(feature, expression: TagExpression) -> List:
+    """Return the scenarios of a parsed feature matching the expression"""
+    return [scenario for scenario in feature.scenarios
+            if expression.check(list(feature.tags) + list(scenario.tags))]
@@ -0,0 +1,66 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+import csv
+import logging
+from typing import Callable, Dict, Iterator, List, Tuple, Union
+
+from .fileutils import atomic_output
+
+log = logging.getLogger(__name__)
+
+CSV_COLUMNS = ["user_story", "feature", "feature_filename", "scenario", "status"]
+
+
+class TraceabilityMatrix:
+    """
+    Inverted index of the user story tags: for each user story, the features and scenarios
+    covering it with their last execution status.
+
+    A user story tag on a feature covers its scenarios, a user story tag on a scenario covers
+    this scenario only. The index is filled with each parsed feature during the generation.
+    """
+
+    def __init__(self, us_tag: str):
+        self.__us_tag = us_tag
+        # story -> (feature, filename, scenario) -> status
+        self.__stories: Dict[str, Dict[Tuple[str, str, Union[str, None]], Union[str, None]]] = {}
+
+    def __len__(self):
+        return len(self.__stories)
+
+    def stories(self, tags) -> List[str]:
+        """Return the user story tags among the tags"""
+        return [tag for tag in tags if self.__us_tag in tag]
+
+    def add_feature(self, filename: str, feature, scenarios: List,
+                    status: Callable[[object], Union[str, None]] = None):
+        """
+        Index a parsed feature.
+        :param filename: the feature file
+        :param feature: the behave feature
+        :param scenarios: its documented scenarios
+        :param status: return the last execution status of a scenario, None if unknown
+        """
+        feature_stories = self.stories(feature.tags)
+        for story in feature_stories:
+            if not scenarios:
+                self.__stories.setdefault(story, {})[(feature.name, filename, None)] = None
+        for scenario in scenarios:
+            scenario_status = status(scenario) if status is not None else None
+            for story in feature_stories + self.stories(scenario.tags):
+                self.__stories.setdefault(story, {})[
+                    (feature.name, filename, scenario.name)] = scenario_status
+
+    def rows(self) -> Iterator[Tuple[str, str, str, Union[str, None], Union[str, None]]]:
+        """Yield (story, feature, filename, scenario, status) sorted by story"""
+        for story in sorted(self.__stories):
+            for (feature, filename, scenario), status in self.__stories[story].items():
+                yield story, feature, filename, scenario, status
+
+    def write_csv(self, path: str):
+        """Write the matrix as csv, one row per story and scenario"""
+        with atomic_output(path, "w", newline="", encoding="utf-8") as stream:
+            writer = csv.writer(stream, quoting=csv.QUOTE_ALL)
+            writer.writerow(CSV_COLUMNS)
+            writer.writerows(self.rows())
+        log.info(f"{path} written")
@@ -0,0 +1,3 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+__version__ = "0.4.10"
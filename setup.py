@@ -6,9 +6,14 @@ from setuptools import setup, find_packages
 with open("README.md", "r") as file:
     long_description = file.read()
 
+# Single source of the version, also used by the generation fingerprint
+version = {}
+with open("featurereporter/version.py", "r") as file:
+    exec(file.read(), version)
+
 setup(
     name="eaiscenarioreporter",
-    version="0.4.10",
+    version=version["__version__"],
     description="Turns folder of gherkin feature files into a docx file.",
     long_description=long_description,
     long_description_content_type="text/markdown",
@@ -36,7 +41,8 @@ setup(
     ],
     install_requires=[
         'behave',
-        'python-docx',
+        # docxsave writes the package with python-docx PackageWriter internals
+        'python-docx>=0.8.11,<1.3',
         'Pillow',
         "matplotlib",
         "markdown-it-py",
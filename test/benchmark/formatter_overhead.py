@@ -0,0 +1,114 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+"""
+Measure the time the behave formatters add to a run.
+
+The formatters are driven as behave does (feature, scenario, step then result for each step, eof,
+close) with synthetic model objects, so no step is executed. The base behave Formatter, which does
+nothing, gives the baseline: the overhead of a formatter is its time minus the baseline time.
+
+    python test/benchmark/formatter_overhead.py --features 200 --scenarios 50 --steps 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from behave.formatter.base import Formatter, StreamOpener
+from behave.model import Status
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from featurereporter.csvformatter import EaiCsv, EaiCsvFull  # noqa: E402
+from featurereporter.sqliteformatter import EaiSqlite  # noqa: E402
+
+STATUSES = [Status.passed] * 8 + [Status.failed, Status.skipped]
+
+
+def build_model(features: int, scenarios: int, steps: int, outline_every: int) -> list:
+    """Return the synthetic features as (feature, [(scenario, [step])])"""
+    model = []
+    for feature_index in range(features):
+        feature = SimpleNamespace(name=f"Feature {feature_index}",
+                                  filename=f"features/feature_{feature_index}.feature",
+                                  tags=[f"epic=EPIC-{feature_index % 10}", "regression"],
+                                  description=["A synthetic feature"])
+        feature_scenarios = []
+        for scenario_index in range(scenarios):
+            if outline_every and scenario_index % outline_every == 0:
+                keyword = "Scenario Outline"
+                name = f"Outline {scenario_index} -- @1.{scenario_index} Examples"
+            else:
+                keyword = "Scenario"
+                name = f"Scenario {scenario_index}"
+            scenario = SimpleNamespace(keyword=keyword,
+                                       name=name,
+                                       tags=["smoke", f"id=TC-{feature_index}-{scenario_index}"],
+                                       description=[])
+            scenario_steps = [SimpleNamespace(keyword="Given",
+                                              name=f"step {step_index}",
+                                              table=None,
+                                              status=STATUSES[step_index % len(STATUSES)])
+                              for step_index in range(steps)]
+            feature_scenarios.append((scenario, scenario_steps))
+        model.append((feature, feature_scenarios))
+    return model
+
+
+def drive(formatter_class, model, folder: str) -> float:
+    """Feed the model to a new formatter and return the elapsed seconds"""
+    output = os.path.join(folder, f"{formatter_class.__name__}.out")
+    config = SimpleNamespace(defaults={"userdata": {}}, base_dir=folder)
+    start = time.perf_counter()
+    # A text stream as sys.stdout: the csv formatters reconfigure it before writing
+    stream = open(output, "w")
+    formatter = formatter_class(StreamOpener(filename=output, stream=stream), config)
+    for feature, scenarios in model:
+        formatter.uri(feature.filename)
+        formatter.feature(feature)
+        for scenario, steps in scenarios:
+            formatter.scenario(scenario)
+            for step in steps:
+                formatter.step(step)
+            for step in steps:
+                formatter.match(None)
+                formatter.result(step)
+        formatter.eof()
+    formatter.close()
+    elapsed = time.perf_counter() - start
+    stream.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--features", type=int, default=100)
+    parser.add_argument("--scenarios", type=int, default=50)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--outline-every", type=int, default=5,
+                        help="One outline row every N scenarios, 0 for none")
+    parser.add_argument("--repeat", type=int, default=5, help="The best time of N runs is kept")
+    args = parser.parse_args()
+
+    model = build_model(args.features, args.scenarios, args.steps, args.outline_every)
+    step_count = args.features * args.scenarios * args.steps
+    print(f"{args.features} features, {args.features * args.scenarios} scenarios, "
+          f"{step_count} steps, best of {args.repeat}")
+    with tempfile.TemporaryDirectory() as folder:
+        timings = {}
+        for formatter_class in (Formatter, EaiCsv, EaiCsvFull, EaiSqlite):
+            timings[formatter_class] = min(drive(formatter_class, model, folder)
+                                           for _ in range(args.repeat))
+    baseline = timings[Formatter]
+    for formatter_class, elapsed in timings.items():
+        overhead = elapsed - baseline
+        print(f"{formatter_class.__name__:12} {elapsed * 1000:10.1f} ms "
+              f"overhead {overhead * 1000:10.1f} ms "
+              f"{overhead * 1e9 / step_count:8.1f} ns/step")
+
+
+if __name__ == '__main__':
+    main()
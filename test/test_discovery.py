@@ -0,0 +1,135 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+"""
+Ignore rules and feature discovery tests.
+
+    python -m pytest test/test_discovery.py
+"""
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from featurereporter.discovery import IGNORE_FILE, FeatureDiscovery, IgnoreRules  # noqa: E402
+
+
+class IgnoreRulesTest(unittest.TestCase):
+
+    def test_comments_and_blank_lines(self):
+        rules = IgnoreRules(["", "  ", "# generated/"])
+        self.assertFalse(rules.ignored("generated", True))
+        self.assertEqual(IgnoreRules([]).signature, rules.signature)
+
+    def test_name(self):
+        rules = IgnoreRules(["*.tmp.feature"])
+        self.assertTrue(rules.ignored("a.tmp.feature", False))
+        self.assertTrue(rules.ignored("deep/folder/a.tmp.feature", False))
+        self.assertFalse(rules.ignored("a.feature", False))
+
+    def test_directory_only(self):
+        rules = IgnoreRules(["generated/"])
+        self.assertTrue(rules.ignored("generated", True))
+        self.assertTrue(rules.ignored("deep/generated", True))
+        self.assertFalse(rules.ignored("generated", False))
+
+    def test_anchored(self):
+        rules = IgnoreRules(["legacy/*.feature", "/root.feature"])
+        self.assertTrue(rules.ignored("legacy/old.feature", False))
+        self.assertFalse(rules.ignored("other/legacy/old.feature", False))
+        self.assertFalse(rules.ignored("legacy/deep/old.feature", False))
+        self.assertTrue(rules.ignored("root.feature", False))
+
+    def test_negation(self):
+        rules = IgnoreRules([".*", "!.scenarios/", "legacy/*.feature", "!legacy/keep.feature"])
+        self.assertTrue(rules.ignored(".git", True))
+        self.assertFalse(rules.ignored(".scenarios", True))
+        self.assertTrue(rules.ignored("legacy/old.feature", False))
+        self.assertFalse(rules.ignored("legacy/keep.feature", False))
+
+    def test_last_rule_wins(self):
+        self.assertTrue(IgnoreRules(["!a.feature", "a.feature"]).ignored("a.feature", False))
+
+
+class FeatureDiscoveryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.repository = Path(self.folder.name, "features")
+        self.manifest_file = Path(self.folder.name, "cache", "manifest.json")
+        for relative in ("b.feature", "a/z.feature", "a/b/y.feature", "build/x.feature",
+                         ".git/hidden.feature", "venv/lib.feature", "notes.txt"):
+            self.write(relative)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def write(self, relative: str, content: str = "Feature: discovered\n"):
+        path = self.repository / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+
+    def discover(self) -> FeatureDiscovery:
+        discovery = FeatureDiscovery(self.repository, self.manifest_file)
+        self.files = [os.path.relpath(path, self.repository).replace(os.sep, "/")
+                      for path in discovery.discover()]
+        return discovery
+
+    def test_sorted_and_default_ignores(self):
+        self.discover()
+        self.assertEqual(["a/b/y.feature", "a/z.feature", "b.feature", "build/x.feature"],
+                         self.files)
+
+    def test_ignore_file(self):
+        self.write(IGNORE_FILE, "build/\n!.git/\na/*.feature\n")
+        self.discover()
+        self.assertEqual([".git/hidden.feature", "a/b/y.feature", "b.feature"], self.files)
+
+    def test_manifest(self):
+        self.assertFalse(self.discover().from_manifest)
+        self.assertTrue(self.manifest_file.is_file())
+        self.assertTrue(self.discover().from_manifest)
+        # A new file changes its folder
+        self.write("a/b/new.feature")
+        discovery = self.discover()
+        self.assertFalse(discovery.from_manifest)
+        self.assertIn("a/b/new.feature", self.files)
+        # So does a changed file
+        self.write("b.feature", "Feature: changed\n")
+        self.assertFalse(self.discover().from_manifest)
+        # And changed rules
+        self.assertTrue(self.discover().from_manifest)
+        self.write(IGNORE_FILE, "build/\n")
+        self.assertFalse(self.discover().from_manifest)
+        self.assertNotIn("build/x.feature", self.files)
+
+    def test_corrupted_manifest(self):
+        self.discover()
+        self.manifest_file.write_text("{", encoding="utf-8")
+        self.assertFalse(self.discover().from_manifest)
+        self.assertEqual(4, len(self.files))
+
+    @unittest.skipIf(os.name == "nt", "symbolic links need privileges on Windows")
+    def test_linked_folders(self):
+        shared = Path(self.folder.name, "shared")
+        shared.mkdir()
+        (shared / "shared.feature").write_text("Feature: shared\n", encoding="utf-8")
+        # The shared folder is linked twice, and links back to the repository
+        os.symlink(shared, self.repository / "link1")
+        os.symlink(shared, self.repository / "link2")
+        os.symlink(self.repository, shared / "cycle")
+        self.discover()
+        self.assertEqual(["a/b/y.feature", "a/z.feature", "b.feature", "build/x.feature",
+                          "link1/shared.feature"], self.files)
+
+    @unittest.skipIf(os.name == "nt", "symbolic links need privileges on Windows")
+    def test_broken_link(self):
+        os.symlink(Path(self.folder.name, "missing.feature"), self.repository / "broken.feature")
+        self.discover()
+        self.assertNotIn("broken.feature", self.files)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+"""
+Partial documents merge tests.
+
+    python -m pytest test/test_docxmerge.py
+"""
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import docx
+from docx.enum.style import WD_STYLE_TYPE
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml.ns import qn
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from featurereporter.docxmerge import merge_documents  # noqa: E402
+from featurereporter.reportgenerator import ExportUtilities  # noqa: E402
+
+
+class MergeDocumentsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.picture = Path(self.folder.name, "logo.png")
+        Image.new("RGB", (4, 4), "red").save(self.picture)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def partial(self, name: str, text: str, style: str = None, picture: bool = False) -> Path:
+        document = docx.Document()
+        if style is not None:
+            document.styles.add_style(style, WD_STYLE_TYPE.PARAGRAPH)
+        document.add_paragraph(text, style)
+        if picture:
+            document.add_picture(str(self.picture))
+            paragraph = document.add_paragraph()
+            r_id = paragraph.part.relate_to("https://example.com", RT.HYPERLINK,
+                                            is_external=True)
+            hyperlink = paragraph._p.makeelement(qn("w:hyperlink"), {qn("r:id"): r_id})
+            paragraph._p.append(hyperlink)
+        path = Path(self.folder.name, name)
+        document.save(path)
+        return path
+
+    def test_merge(self):
+        partials = [self.partial("1.docx", "First", picture=True),
+                    self.partial("2.docx", "Second", style="Merged style", picture=True),
+                    self.partial("3.docx", "Third", style="Merged style")]
+        output = Path(self.folder.name, "merged.docx")
+        self.assertEqual(3, merge_documents(partials, output))
+        merged = docx.Document(output)
+        self.assertEqual(["First", "Second", "Third"],
+                         [paragraph.text for paragraph in merged.paragraphs if paragraph.text])
+        self.assertEqual("Merged style", merged.paragraphs[3].style.name)
+        # Identical pictures are stored once, the drawings keep distinct ids
+        images = [rel for rel in merged.part.rels.values() if rel.reltype == RT.IMAGE]
+        self.assertEqual(1, len(images))
+        self.assertEqual(2, len(merged.inline_shapes))
+        ids = [drawing.get("id") for drawing in merged.element.body.iter(qn("wp:docPr"))]
+        self.assertEqual(len(ids), len(set(ids)))
+        # The external link of the second partial points to a relationship of the merged one
+        for hyperlink in merged.element.body.iter(qn("w:hyperlink")):
+            self.assertEqual("https://example.com",
+                             merged.part.rels[hyperlink.get(qn("r:id"))].target_ref)
+        # The section properties stay last
+        self.assertEqual(qn("w:sectPr"), merged.element.body[-1].tag)
+
+    def test_no_partial(self):
+        with self.assertRaises(ValueError):
+            merge_documents([], Path(self.folder.name, "merged.docx"))
+
+    def test_shards(self):
+        repository = Path(self.folder.name, "features")
+        repository.mkdir()
+        for name in ("first", "second", "third"):
+            Path(repository, f"{name}.feature").write_text(
+                f"Feature: {name.title()} feature\n\n  Scenario: {name.title()} scenario\n"
+                f"    Given a step\n", encoding="utf-8")
+        partials = []
+        for index in (1, 2):
+            report = ExportUtilities()
+            report.feature_repository = str(repository)
+            report.force = True
+            report.shard = (index, 2)
+            partials.append(Path(self.folder.name, f"shard{index}.docx"))
+            report.create_application_documentation(output_file_name=str(partials[-1]))
+        output = Path(self.folder.name, "merged.docx")
+        merge_documents(partials, output)
+        text = "\n".join(paragraph.text for paragraph in docx.Document(output).paragraphs)
+        for name in ("First", "Second", "Third"):
+            self.assertEqual(1, text.count(f"{name} feature"), name)
+
+
+if __name__ == "__main__":
+    unittest.main()
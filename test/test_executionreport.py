@@ -0,0 +1,98 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+"""
+Behave plain report reading tests.
+
+    python -m pytest test/test_executionreport.py
+"""
+import bz2
+import gzip
+import lzma
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from featurereporter.executionreport import FAILED, PASSED, SKIPPED, ScenarioResult, \
+    aggregate_status, index_results, iter_scenario_results, open_report  # noqa: E402
+
+REPORT = """Feature: Adding
+  Scenario: Simple addition
+    Given 1 ... passed in 0.001s
+    When I add 1 ... passed in 0.000s
+    Then I get 2 ... failed in 0.000s
+  Scenario: Not run
+    Given nothing ... skipped in 0.000s
+  Scenario Outline: Adding 1 -- @1.1 Examples
+    Given 1 ... passed in 0.000s
+
+Feature: Empty feature
+
+Feature: Subtracting
+  Scenario: Simple subtraction
+    Given 2 ... passed in 0.000s
+"""
+
+RESULTS = [ScenarioResult("Adding", "Simple addition", FAILED),
+           ScenarioResult("Adding", "Not run", SKIPPED),
+           ScenarioResult("Adding", "Adding 1 -- @1.1 Examples", PASSED),
+           ScenarioResult("Empty feature", None, SKIPPED),
+           ScenarioResult("Subtracting", "Simple subtraction", PASSED)]
+
+
+class ExecutionReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def read(self, path: Path) -> list:
+        with open_report(str(path)) as lines:
+            return list(iter_scenario_results(lines))
+
+    def test_results(self):
+        self.assertEqual(RESULTS, list(iter_scenario_results(REPORT.splitlines(True))))
+
+    def test_mapped_report(self):
+        path = Path(self.folder.name, "report.txt")
+        path.write_text(REPORT, encoding="utf-8")
+        self.assertEqual(RESULTS, self.read(path))
+
+    def test_empty_report(self):
+        path = Path(self.folder.name, "report.txt")
+        path.touch()
+        self.assertEqual([], self.read(path))
+
+    def test_compressed_reports(self):
+        for extension, compressor in ((".gz", gzip.open), (".xz", lzma.open),
+                                      (".bz2", bz2.open), (".GZ", gzip.open)):
+            with self.subTest(extension=extension):
+                path = Path(self.folder.name, f"report.txt{extension}")
+                with compressor(path, "wt", encoding="utf-8") as report:
+                    report.write(REPORT)
+                self.assertEqual(RESULTS, self.read(path))
+
+    def test_index(self):
+        index = index_results(REPORT.splitlines(True) + ["Feature: Adding\n",
+                                                         "  Scenario: Simple addition\n",
+                                                         "    Given 1 ... passed\n"])
+        # A scenario reported twice keeps its last status
+        self.assertEqual(PASSED, index[("Adding", "Simple addition")])
+        self.assertEqual(PASSED, index[("Adding", "Adding 1 -- @1.1 Examples")])
+        self.assertEqual(SKIPPED, index[("Empty feature", None)])
+
+    def test_aggregate_status(self):
+        self.assertEqual(FAILED, aggregate_status([PASSED, FAILED, None]))
+        self.assertEqual(PASSED, aggregate_status([SKIPPED, PASSED]))
+        self.assertEqual(SKIPPED, aggregate_status([None, SKIPPED]))
+        self.assertIsNone(aggregate_status([None]))
+        self.assertIsNone(aggregate_status([]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+"""
+Input fingerprint, reference index and fingerprint store tests.
+
+    python -m pytest test/test_fingerprint.py
+"""
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from featurereporter.fingerprint import FingerprintStore, InputFingerprint, \
+    ReferenceIndex  # noqa: E402
+
+
+class FingerprintTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def write(self, name: str, content: str = "content") -> Path:
+        path = Path(self.folder.name, name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+        return path
+
+
+class InputFingerprintTest(FingerprintTestCase):
+
+    def digest(self, *options) -> str:
+        fingerprint = InputFingerprint()
+        for name, value in options:
+            fingerprint.add(name, value)
+        fingerprint.add_tree(Path(self.folder.name, "tree"))
+        fingerprint.add_file(Path(self.folder.name, "single.txt"))
+        return fingerprint.hexdigest()
+
+    def test_options(self):
+        self.write("tree/a.feature")
+        self.assertEqual(self.digest(("title", "A"), ("tags", {"b": 1, "a": 2})),
+                         self.digest(("title", "A"), ("tags", {"a": 2, "b": 1})))
+        self.assertNotEqual(self.digest(("title", "A")), self.digest(("title", "B")))
+
+    def test_files(self):
+        feature = self.write("tree/sub/a.feature")
+        reference = self.digest()
+        self.assertEqual(reference, self.digest())
+        # The missing single file counts, so does its creation
+        single = self.write("single.txt")
+        created = self.digest()
+        self.assertNotEqual(reference, created)
+        single.unlink()
+        feature.write_text("changed content", encoding="utf-8")
+        self.assertNotEqual(reference, self.digest())
+        self.write("tree/b.feature")
+        self.assertNotEqual(created, self.digest())
+
+    def test_add_file_status(self):
+        path = self.write("single.txt")
+        fingerprint = InputFingerprint()
+        self.assertEqual(len("content"), fingerprint.add_file(path).st_size)
+        self.assertIsNone(fingerprint.add_file(Path(self.folder.name, "missing.txt")))
+
+
+class ReferenceIndexTest(FingerprintTestCase):
+
+    def test_scanned_once(self):
+        index_file = Path(self.folder.name, "cache", "references.json")
+        feature = self.write("a.feature")
+        scanned = []
+
+        def scanner(path: str) -> list:
+            scanned.append(path)
+            return [Path(self.folder.name, "a.puml")]
+
+        index = ReferenceIndex(index_file)
+        expected = [str(Path(self.folder.name, "a.puml"))]
+        self.assertEqual(expected, index.references(feature, os.stat(feature), scanner))
+        self.assertEqual(expected, index.references(feature, os.stat(feature), scanner))
+        index.save()
+        # A reloaded index does not scan an unchanged file again
+        reloaded = ReferenceIndex(index_file)
+        self.assertEqual(expected, reloaded.references(feature, os.stat(feature), scanner))
+        self.assertEqual(1, len(scanned))
+        feature.write_text("changed content", encoding="utf-8")
+        reloaded.references(feature, os.stat(feature), scanner)
+        self.assertEqual(2, len(scanned))
+
+    def test_corrupted_index(self):
+        index_file = self.write("references.json", "{")
+        feature = self.write("a.feature")
+        index = ReferenceIndex(index_file)
+        self.assertEqual([], index.references(feature, os.stat(feature), lambda path: []))
+
+
+class FingerprintStoreTest(FingerprintTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store = FingerprintStore(Path(self.folder.name, "fingerprints"))
+        self.outputs = [str(self.write("document.docx")), str(self.write("document.csv"))]
+
+    def test_matches(self):
+        self.assertFalse(self.store.matches(self.outputs, "digest"))
+        self.store.record(self.outputs, "digest")
+        self.assertTrue(self.store.matches(self.outputs, "digest"))
+        # The outputs order does not matter
+        self.assertTrue(self.store.matches(self.outputs[::-1], "digest"))
+        self.assertFalse(self.store.matches(self.outputs, "other"))
+        self.assertFalse(self.store.matches(self.outputs[:1], "digest"))
+
+    def test_replaced_output(self):
+        self.store.record(self.outputs, "digest")
+        self.write("document.csv", "replaced content")
+        self.assertFalse(self.store.matches(self.outputs, "digest"))
+
+    def test_prune(self):
+        self.store.record(self.outputs, "digest")
+        temporary = [str(self.write("temporary.docx"))]
+        self.store.record(temporary, "digest")
+        os.remove(temporary[0])
+        self.store.prune()
+        self.assertEqual(1, len(list(Path(self.folder.name, "fingerprints").glob("*.json"))))
+        self.assertTrue(self.store.matches(self.outputs, "digest"))
+
+
+if __name__ == "__main__":
+    unittest.main()
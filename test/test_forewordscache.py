@@ -0,0 +1,93 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+"""
+Forewords cache tests.
+
+    python -m pytest test/test_forewordscache.py
+"""
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from featurereporter.forewordscache import ForewordRecord, ForewordsCache  # noqa: E402
+from featurereporter.plantuml import include_closure  # noqa: E402
+
+
+class ForewordsCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.cache = ForewordsCache(Path(self.folder.name, "cache"))
+        self.foreword = self.write("foreword.md", "# Foreword")
+        self.image = self.write("picture.png", "png")
+        self.diagram = self.write("diagram.puml", "@startuml\n!include common.puml\n@enduml\n")
+        self.common = self.write("common.puml", "!include styles/missing.puml\n")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def write(self, name: str, content: str) -> Path:
+        path = Path(self.folder.name, name)
+        path.write_text(content, encoding="utf-8")
+        return path
+
+    def put(self, key: str) -> ForewordRecord:
+        record = ForewordRecord()
+        record.depends_on(self.foreword)
+        record.depends_on(self.diagram)
+        for included, _ in include_closure(self.diagram):
+            record.depends_on(included)
+        record.images.append(str(self.image))
+        self.cache.put(key, "## Foreword", record)
+        return record
+
+    def test_key(self):
+        key = ForewordsCache.key("# Foreword", "folder", True)
+        self.assertEqual(key, ForewordsCache.key("# Foreword", "folder", True))
+        self.assertNotEqual(key, ForewordsCache.key("# Foreword", "folder", False))
+        self.assertNotEqual(key, ForewordsCache.key("# Other", "folder", True))
+
+    def test_hit(self):
+        key = ForewordsCache.key("# Foreword")
+        self.assertIsNone(self.cache.get(key))
+        record = self.put(key)
+        # The diagram, its include and the missing nested include are dependencies
+        self.assertEqual(4, len(record.dependencies))
+        self.assertEqual("## Foreword", self.cache.get(key))
+
+    def test_changed_include(self):
+        key = ForewordsCache.key("# Foreword")
+        self.put(key)
+        self.common.write_text("!include styles/missing.puml\nskinparam monochrome true\n",
+                               encoding="utf-8")
+        self.assertIsNone(self.cache.get(key))
+
+    def test_created_include(self):
+        key = ForewordsCache.key("# Foreword")
+        self.put(key)
+        # A file of the same name elsewhere is not the include
+        self.write("missing.puml", "")
+        self.assertEqual("## Foreword", self.cache.get(key))
+        Path(self.folder.name, "styles").mkdir()
+        self.write("styles/missing.puml", "skinparam monochrome true\n")
+        self.assertIsNone(self.cache.get(key))
+
+    def test_removed_image(self):
+        key = ForewordsCache.key("# Foreword")
+        self.put(key)
+        self.image.unlink()
+        self.assertIsNone(self.cache.get(key))
+
+    def test_corrupted_entry(self):
+        key = ForewordsCache.key("# Foreword")
+        self.put(key)
+        Path(self.cache.folder, f"{key}.json").write_text("{", encoding="utf-8")
+        self.assertIsNone(self.cache.get(key))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+"""
+Execution history tests.
+
+    python -m pytest test/test_history.py
+"""
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from featurereporter.executionreport import FAILED, PASSED, SKIPPED, ScenarioResult  # noqa: E402
+from featurereporter.history import HistoryStore  # noqa: E402
+
+REPORT = """Feature: Adding
+  Scenario: Simple addition
+    Then I get 2 ... passed in 0.000s
+  Scenario: Double addition
+    Then I get 4 ... failed in 0.000s
+"""
+
+
+def run(addition: str, double: str) -> list:
+    return [ScenarioResult("Adding", "Simple addition", addition),
+            ScenarioResult("Adding", "Double addition", double),
+            ScenarioResult("Empty feature", None, SKIPPED)]
+
+
+class HistoryStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.store = HistoryStore(os.path.join(self.folder.name, "history.sqlite"), batch_size=1)
+
+    def tearDown(self):
+        self.store.close()
+        self.folder.cleanup()
+
+    def test_append_and_trend(self):
+        self.assertEqual((0, None), self.store.revision())
+        first = self.store.append_run(run(PASSED, PASSED), "2024-01-02T00:00:00")
+        second = self.store.append_run(run(PASSED, FAILED), "2024-01-01T00:00:00")
+        self.assertEqual((2, second), self.store.revision())
+        self.assertNotEqual(first, second)
+        # Oldest first, the features without scenario are not counted
+        self.assertEqual([("2024-01-01T00:00:00", 2, 1, 1), ("2024-01-02T00:00:00", 2, 2, 0)],
+                         self.store.trend())
+        self.assertEqual([("2024-01-02T00:00:00", 2, 2, 0)], self.store.trend(runs=1))
+
+    def test_flaky(self):
+        self.store.append_run(run(PASSED, PASSED), "2024-01-01T00:00:00")
+        self.store.append_run(run(PASSED, FAILED), "2024-01-02T00:00:00")
+        self.store.append_run(run(PASSED, FAILED), "2024-01-03T00:00:00")
+        self.assertEqual([("Adding", "Double addition", 3, 2)], self.store.flaky())
+        # Always failing during the last runs is not flaky
+        self.assertEqual([], self.store.flaky(runs=2))
+
+    def test_source_once(self):
+        self.assertIsNotNone(self.store.append_run(run(PASSED, PASSED), source="ci-1"))
+        self.assertTrue(self.store.has_source("ci-1"))
+        self.assertIsNone(self.store.append_run(run(FAILED, FAILED), source="ci-1"))
+        self.assertEqual(1, self.store.revision()[0])
+
+    def test_import_report(self):
+        report = Path(self.folder.name, "report.txt")
+        report.write_text(REPORT, encoding="utf-8")
+        self.assertIsNotNone(self.store.import_report(str(report)))
+        self.assertIsNone(self.store.import_report(str(report)))
+        (_, total, passed, failed), = self.store.trend()
+        self.assertEqual((2, 1, 1), (total, passed, failed))
+        # A changed report is a new run
+        report.write_text(REPORT.replace("failed", "passed"), encoding="utf-8")
+        self.assertIsNotNone(self.store.import_report(str(report), "2099-01-01T00:00:00"))
+        self.assertEqual(("2099-01-01T00:00:00", 2, 2, 0), self.store.trend()[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
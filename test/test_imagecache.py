@@ -0,0 +1,106 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+"""
+Picture cache tests.
+
+    python -m pytest test/test_imagecache.py
+"""
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import docx
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from featurereporter.imagecache import CachedHtmlToDocx, ImageCache  # noqa: E402
+
+
+class ImageCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def write(self, name: str, content: bytes) -> Path:
+        path = Path(self.folder.name, name)
+        path.write_bytes(content)
+        return path
+
+    def test_read_once(self):
+        path = self.write("a.png", b"a" * 10)
+        loaded = []
+
+        def loader(picture: str) -> bytes:
+            loaded.append(picture)
+            return b"resized"
+
+        cache = ImageCache()
+        self.assertEqual(b"resized", cache.get(path, loader))
+        self.assertEqual(b"resized", cache.get(str(path), loader))
+        self.assertEqual([os.path.abspath(path)], loaded)
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        self.assertEqual(len(b"resized"), cache.size)
+
+    def test_changed_file(self):
+        path = self.write("a.png", b"a" * 10)
+        cache = ImageCache()
+        self.assertEqual(b"a" * 10, cache.get(path))
+        path.write_bytes(b"b" * 12)
+        self.assertEqual(b"b" * 12, cache.get(path))
+        self.assertEqual(2, cache.misses)
+
+    def test_eviction(self):
+        cache = ImageCache(max_bytes=25)
+        first, second, third = (self.write(f"{name}.png", name.encode() * 10)
+                                for name in "abc")
+        cache.get(first)
+        cache.get(second)
+        # The first picture becomes the most recently used, the second one is evicted
+        cache.get(first)
+        cache.get(third)
+        self.assertEqual(20, cache.size)
+        cache.get(first)
+        cache.get(second)
+        self.assertEqual((2, 4), (cache.hits, cache.misses))
+
+    def test_larger_than_cache(self):
+        cache = ImageCache(max_bytes=5)
+        self.assertEqual(b"a" * 10, cache.get(self.write("a.png", b"a" * 10)))
+        self.assertEqual(0, cache.size)
+
+    def test_missing_file(self):
+        with self.assertRaises(OSError):
+            ImageCache().get(Path(self.folder.name, "missing.png"))
+
+
+class CachedHtmlToDocxTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.picture = Path(self.folder.name, "logo.png")
+        Image.new("RGB", (4, 4), "red").save(self.picture)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_pictures(self):
+        cache = ImageCache()
+        document = docx.Document()
+        parser = CachedHtmlToDocx(cache)
+        html = f'<p><img src="{self.picture}"/></p><p><img src="{self.picture}"/></p>' \
+               f'<p><img src="{Path(self.folder.name, "missing.png")}"/></p>'
+        parser.add_html_to_document(html, document)
+        self.assertEqual(2, len(document.inline_shapes))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        # The missing picture is named, without its folder
+        self.assertIn("<image: missing.png>", [paragraph.text for paragraph in document.paragraphs])
+
+
+if __name__ == "__main__":
+    unittest.main()
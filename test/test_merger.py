@@ -0,0 +1,115 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+"""
+Result merge tests, on csv and plain report files.
+
+    python -m pytest test/test_merger.py
+"""
+import csv
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from featurereporter.executionreport import index_results  # noqa: E402
+from featurereporter.merger import CSV_FIELDS, merge_results, merge_rows  # noqa: E402
+
+WORKER_CSV = [
+    {"epic": "E1", "feature_name": "Numbers", "scenario_id": "S1", "scenario_name": "Add",
+     "status": "failed", "order": ""},
+    {"epic": "E1", "feature_name": "Numbers", "scenario_id": "S2-1.1",
+     "scenario_name": "adding 1-Values", "status": "failed", "order": "1.1"},
+    {"epic": "E1", "feature_name": "Numbers", "scenario_id": "S2-1.2",
+     "scenario_name": "adding 1-Values", "status": "passed", "order": "1.2"},
+]
+
+RERUN_PLAIN = """Feature: Numbers
+
+  Scenario: Add
+    Given a number ... passed
+    Then it is added ... passed
+
+  Scenario Outline: adding 1 -- @1.1 Values
+    Given a number ... passed
+    Then one is added ... passed
+
+"""
+
+
+class MergerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.worker = Path(self.folder.name, "worker.csv")
+        with open(self.worker, "w", newline="", encoding="utf-8") as worker:
+            writer = csv.DictWriter(worker, CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(WORKER_CSV)
+        self.rerun = Path(self.folder.name, "rerun.txt")
+        self.rerun.write_text(RERUN_PLAIN, encoding="utf-8")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def read_csv(self, path: Path) -> dict:
+        with open(path, newline="", encoding="utf-8") as merged:
+            return {(row["scenario_name"], row["order"]): row for row in csv.DictReader(merged)}
+
+    def test_rerun_overrides_worker(self):
+        rows = list(merge_rows([str(self.worker), str(self.rerun)]))
+        self.assertEqual(3, len(rows))
+        statuses = {(row["scenario_name"], row["order"]): row["status"] for row in rows}
+        self.assertEqual({("Add", ""): "passed",
+                          ("adding 1-Values", "1.1"): "passed",
+                          ("adding 1-Values", "1.2"): "passed"}, statuses)
+
+    def test_worker_overrides_rerun(self):
+        rows = list(merge_rows([str(self.rerun), str(self.worker)]))
+        statuses = {(row["scenario_name"], row["order"]): row["status"] for row in rows}
+        self.assertEqual("failed", statuses[("Add", "")])
+        self.assertEqual("failed", statuses[("adding 1-Values", "1.1")])
+
+    def test_csv_output(self):
+        output = Path(self.folder.name, "merged.csv")
+        merge_results([str(self.worker), str(self.rerun)], str(output), chunk_size=1)
+        merged = self.read_csv(output)
+        self.assertEqual(3, len(merged))
+        # The outline row of the plain report is written as an EaiCsv row
+        self.assertEqual("passed", merged[("adding 1-Values", "1.1")]["status"])
+        self.assertNotIn(("adding 1 -- @1.1 Values", ""), merged)
+
+    def test_plain_output(self):
+        output = Path(self.folder.name, "merged.txt")
+        merge_results([str(self.worker), str(self.rerun)], str(output))
+        with open(output, encoding="utf-8") as merged:
+            statuses = index_results(merged)
+        # Outline rows get the exact behave name, usable as --execution input
+        self.assertEqual({("Numbers", "Add"): "passed",
+                          ("Numbers", "adding 1 -- @1.1 Values"): "passed",
+                          ("Numbers", "adding 1 -- @1.2 Values"): "passed"}, statuses)
+
+    def test_plain_inputs(self):
+        output = Path(self.folder.name, "merged.txt")
+        merge_results([str(self.rerun), str(self.rerun)], str(output))
+        with open(output, encoding="utf-8") as merged:
+            self.assertEqual(RERUN_PLAIN.count("Scenario"), merged.read().count("Scenario:"))
+
+    def test_invalid_inputs(self):
+        output = Path(self.folder.name, "merged.csv")
+        output.write_text("previous", encoding="utf-8")
+        not_csv = Path(self.folder.name, "other.csv")
+        not_csv.write_text("a,b\n1,2\n", encoding="utf-8")
+        for files in ([str(self.worker), str(not_csv)],
+                      [str(self.worker), str(Path(self.folder.name, "missing.txt"))]):
+            with self.subTest(files=files):
+                with self.assertRaises((OSError, ValueError)):
+                    merge_results(files, str(output))
+                # Inputs are checked before the output is touched
+                self.assertEqual("previous", output.read_text(encoding="utf-8"))
+
+
+if __name__ == "__main__":
+    unittest.main()
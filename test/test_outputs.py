@@ -0,0 +1,124 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+"""
+Csv and json outputs tests, written during the document generation.
+
+    python -m pytest test/test_outputs.py
+"""
+import csv
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from featurereporter.outputs import CSV_COLUMNS, OutputWriter  # noqa: E402
+from featurereporter.reportgenerator import ExportUtilities  # noqa: E402
+
+ADDING = """@epic=Maths
+Feature: Adding
+  Adding numbers
+
+  @id=ADD-1
+  Scenario: Simple addition
+    Given 1
+    When I add 1
+    Then I get 2
+
+  @id=ADD-2 @smoke
+  Scenario Outline: Adding <value>
+    Given <value>
+    Then I get a number
+
+    Examples: Values
+      | value |
+      | 1     |
+      | 2     |
+"""
+
+SUBTRACTING = """@epic=Maths
+Feature: Subtracting
+
+  @id=SUB-1
+  Scenario: Simple subtraction
+    Given 2
+"""
+
+
+class OutputsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.repository = Path(self.folder.name, "features")
+        Path(self.repository, "maths").mkdir(parents=True)
+        Path(self.repository, "maths", "adding.feature").write_text(ADDING, encoding="utf-8")
+        Path(self.repository, "maths", "subtracting.feature").write_text(SUBTRACTING,
+                                                                         encoding="utf-8")
+        self.output = Path(self.folder.name, "output")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def generate(self, *extensions):
+        report = ExportUtilities()
+        report.feature_repository = str(self.repository)
+        report.report_title = "Outputs"
+        report.force = True
+        report.create_application_documentation(
+            output_file_name=[str(self.output / f"document{extension}")
+                              for extension in extensions])
+
+    def test_all_outputs(self):
+        self.generate(".docx", ".csv", ".json")
+        self.assertEqual(["document.csv", "document.docx", "document.json"],
+                         sorted(path.name for path in self.output.iterdir()))
+
+    def test_csv(self):
+        # No docx is requested
+        self.generate(".csv")
+        self.assertEqual(["document.csv"], [path.name for path in self.output.iterdir()])
+        with open(self.output / "document.csv", newline="", encoding="utf-8") as csv_file:
+            reader = csv.DictReader(csv_file)
+            self.assertEqual(CSV_COLUMNS, reader.fieldnames)
+            rows = list(reader)
+        self.assertEqual({"epic": "Maths"}, {key: value for key, value in rows[0].items()
+                                             if value})
+        self.assertEqual(("maths/adding.feature", "Adding"),
+                         (rows[1]["feature_filename"], rows[1]["feature_name"]))
+        scenarios = [(row["scenario_id"], row["scenario_name"], row["scenario_is_outline"])
+                     for row in rows if row["scenario_id"]]
+        self.assertEqual([("ADD-1", "Simple addition", "False"),
+                          ("ADD-2-1.1", "Adding 1-Values", "True"),
+                          ("ADD-2-1.2", "Adding 2-Values", "True"),
+                          ("SUB-1", "Simple subtraction", "False")], scenarios)
+        # One epic row for both features
+        self.assertEqual(1, sum(row["epic"] == "Maths" and not row["feature_name"]
+                                for row in rows))
+
+    def test_json(self):
+        self.generate(".json")
+        with open(self.output / "document.json", encoding="utf-8") as json_file:
+            summary = json.load(json_file)
+        self.assertEqual("Outputs", summary["title"])
+        self.assertEqual([("Adding", 2, 1), ("Subtracting", 1, 0)],
+                         [(feature["name"], feature["scenarios"], feature["outlines"])
+                          for feature in summary["features"]])
+        self.assertEqual({"epic=Maths": 2, "id=ADD-1": 1, "id=ADD-2": 1, "smoke": 1,
+                          "id=SUB-1": 1}, summary["tags"])
+        self.assertIn("statistics", summary)
+
+    def test_discard(self):
+        path = self.output / "document.csv"
+        writer = OutputWriter(str(path))
+        writer.open(None)
+        writer.stream.write("partial")
+        writer.discard()
+        # Neither the output nor its temporary file remain
+        self.assertEqual([], list(self.output.iterdir()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+"""
+Generation plan and calibration tests.
+
+    python -m pytest test/test_planning.py
+"""
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from featurereporter.planning import CALIBRATION_FILE, Calibration, scan_feature  # noqa: E402
+from featurereporter.reportgenerator import ExportUtilities  # noqa: E402
+
+ENGLISH = """Feature: Planned feature
+
+  Scenario: First
+    Given a step
+    !!Workflow: workflows/first.puml
+
+  Scenario Outline: Second
+    Given a <value>
+
+    Examples: Values
+      | value |
+      | 1     |
+      | 2     |
+"""
+
+FRENCH = """# language: fr
+Fonctionnalité: Fonctionnalité planifiée
+
+  Scénario: Premier
+    Soit une étape
+
+  Plan du scénario: Second
+    Soit une <valeur>
+
+    Exemples:
+      | valeur |
+      | 1      |
+      | 2      |
+      | 3      |
+"""
+
+
+class ScanFeatureTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def scan(self, content: str) -> dict:
+        path = Path(self.folder.name, "planned.feature")
+        path.write_text(content, encoding="utf-8")
+        return scan_feature(path)
+
+    def test_english(self):
+        self.assertEqual({"scenarios": 2, "outlines": 1, "example_rows": 2,
+                          "workflows": ["workflows/first.puml"]}, self.scan(ENGLISH))
+
+    def test_declared_language(self):
+        self.assertEqual({"scenarios": 2, "outlines": 1, "example_rows": 3, "workflows": []},
+                         self.scan(FRENCH))
+
+
+class CalibrationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.repository = Path(self.folder.name, "features")
+        self.repository.mkdir()
+        Path(self.repository, "planned.feature").write_text(ENGLISH.replace(
+            "    !!Workflow: workflows/first.puml\n", ""), encoding="utf-8")
+        self.cache = Path(self.folder.name, "cache")
+        self.calibration_file = self.cache / CALIBRATION_FILE
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def generate(self, calibrate: bool):
+        report = ExportUtilities()
+        report.feature_repository = str(self.repository)
+        report.cache_folder = str(self.cache)
+        report.force = True
+        report.calibrate = calibrate
+        report.create_application_documentation(
+            output_file_name=str(Path(self.folder.name, "document.docx")))
+
+    def test_not_recorded_by_default(self):
+        self.generate(False)
+        self.assertFalse(self.calibration_file.exists())
+
+    def test_recorded_when_asked(self):
+        self.generate(True)
+        with open(self.calibration_file, encoding="utf-8") as calibration:
+            content = json.load(calibration)
+        self.assertEqual(1, content["runs"])
+        self.assertIn("feature_per_scenario", content["costs"])
+        # Written through a temporary file replacing it
+        self.assertEqual([CALIBRATION_FILE],
+                         [path.name for path in self.cache.iterdir() if "timings" in path.name])
+
+    def test_save_and_estimate(self):
+        calibration = Calibration(self.calibration_file)
+        self.assertEqual(0, calibration.runs)
+        calibration.update({"feature_per_scenario": 1.0})
+        calibration.update({"feature_per_scenario": 2.0})
+        calibration.save()
+        reloaded = Calibration(self.calibration_file)
+        self.assertEqual(2, reloaded.runs)
+        self.assertAlmostEqual(1.3, reloaded.costs["feature_per_scenario"])
+
+    def test_corrupted_file(self):
+        self.cache.mkdir()
+        self.calibration_file.write_text("{not json", encoding="utf-8")
+        calibration = Calibration(self.calibration_file)
+        self.assertEqual(0, calibration.runs)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,254 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+"""
+PlantUML daemon, start lock and supervisor tests, against a fake picoweb server.
+
+    python -m pytest test/test_plantuml.py
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from featurereporter import plantuml  # noqa: E402
+from featurereporter.plantuml import PlantUmlDaemon, PlantUmlDaemonRenderer  # noqa: E402
+
+PNG = b"\x89PNG\r\n\x1a\nfake"
+DIAGRAM = "@startuml\nAlice -> Bob\n@enduml\n"
+
+
+class FakePicoweb(ThreadingHTTPServer):
+    """Answer the picoweb png requests, after delay seconds, with status"""
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, delay: float = 0, status: int = 200):
+        super().__init__(("127.0.0.1", port), FakePicowebHandler)
+        self.delay = delay
+        self.status = status
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+
+
+class FakePicowebHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        status, body = 200, b"picoweb"
+        if self.path.startswith("/plantuml/png/"):
+            time.sleep(self.server.delay)
+            status, body = self.server.status, PNG
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class DaemonTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.state_folder = Path(self.folder.name, "state")
+        self.state_folder.mkdir()
+        self.lock_file = self.state_folder / "plantuml_daemon.lock"
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+        self.folder.cleanup()
+
+    def serve(self, port: int = 0, **options) -> FakePicoweb:
+        server = FakePicoweb(port, **options)
+        self.servers.append(server)
+        return server
+
+    def publish(self, port: int):
+        """Write the state file as the supervisor does"""
+        with open(self.state_folder / "plantuml_daemon.json", "w", encoding="utf-8") as state:
+            json.dump({"port": port}, state)
+
+    def daemon(self, start_timeout: int = 5) -> PlantUmlDaemon:
+        daemon = PlantUmlDaemon(state_folder=self.state_folder, start_timeout=start_timeout)
+        self.addCleanup(daemon.close)
+        return daemon
+
+
+class PlantUmlDaemonTest(DaemonTestCase):
+
+    def test_reuse_running_server(self):
+        server = self.serve()
+        self.publish(server.port)
+        daemon = self.daemon()
+        with mock.patch.object(plantuml.subprocess, "Popen") as popen:
+            self.assertEqual(PNG, daemon.render(DIAGRAM))
+            self.assertEqual(PNG, daemon.render(DIAGRAM))
+        popen.assert_not_called()
+        self.assertTrue(daemon.last_use_file.is_file())
+
+    def test_request_timeout(self):
+        server = self.serve(delay=1)
+        self.publish(server.port)
+        with self.assertRaises(TimeoutError):
+            self.daemon().render(DIAGRAM, timeout=0.2)
+
+    def test_error_status(self):
+        server = self.serve(status=500)
+        self.publish(server.port)
+        with self.assertRaises(RuntimeError):
+            self.daemon().render(DIAGRAM)
+
+
+class StartLockTest(DaemonTestCase):
+
+    def spawn(self, command: list, **options):
+        """Stand for the supervisor: serve on the given port"""
+        self.serve(int(command[command.index("--port") + 1]))
+        return mock.Mock()
+
+    def test_start(self):
+        with mock.patch.object(plantuml.subprocess, "Popen", side_effect=self.spawn) as popen:
+            port = self.daemon().ensure_running()
+        popen.assert_called_once()
+        self.assertEqual(port, self.servers[0].port)
+        self.assertFalse(self.lock_file.exists())
+
+    def test_wait_for_other_run(self):
+        # Another run holds the lock and publishes its server a bit later
+        self.lock_file.touch()
+        server = self.serve()
+        publisher = threading.Timer(0.5, self.publish, (server.port,))
+        publisher.start()
+        self.addCleanup(publisher.cancel)
+        with mock.patch.object(plantuml.subprocess, "Popen") as popen:
+            self.assertEqual(server.port, self.daemon().ensure_running())
+        popen.assert_not_called()
+        self.assertTrue(self.lock_file.exists())
+
+    def test_locked_too_long(self):
+        self.lock_file.touch()
+        with mock.patch.object(plantuml.subprocess, "Popen") as popen:
+            with self.assertRaises(TimeoutError):
+                self.daemon(start_timeout=1).ensure_running()
+        popen.assert_not_called()
+
+    def test_stale_lock(self):
+        self.lock_file.touch()
+        os.utime(self.lock_file, (0, 0))
+        with mock.patch.object(plantuml.subprocess, "Popen", side_effect=self.spawn):
+            port = self.daemon().ensure_running()
+        self.assertEqual(port, self.servers[0].port)
+        self.assertFalse(self.lock_file.exists())
+
+    def test_lock_removed_meanwhile(self):
+        def spawn_and_unlock(command: list, **options):
+            # Another run found the lock stale and removed it
+            self.lock_file.unlink()
+            return self.spawn(command, **options)
+
+        with mock.patch.object(plantuml.subprocess, "Popen", side_effect=spawn_and_unlock):
+            port = self.daemon().ensure_running()
+        self.assertEqual(port, self.servers[0].port)
+
+
+class PlantUmlDaemonRendererTest(DaemonTestCase):
+
+    def renderer(self, daemon: PlantUmlDaemon) -> PlantUmlDaemonRenderer:
+        return PlantUmlDaemonRenderer(cache_folder=Path(self.folder.name, "diagrams"),
+                                      daemon=daemon)
+
+    @staticmethod
+    def command_line(command: list, **options):
+        """Stand for the PlantUML command line"""
+        with open(Path(command[command.index("-o") + 1], "inline.png"), "wb") as png:
+            png.write(b"command line")
+
+    def test_daemon(self):
+        server = self.serve()
+        self.publish(server.port)
+        picture, rendered = self.renderer(self.daemon()).render_text(DIAGRAM)
+        self.assertTrue(rendered)
+        self.assertEqual(PNG, picture.read_bytes())
+
+    def test_timeout_not_retried(self):
+        server = self.serve(delay=1)
+        self.publish(server.port)
+        with mock.patch.object(plantuml.subprocess, "run") as run:
+            with self.assertRaises(TimeoutError):
+                self.renderer(self.daemon()).render_text(DIAGRAM, timeout=0.2)
+        run.assert_not_called()
+
+    def test_start_failure_falls_back(self):
+        # The start lock is held by another run which never publishes a server
+        self.lock_file.touch()
+        with mock.patch.object(plantuml.subprocess, "run", side_effect=self.command_line):
+            picture, _ = self.renderer(self.daemon(start_timeout=1)).render_text(DIAGRAM)
+        self.assertEqual(b"command line", picture.read_bytes())
+
+    def test_error_falls_back(self):
+        server = self.serve(status=500)
+        self.publish(server.port)
+        with mock.patch.object(plantuml.subprocess, "run", side_effect=self.command_line):
+            picture, _ = self.renderer(self.daemon()).render_text(DIAGRAM)
+        self.assertEqual(b"command line", picture.read_bytes())
+
+
+class SupervisorTest(DaemonTestCase):
+
+    def test_stop_when_idle(self):
+        server = mock.Mock(pid=1234)
+        server.poll.return_value = None
+        daemon = self.daemon()
+        daemon.last_use_file.touch()
+        os.utime(daemon.last_use_file, (0, 0))
+        arguments = ["plantuml", "--port", "8123", "--state-folder", str(self.state_folder),
+                     "--idle-timeout", "1"]
+        with mock.patch.object(sys, "argv", arguments), \
+                mock.patch.object(plantuml.subprocess, "Popen", return_value=server) as popen, \
+                mock.patch.object(plantuml.time, "sleep"):
+            plantuml.main()
+        self.assertIn("-picoweb:8123:127.0.0.1", popen.call_args[0][0])
+        server.terminate.assert_called_once()
+        # The state file is removed with the server
+        self.assertFalse(daemon.state_file.exists())
+
+    def test_keep_newer_state(self):
+        server = mock.Mock(pid=1234)
+        server.poll.return_value = None
+        daemon = self.daemon()
+
+        def sleep(seconds: float):
+            # A newer supervisor took over and the server is idle
+            with open(daemon.state_file, "w", encoding="utf-8") as state:
+                json.dump({"port": 8124, "supervisor": -1}, state)
+
+        arguments = ["plantuml", "--port", "8123", "--state-folder", str(self.state_folder),
+                     "--idle-timeout", "1"]
+        with mock.patch.object(sys, "argv", arguments), \
+                mock.patch.object(plantuml.subprocess, "Popen", return_value=server), \
+                mock.patch.object(plantuml.time, "sleep", side_effect=sleep):
+            plantuml.main()
+        with open(daemon.state_file, encoding="utf-8") as state:
+            self.assertEqual(8124, json.load(state)["port"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+"""
+GenerationServer tests, on an ephemeral port.
+
+    python -m pytest test/test_server.py
+"""
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from featurereporter.server import DOCX_MIME_TYPE, REJECTED_KEYS, GenerationServer  # noqa: E402
+
+# No workflow: the generation does not need java
+FEATURE = """Feature: Server feature
+  The feature generated through the server
+
+  Scenario: Generate a document
+    Given a job
+    When it is posted
+    Then the document is returned
+"""
+
+
+class GenerationServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.repository = tempfile.TemporaryDirectory()
+        Path(self.repository.name, "server.feature").write_text(FEATURE, encoding="utf-8")
+        self.server = GenerationServer(("127.0.0.1", 0), workers=1, queue_size=0)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.repository.cleanup()
+
+    def request(self, method: str, path: str, job=None, content_type="application/json"):
+        """Return the response status, content type and body"""
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.server_address[1],
+                                                timeout=60)
+        try:
+            body = None if job is None else json.dumps(job).encode("utf-8")
+            connection.request(method, path, body, {"Content-Type": content_type})
+            response = connection.getresponse()
+            return response.status, response.getheader("Content-Type"), response.read()
+        finally:
+            connection.close()
+
+    def test_health(self):
+        status, content_type, body = self.request("GET", "/health")
+        self.assertEqual(200, status)
+        self.assertEqual("application/json", content_type)
+        self.assertEqual({"running": 0, "pending": 0}, json.loads(body))
+
+    def test_job_returns_docx(self):
+        status, content_type, body = self.request("POST", "/jobs",
+                                                  {"repository": self.repository.name})
+        self.assertEqual(200, status, body)
+        self.assertEqual(DOCX_MIME_TYPE, content_type)
+        # A docx is a zip archive
+        self.assertTrue(body.startswith(b"PK"))
+        self.assertEqual({"running": 0, "pending": 0}, self.server.status)
+
+    def test_bad_job(self):
+        for job in ({}, {"repository": self.repository.name, "unknown": 1}, ["not", "a", "job"]):
+            with self.subTest(job=job):
+                status, content_type, body = self.request("POST", "/jobs", job)
+                self.assertEqual(400, status)
+                self.assertIn("error", json.loads(body))
+
+    def test_json_only(self):
+        for content_type in ("text/plain", "application/x-www-form-urlencoded"):
+            with self.subTest(content_type=content_type):
+                status, _, body = self.request("POST", "/jobs",
+                                               {"repository": self.repository.name},
+                                               content_type)
+                self.assertEqual(415, status)
+                self.assertIn("error", json.loads(body))
+        # Parameters of the media type are allowed
+        status, _, _ = self.request("POST", "/jobs", {"repository": self.repository.name},
+                                    "application/json; charset=utf-8")
+        self.assertEqual(200, status)
+
+    def test_rejected_keys(self):
+        path = str(Path(self.repository.name, "written"))
+        for key, value in (("traceability_csv", path), ("history", path), ("force", True),
+                           ("forewords", self.repository.name), ("execution", path),
+                           ("max_table_rows", 10)):
+            with self.subTest(key=key):
+                self.assertIn(key, REJECTED_KEYS)
+                status, _, body = self.request("POST", "/jobs",
+                                               {"repository": self.repository.name,
+                                                key: value})
+                self.assertEqual(400, status)
+                self.assertIn(key, json.loads(body)["error"])
+        self.assertFalse(Path(path).exists())
+
+    def test_output_is_ignored(self):
+        output = Path(self.repository.name, "output.docx")
+        status, content_type, _ = self.request("POST", "/jobs",
+                                               {"repository": self.repository.name,
+                                                "output": str(output)})
+        self.assertEqual(200, status)
+        self.assertEqual(DOCX_MIME_TYPE, content_type)
+        self.assertFalse(output.exists())
+
+    def test_full_queue(self):
+        # The only place (one worker, no queue) is taken
+        self.assertTrue(self.server.admit())
+        status, content_type, body = self.request("POST", "/jobs",
+                                                  {"repository": self.repository.name})
+        self.assertEqual(503, status)
+        self.assertEqual({"error": "The job queue is full"}, json.loads(body))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+# -*- Product under GNU GPL v3 -*-
+# -*- Author: E.Aivayan -*-
+"""
+Tag expression and tag index tests.
+
+    python -m pytest test/test_tagindex.py
+"""
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from featurereporter.tagindex import TagExpression, TagIndex, scan_tags  # noqa: E402
+
+ENGLISH = """@release-1
+Feature: Tagged feature
+
+  @wip
+  Scenario: Work in progress
+    Given a step
+
+  @release-2 @smoke
+  Scenario Outline: Released
+    Given a <value>
+
+    @examples-tag
+    Examples: Values
+      | value |
+      | 1     |
+"""
+
+FRENCH = """# language: fr
+@release-1
+Fonctionnalité: Fonctionnalité étiquetée
+
+  @wip
+  Scénario: En cours
+    Soit une étape
+
+  @release-2
+  Plan du scénario: Livré
+    Soit une <valeur>
+
+    Exemples:
+      | valeur |
+      | 1      |
+"""
+
+UNKNOWN = """# language: xx-unknown
+@release-1
+Whatever: Unknown keywords
+"""
+
+
+class TagExpressionTest(unittest.TestCase):
+
+    def test_empty(self):
+        for expressions in (None, [], [""], [" , "]):
+            with self.subTest(expressions=expressions):
+                expression = TagExpression(expressions)
+                self.assertFalse(expression)
+                self.assertTrue(expression.check([]))
+
+    def test_or(self):
+        expression = TagExpression(["@a,b"])
+        self.assertTrue(expression.check(["a"]))
+        self.assertTrue(expression.check(["@b"]))
+        self.assertFalse(expression.check(["c"]))
+
+    def test_and_not(self):
+        expression = TagExpression(["@a", "~@wip", "-@slow"])
+        self.assertTrue(expression.check(["a"]))
+        self.assertFalse(expression.check(["a", "wip"]))
+        self.assertFalse(expression.check(["a", "slow"]))
+        self.assertFalse(expression.check(["b"]))
+        self.assertEqual("@a and ~@wip and ~@slow", str(expression))
+
+    def test_v2_rejected(self):
+        for expressions in (["@a and not @b"], ["@a or @b"], ["not @a"], ["(@a,@b)"]):
+            with self.subTest(expressions=expressions):
+                with self.assertRaises(ValueError):
+                    TagExpression(expressions)
+
+
+class ScanTagsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def write(self, name: str, content: str) -> Path:
+        path = Path(self.folder.name, name)
+        path.write_text(content, encoding="utf-8")
+        return path
+
+    def test_english(self):
+        tags = scan_tags(self.write("english.feature", ENGLISH))
+        self.assertEqual({"language": "en", "feature": ["release-1"],
+                          "scenarios": [["wip"], ["release-2", "smoke"]]}, tags)
+
+    def test_declared_language(self):
+        tags = scan_tags(self.write("french.feature", FRENCH))
+        self.assertEqual({"language": "fr", "feature": ["release-1"],
+                          "scenarios": [["wip"], ["release-2"]]}, tags)
+
+    def test_unknown_language(self):
+        tags = scan_tags(self.write("unknown.feature", UNKNOWN))
+        self.assertIsNone(tags["scenarios"])
+
+    def test_may_match(self):
+        index = TagIndex(Path(self.folder.name, "index.json"))
+        for name, content in (("english.feature", ENGLISH), ("french.feature", FRENCH)):
+            path = self.write(name, content)
+            with self.subTest(name=name):
+                self.assertTrue(index.may_match(path, TagExpression(["@release-2"])))
+                self.assertTrue(index.may_match(path, TagExpression(["@release-1", "~@wip"])))
+                self.assertFalse(index.may_match(path, TagExpression(["@release-3"])))
+                self.assertFalse(index.may_match(path, TagExpression(["@wip", "@release-2"])))
+        unknown = self.write("unknown.feature", UNKNOWN)
+        self.assertTrue(index.may_match(unknown, TagExpression(["@release-3"])))
+
+    def test_index_refresh(self):
+        index_file = Path(self.folder.name, "index.json")
+        path = self.write("english.feature", ENGLISH)
+        index = TagIndex(index_file)
+        self.assertFalse(index.may_match(path, TagExpression(["@release-3"])))
+        index.save()
+        self.assertTrue(index_file.is_file())
+        # A changed file is scanned again, even through a reloaded index
+        path.write_text(ENGLISH.replace("@release-2", "@release-3"), encoding="utf-8")
+        os.utime(path, ns=(0, 0))
+        self.assertTrue(TagIndex(index_file).may_match(path, TagExpression(["@release-3"])))
+
+
+if __name__ == "__main__":
+    unittest.main()